@@ -16,6 +16,8 @@ import re
 import sys
 from typing import Dict, List
 
+from sft_store import load_sft
+
 
 # ── 第一层：名字/地点/敏感词替换 ──────────────────────────────────
 
@@ -234,8 +236,7 @@ def main():
         print(f"找不到输入文件: {args.input}", file=sys.stderr)
         sys.exit(1)
 
-    with open(args.input, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_sft(args.input)
     print(f"[加载] {len(data)} 条原始数据")
 
     # 2. 脱敏
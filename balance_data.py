@@ -8,6 +8,8 @@ import json
 import re
 from collections import Counter
 
+from sft_store import load_sft
+
 INPUT = "./training_data/sft-joker-safe.json"
 OUTPUT = "./training_data/sft-joker-clean.json"
 
@@ -29,8 +31,7 @@ def fix_anonymization(conv: dict) -> bool:
 
 
 def main():
-    with open(INPUT, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_sft(INPUT)
     print(f"原始数据: {len(data)} 条")
 
     dist = Counter(c.get("style", "unknown") for c in data)
@@ -0,0 +1,62 @@
+"""
+在一个事件循环上并发跑大量 areply()，看总耗时和线程数。
+
+用法：
+  python benchmarks/bench_areply.py                    # 2000 个会话，stub 延迟 200ms
+  python benchmarks/bench_areply.py --users 5000 --latency 0.5
+
+同时在途的 areply() 不超过 --concurrency（默认等于连接池上限 LLM_POOL_MAX_CONNECTIONS），
+和线上 reply_workers 限制并发一样：几千个请求一起排在 httpx 连接池里，池子每分配一个连接
+都要把排队的请求扫一遍，排队越长越慢，还会等到 PoolTimeout。
+stub 的单次延迟固定，理想情况下总耗时 ≈ 延迟 × (用户数 / 并发)。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from llm_client import POOL_MAX_CONNECTIONS, aclose_all
+from stub_llm_server import StubLLMServer
+
+
+async def run(bot: QingqingBot, users: int, concurrency: int) -> float:
+    t0 = time.perf_counter()
+    peak_threads = threading.active_count()
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        nonlocal peak_threads
+        async with slots:
+            await bot.areply("在干嘛", user_id=f"u{i}")
+        peak_threads = max(peak_threads, threading.active_count())
+
+    await asyncio.gather(*(one(i) for i in range(users)))
+    elapsed = time.perf_counter() - t0
+    await aclose_all()
+    print(f"{users} 个会话完成（并发 {concurrency}），用时 {elapsed:.2f}s，"
+          f"本进程峰值线程数 {peak_threads}（含 stub 服务线程）")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="areply 并发基准")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=POOL_MAX_CONNECTIONS)
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=args.latency) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+        bot = QingqingBot(config_path=os.path.join(ROOT, "config", "styles.json"))
+        asyncio.run(run(bot, args.users, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+generate_joker 批量生成：一次请求生成 N 段对话 vs 每段一次请求，对着本地 stub 比 token/条 和 条/分钟。
+
+  1. 单条（--batch-size 1）和批量（--batch-size N）各生成 --count 条，
+     stub 每次请求固定 --latency 秒 + 每行回复 --line-latency 秒（回复越长越慢）
+  2. 批量回复里有一段格式不对：只重试这一段，其他段原样保留，最终条数和顺序都对
+  3. 批量回复整个不是 JSON：整批重试，重试次数用完后这批记 SKIP
+
+用法：
+  python benchmarks/bench_batch_generation.py
+  python benchmarks/bench_batch_generation.py --count 100 --batch-size 8
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from bench_generate_joker import run
+from stub_llm_server import StubLLMServer
+
+CONVERSATION = [
+    {"from": "human", "value": "在吗"},
+    {"from": "gpt", "value": "在\n咋了"},
+    {"from": "human", "value": "今天好累啊"},
+    {"from": "gpt", "value": "咋了\n又加班？"},
+    {"from": "human", "value": "对啊 老板又抽风"},
+    {"from": "gpt", "value": "笑死\n摸鱼吧"},
+]
+
+_SCENARIO_LINE = re.compile(r"^(\d+)\. (.+)$", re.M)
+
+
+class Responder:
+    """
+    按 prompt 拼回复：单条模板回一段对话，批量模板按【场景列表】里的编号回一个数组。
+    场景里带 bad 子串、且这个场景第一次出现时，对应的那段故意写坏（缺 value）；
+    broken=True 时整个回复不是 JSON。同一个请求体的回复固定（stub 会为一个请求调用多次）
+    """
+
+    def __init__(self, bad: str = "", broken: bool = False):
+        self.bad = bad
+        self.broken = broken
+        self.seen = set()
+        self.replies = {}
+        self.batch_items = []
+        self._lock = threading.Lock()
+
+    def __call__(self, req: dict) -> str:
+        prompt = req["messages"][-1]["content"]
+        with self._lock:
+            if prompt not in self.replies:
+                self.replies[prompt] = self._build(prompt)
+            return self.replies[prompt]
+
+    def _build(self, prompt: str) -> str:
+        if self.broken:
+            return "抱歉，我无法生成"
+        if "【场景列表】" not in prompt:
+            return json.dumps(CONVERSATION, ensure_ascii=False, indent=1)
+        section = prompt.split("【场景列表】", 1)[1].split("【生成要求】", 1)[0]
+        items = []
+        for idx, scenario in _SCENARIO_LINE.findall(section):
+            conv = CONVERSATION
+            if self.bad and self.bad in scenario and scenario not in self.seen:
+                conv = [{"from": "human", "value": "在吗"}, {"from": "gpt"}]
+            self.seen.add(scenario)
+            items.append({"id": int(idx), "conversation": conv})
+        self.batch_items.append(len(items))
+        return json.dumps(items, ensure_ascii=False, indent=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate_joker 批量生成基准")
+    parser.add_argument("--count", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--line-latency", type=float, default=0.005)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+    n = args.batch_size
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "synthetic.json")
+
+        print(f"1. 单条 vs 批量（{args.count} 条，并发 {args.concurrency}，"
+              f"stub 每次请求 {args.latency}s + 每行 {args.line_latency}s）")
+        outputs = {}
+        for size in (1, n):
+            responder = Responder()
+            with StubLLMServer(latency=args.latency, line_latency=args.line_latency, responder=responder) as stub:
+                os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+                results, wall, log = run(output, args.count, args.concurrency, "--batch-size", str(size))
+                usage = re.search(r"(\d+) token/条", log)
+                print(f"  每次 {size} 段: {wall:6.2f}s | {len(results) / wall * 60:7.1f} 条/分钟 | "
+                      f"{usage.group(1)} token/条 | 请求 {stub.stats()['requests']}")
+            outputs[size] = results
+        same = [r["source"] for r in outputs[1]] == [r["source"] for r in outputs[n]]
+        print(f"  两种模式的条数和场景顺序一致 {same}")
+        assert same and len(outputs[n]) == args.count
+
+        print(f"\n2. 批量回复里一段格式不对（每次 {n} 段）")
+        first_scenario = outputs[1][0]["source"][len("synthetic_daily_"):]
+        responder = Responder(bad=first_scenario)
+        with StubLLMServer(latency=args.latency, responder=responder) as stub:
+            os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+            results, _, log = run(output, n, 1, "--batch-size", str(n))
+            print(f"  请求 {stub.stats()['requests']} 次，每次的段数 {responder.batch_items} | "
+                  f"{log.count('[批量]')} 次部分重试")
+        ok = [r["source"] for r in results] == [r["source"] for r in outputs[1][:n]]
+        print(f"  最终 {len(results)} 条，顺序和单条模式一致 {ok}")
+        assert responder.batch_items == [n, 1] and ok
+
+        print("\n3. 批量回复整个不是 JSON")
+        responder = Responder(broken=True)
+        with StubLLMServer(latency=0.0, responder=responder) as stub:
+            os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+            results, _, log = run(output, n, 1, "--batch-size", str(n))
+            print(f"  请求 {stub.stats()['requests']} 次（每批 1 次 + 重试 2 次），生成 {len(results)} 条，"
+                  f"SKIP {log.count('SKIP')} 次")
+        assert stub.stats()["requests"] % 3 == 0 and not results
+
+
+if __name__ == "__main__":
+    main()
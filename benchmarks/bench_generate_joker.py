@@ -0,0 +1,107 @@
+"""
+generate_joker 并发生成引擎：对着本地 stub 跑，验证吞吐、限流、顺序、续传和连续失败退出。
+
+  1. 吞吐：--count 条，stub 每次请求 --latency 秒，并发 1 / 8 / 16 各跑一遍
+  2. 顺序：并发 16 的输出和并发 1 的逐条一致（同一个 --seed）
+  3. 限流：--rpm 60 时实际请求速率不超过限额（桶里最多攒 5 秒的配额）
+  4. 续传：先生成一半，再用同一个输出文件跑到 --count，接着原来的场景位置继续
+  5. 连续失败：stub 一直回 400，连续 10 次失败后保存退出
+
+用法：
+  python benchmarks/bench_generate_joker.py
+  python benchmarks/bench_generate_joker.py --count 100 --latency 1.0
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import generate_joker
+from stub_llm_server import StubLLMServer
+
+CONVERSATION = [
+    {"from": "human", "value": "在吗"},
+    {"from": "gpt", "value": "在\n咋了"},
+]
+
+
+def run(output: str, count: int, concurrency: int, *extra: str, fresh: bool = True):
+    """跑一次 generate_joker.main()，返回 (结果, 耗时, 输出日志)"""
+    if fresh:
+        for path in (output, os.path.splitext(output)[0] + ".jsonl"):
+            if os.path.exists(path):
+                os.remove(path)
+    sys.argv = [
+        "generate_joker.py", "--count", str(count), "--output", output,
+        "--concurrency", str(concurrency), "--seed", "7", *extra,
+    ]
+    log = io.StringIO()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        generate_joker.main()
+    wall = time.perf_counter() - t0
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f), wall, log.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="generate_joker 并发生成基准")
+    parser.add_argument("--count", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+    reply = json.dumps(CONVERSATION, ensure_ascii=False)
+    with tempfile.TemporaryDirectory() as tmp, StubLLMServer(reply=reply, latency=args.latency) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        output = os.path.join(tmp, "synthetic.json")
+
+        print(f"1. 吞吐（{args.count} 条，stub 每次请求 {args.latency}s）")
+        outputs = {}
+        for concurrency in (1, 8, 16):
+            stub.reset_stats()
+            results, wall, _ = run(output, args.count, concurrency)
+            outputs[concurrency] = results
+            print(f"  并发 {concurrency:>2}: {wall:6.2f}s | {len(results) / wall * 60:7.1f} 条/分钟 | "
+                  f"请求 {stub.stats()['requests']}")
+
+        same = [r["source"] for r in outputs[1]] == [r["source"] for r in outputs[16]]
+        styles = [r["style"] for r in outputs[1]] == [r["style"] for r in outputs[16]]
+        print(f"\n2. 顺序：并发 16 与并发 1 的场景顺序一致 {same}，daily 风格分配一致 {styles}")
+        assert same and styles
+
+        print("\n3. 限流（--rpm 60，并发 16，20 条）")
+        stub.reset_stats()
+        _, wall, log = run(output, 20, 16, "--rpm", "60")
+        rate = stub.stats()["requests"] / wall * 60
+        print(f"  {wall:.1f}s 发了 {stub.stats()['requests']} 个请求，≈ {rate:.0f} RPM（前 5 个是桶里攒的突发）")
+        print("  " + next(line for line in log.splitlines() if line.startswith("[吞吐]")))
+        assert rate <= 60 * 1.5
+
+        print("\n4. 续传")
+        half = args.count // 2
+        first, _, _ = run(output, half, 8)
+        resumed, _, log = run(output, args.count, 8, fresh=False)
+        print(f"  先生成 {len(first)} 条，续传到 {len(resumed)} 条 | {log.splitlines()[0]}")
+        assert resumed[:half] == first and [r["source"] for r in resumed] == [r["source"] for r in outputs[1]]
+
+        print("\n5. 连续失败")
+        stub.inject_fault(status=400, count=-1)
+        stub.reset_stats()
+        _, wall, log = run(output, args.count, 8)
+        stub.clear_faults()
+        skips = log.count("SKIP")
+        print(f"  {skips} 次 SKIP 后退出，共发出 {stub.stats()['requests']} 个请求，{wall:.2f}s")
+        assert skips == 10 and "连续 10 次失败" in log
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+寒暄回复缓存：模拟线上流量，看命中率、省下的延迟和回复多样性。
+
+QingqingBot 接 stub（每次请求 --latency 秒，回复从几条里随机挑），--messages 条消息，
+每条来自不同用户（新开话头）：
+  - --greeting-share 的消息是寒暄（在嘛 / 在吗？/ 晚安~ / 哈哈哈哈 / 早早 …，带写法变体）
+  - 其余是长消息，不走缓存
+分别不开 / 开缓存跑一遍，比较平均延迟和 LLM 请求数；另外验证：
+  - 同一个用户刚说过话（对话进行中）时发「哈哈哈」绕过缓存
+  - 上一条是我们发的问句时绕过缓存
+  - reply_stream / areply_stream 命中时按行吐出缓存的回复，跳过空行（和现拼的流式回复一样）
+
+用法：
+  python benchmarks/bench_greeting_cache.py
+  python benchmarks/bench_greeting_cache.py --messages 1000 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from greeting_cache import GreetingCache, normalize
+from history_backend import MemoryHistoryBackend
+from stub_llm_server import StubLLMServer
+
+# (写法变体, stub 在这组消息上随机挑的回复)
+GREETINGS = [
+    (["在嘛", "在吗", "在吗？", "在嘛~"], ["在呢\n怎么了", "在的", "嗯嗯在\n咋啦"]),
+    (["晚安", "晚安~", "晚安安", "晚安[旺柴]"], ["晚安呀[旺柴]", "晚安\n早点睡", "好梦"]),
+    (["早", "早早", "早！"], ["不早了\n才醒", "早呀"]),
+    (["哈哈哈", "哈哈哈哈哈", "哈哈哈哈哈哈哈"], ["笑什么呀", "哈哈哈哈\n笑死"]),
+    (["困了", "困了。"], ["那就去睡觉觉"]),
+    (["饿了", "饿了饿了"], ["快去吃饭饭", "我也饿了"]),
+    (["无聊", "好无聊"], ["来呀\n聊天"]),
+    (["明天见", "明天见！"], ["明天见！\n拜拜[旺柴]"]),
+]
+LONG = [
+    "你拿平板吗还是我拿，我刚到楼下",
+    "今天那个hr作业你写完了没有啊",
+    "周末要不要一起去看那个新上的电影",
+    "我跟你说今天食堂的菜真的太难吃了",
+    "下午三点那个会你去不去",
+]
+LONG_REPLIES = ["啊这\n我看看", "好嘟\n等我一下"]
+
+
+def traffic(n: int, greeting_share: float, seed: int = 0):
+    rng = random.Random(seed)
+    for i in range(n):
+        if rng.random() < greeting_share:
+            variants, replies = rng.choice(GREETINGS)
+            yield f"u{i}", rng.choice(variants), replies
+        else:
+            yield f"u{i}", rng.choice(LONG), LONG_REPLIES
+
+
+def make_bot(cache):
+    return QingqingBot(
+        config_path=os.path.join(ROOT, "config", "styles.json"),
+        history_backend=MemoryHistoryBackend(), summary_token_threshold=0, greeting_cache=cache,
+    )
+
+
+def run(stub: StubLLMServer, bot: QingqingBot, messages) -> tuple:
+    stub.reset_stats()
+    served = defaultdict(Counter)
+    latencies = []
+    for user_id, text, replies in messages:
+        stub.reply = random.choice(replies)
+        t0 = time.perf_counter()
+        answer = bot.reply(text, user_id=user_id)
+        latencies.append(time.perf_counter() - t0)
+        served[normalize(text)][answer] += 1
+    return sum(latencies) / len(latencies), stub.stats()["requests"], served
+
+
+def main():
+    parser = argparse.ArgumentParser(description="寒暄回复缓存基准")
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--greeting-share", type=float, default=0.6)
+    args = parser.parse_args()
+
+    messages = list(traffic(args.messages, args.greeting_share))
+    with StubLLMServer(latency=args.latency) as stub:
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+
+        base_avg, base_requests, _ = run(stub, make_bot(None), messages)
+        cache = GreetingCache()
+        bot = make_bot(cache)
+        avg, requests, served = run(stub, bot, messages)
+
+        print(f"{args.messages} 条消息，寒暄占 {args.greeting_share:.0%}，stub 延迟 {args.latency}s")
+        print(f"  不开缓存  平均 {base_avg * 1000:6.1f}ms | LLM 请求 {base_requests}")
+        print(f"  开缓存    平均 {avg * 1000:6.1f}ms | LLM 请求 {requests}")
+        print(f"  {cache.stats()}")
+        for key in ("在嘛", "晚安", "哈哈"):
+            print(f"  「{key}」返回过的回复: {dict(served[key])}")
+
+        print("\n绕过")
+        before = cache.stats()["bypassed"]
+        bot.reply("你拿平板吗还是我拿", user_id="chatty")
+        bot.reply("哈哈哈", user_id="chatty")
+        quiet = GreetingCache(idle=0)
+        quiet_bot = make_bot(quiet)
+        stub.reply = "你吃饭了吗"
+        quiet_bot.reply("今天那个hr作业你写完了没有啊", user_id="asked")
+        quiet_bot.reply("在嘛", user_id="asked")
+        after = cache.stats()["bypassed"]
+        print(f"  对话进行中发「哈哈哈」：active {before['active']} → {after['active']}")
+        print(f"  上一条是我们的问句再发「在嘛」：question {quiet.stats()['bypassed']['question']}")
+        assert after["active"] == before["active"] + 1 and quiet.stats()["bypassed"]["question"] == 1
+
+        print("\n流式命中")
+
+        async def stream(user_id: str):
+            return [line async for line in bot.areply_stream("在吗", user_id=user_id)]
+
+        stub.reset_stats()
+        lines = asyncio.run(stream("stream-user"))
+        print(f"  areply_stream(「在吗」) → {lines} | LLM 请求 {stub.stats()['requests']}")
+
+        # reply() 收进缓存的是整段原文，中间可能有空行 / 只有空格的行
+        padded = GreetingCache(refresh=0)
+        padded_bot = make_bot(padded)
+        for _ in range(padded.variants):
+            padded.store(padded_bot._cache_scope(), normalize("在吗"), "在呢\n\n  \n怎么了 ", 0.1)
+
+        async def astream(user_id: str):
+            return [line async for line in padded_bot.areply_stream("在吗", user_id=user_id)]
+
+        sync_lines = list(padded_bot.reply_stream("在吗", user_id="padded-sync"))
+        async_lines = asyncio.run(astream("padded-async"))
+        print(f"  缓存里是「在呢\\n\\n  \\n怎么了 」→ reply_stream {sync_lines} | areply_stream {async_lines}")
+        assert sync_lines == async_lines == ["在呢", "怎么了"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+对冲请求对回复长尾的影响：stub 随机挑 --slow-rate 的请求慢到 --slow-latency 秒。
+
+同一个 stub 上先跑不对冲、再跑对冲（先预热 --warmup 次攒延迟样本），比较
+p50 / p95 / p99 和额外请求占比，最后打印 Hedger 的统计（对冲率、省下的延迟）。
+
+用法：
+  python benchmarks/bench_hedge.py
+  python benchmarks/bench_hedge.py --calls 1000 --slow-rate 0.03 --slow-latency 1.5
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import call_deepseek
+from llm_hedge import get_hedger
+from stub_llm_server import StubLLMServer
+
+MESSAGES = [
+    {"role": "system", "content": "你是晴晴"},
+    {"role": "user", "content": "在干嘛"},
+]
+
+
+def run(stub: StubLLMServer, calls: int, concurrency: int, hedge: bool) -> List[float]:
+    def one(_) -> float:
+        t0 = time.perf_counter()
+        call_deepseek(
+            messages=MESSAGES, model="deepseek-chat", temperature=0.85, max_tokens=100,
+            base_url=stub.base_url, api_key="sk-stub", hedge=hedge,
+        )
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return sorted(pool.map(one, range(calls)))
+
+
+def _pct(samples: List[float], p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对冲请求长尾基准")
+    parser.add_argument("--calls", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--warmup", type=int, default=100)
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency) as stub:
+        print(f"stub 延迟 {args.latency}s，{args.slow_rate:.0%} 的请求慢到 {args.slow_latency}s；"
+              f"{args.calls} 次调用，并发 {args.concurrency}\n")
+        run(stub, args.warmup, args.concurrency, hedge=True)
+        hedger = get_hedger(stub.base_url, "deepseek-chat")
+        hedger.calls = hedger.hedged = hedger.hedge_wins = hedger.budget_denied = 0
+        hedger.saved_seconds = 0.0
+
+        for label, hedge in (("不对冲", False), ("对冲", True)):
+            stub.reset_stats()
+            samples = run(stub, args.calls, args.concurrency, hedge)
+            extra = stub.stats()["requests"] / args.calls - 1
+            print(f"{label:<6} p50 {_pct(samples, 0.5):6.0f}ms | p95 {_pct(samples, 0.95):6.0f}ms | "
+                  f"p99 {_pct(samples, 0.99):6.0f}ms | max {samples[-1] * 1000:6.0f}ms | 额外请求 {extra:.1%}")
+        time.sleep(args.slow_latency)  # 等输掉的请求跑完，省下的延迟才算得出来
+        print(f"\nHedger: {hedger.stats()}")
+
+
+if __name__ == "__main__":
+    main()
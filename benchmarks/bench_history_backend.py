@@ -0,0 +1,108 @@
+"""
+历史后端读写延迟：10 万用户规模下的 SQLite（WAL + 热层）和纯内存对比。
+
+步骤：
+  1. 预填充：N 个用户各写 rounds 轮（批量落盘）
+  2. 重新打开库（模拟重启，热层为空）
+  3. 冷读：随机用户第一次 load（走 user_id 索引）
+  4. 热读：同一批用户再读一次（只走内存）
+  5. 追加：随机用户 append 一轮（只进热层 + 待写队列），最后统计 flush 耗时
+
+用法：
+  python benchmarks/bench_history_backend.py
+  python benchmarks/bench_history_backend.py --users 100000 --rounds 8 --samples 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from history_backend import MemoryHistoryBackend, SQLiteHistoryBackend
+from session_store import Turn, history_store
+
+
+def _turns(i: int, r: int):
+    return (Turn("user", f"第{r}轮 在干嘛呀 {i}"), Turn("assistant", "刚吃完饭\n好撑哈哈哈哈哈"))
+
+
+def _timed(fn: Callable[[], object], n: int) -> List[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+
+def _report(label: str, us: List[float]) -> None:
+    us = sorted(us)
+    p99 = us[int(len(us) * 0.99) - 1]
+    print(f"  {label:<10} p50 {statistics.median(us):8.1f}µs | p99 {p99:8.1f}µs | max {us[-1]:9.1f}µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史后端 10 万用户读写延迟")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=8, help="每个用户预填充几轮")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--hot-size", type=int, default=10000, help="热层最多保留多少用户")
+    args = parser.parse_args()
+    keep = args.rounds * 2
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.db")
+
+        # 1. 预填充
+        t0 = time.perf_counter()
+        backend = SQLiteHistoryBackend(path, hot=history_store(max_sessions=args.hot_size), batch_size=50000)
+        for r in range(args.rounds):
+            for i in range(args.users):
+                backend.append(f"user_{i}", _turns(i, r), keep)
+        backend.close()
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"预填充 {args.users} 用户 × {args.rounds} 轮：{time.perf_counter() - t0:.1f}s，库 {size_mb:.0f}MB")
+
+        # 2. 重启
+        backend = SQLiteHistoryBackend(path, hot=history_store(max_sessions=args.hot_size))
+        picked = [f"user_{rng.randrange(args.users)}" for _ in range(args.samples)]
+        # 冷读之后仍在热层里的：最近读过的那一批
+        hot_users = picked[-min(args.samples, args.hot_size // 2):]
+
+        print(f"\nSQLite（热层 {args.hot_size} 用户）")
+        it = iter(picked)
+        _report("冷读", _timed(lambda: backend.load(next(it), keep), args.samples))
+        it = iter(hot_users * (args.samples // len(hot_users) + 1))
+        _report("热读", _timed(lambda: backend.load(next(it), keep), args.samples))
+        it = iter(hot_users * (args.samples // len(hot_users) + 1))
+        _report("追加(热)", _timed(lambda: backend.append(next(it), _turns(0, 99), keep), args.samples))
+        t0 = time.perf_counter()
+        backend.flush()
+        print(f"  flush 剩余待写：{(time.perf_counter() - t0) * 1000:.1f}ms | {backend.stats()}")
+        backend.close()
+
+        # 重启后数据还在
+        backend = SQLiteHistoryBackend(path)
+        restored = backend.load(hot_users[0], keep)
+        print(f"  重启后 {hot_users[0]} 的历史 {len(restored)} 条，最后一条: {restored[-1].content!r}")
+        backend.close()
+
+    memory = MemoryHistoryBackend(history_store(max_sessions=args.users))
+    for i in range(args.users):
+        memory.append(f"user_{i}", _turns(i, 0), keep)
+    print("\n内存")
+    it = iter(picked)
+    _report("读", _timed(lambda: memory.load(next(it), keep), args.samples))
+    it = iter(picked)
+    _report("追加", _timed(lambda: memory.append(next(it), _turns(0, 99), keep), args.samples))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+generate_joker 回复解析：旧做法（去掉 ``` 后整段 json.loads）vs 容错抽取（json_extract），
+看多少次调用能救回来、救回来的对话是否可用、解析本身的开销。
+
+语料按 DeepSeek 实际会出的几种回复拼（每种 --per-kind 条，对话轮数随机）：
+  clean      正常的 ```json 数组
+  bare       没有 ``` 包裹
+  prose      数组前后多了一句说明（「好的，以下是对话：」/「希望对你有帮助」）
+  truncated  到 max_tokens 被截断（在随机位置截断）
+  bad_turn   中间某条消息缺 value / from 写错
+  trailing   最后多了个逗号
+  garbage    完全不是 JSON（两边都应该判失败）
+
+用法：
+  python benchmarks/bench_json_extract.py
+  python benchmarks/bench_json_extract.py --per-kind 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_joker import parse_conversation
+
+LINES = ["在吗", "咋了", "今天好累啊", "又加班？", "笑死\n摸鱼吧", "你说的\"那个\"是啥", "[狗头]", "哈哈哈哈"]
+
+
+def conversation(rng: random.Random) -> list:
+    turns = []
+    for i in range(rng.randint(2, 12)):
+        turns.append({"from": "human" if i % 2 == 0 else "gpt", "value": rng.choice(LINES)})
+    if turns[-1]["from"] == "human":
+        turns.pop()
+    return turns
+
+
+def render(turns: list) -> str:
+    return json.dumps(turns, ensure_ascii=False, indent=2)
+
+
+def make_corpus(per_kind: int, seed: int):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(per_kind):
+        conv = conversation(rng)
+        text = render(conv)
+        corpus.append(("clean", f"```json\n{text}\n```"))
+        corpus.append(("bare", text))
+        corpus.append(("prose", f"好的，以下是对话：\n```json\n{text}\n```\n希望对你有帮助！"))
+        corpus.append(("truncated", f"```json\n{text}"[:rng.randint(len(text) // 3, len(text) - 2)]))
+        broken = [dict(t) for t in conv] + [{"from": "human", "value": "还在吗"}, {"from": "gpt", "value": "在"}]
+        broken[rng.randrange(2, len(broken))].pop("value")
+        corpus.append(("bad_turn", render(broken)))
+        corpus.append(("trailing", text[:-1].rstrip() + ",\n]"))
+        corpus.append(("garbage", "抱歉，这个场景我无法生成对话。"))
+    return corpus
+
+
+def old_parse(raw: str) -> list:
+    """改之前 generate_one 的解析"""
+    raw = raw.strip()
+    if raw.startswith("```"):
+        lines = raw.split("\n")
+        lines = [l for l in lines if not l.strip().startswith("```")]
+        raw = "\n".join(lines)
+    try:
+        conv = json.loads(raw)
+    except ValueError:
+        return []
+    return conv if isinstance(conv, list) and len(conv) >= 2 else []
+
+
+def usable(conv: list) -> bool:
+    """能直接进训练集：一问一答交替出现、都有内容、以 gpt 结尾"""
+    return (
+        len(conv) >= 2 and conv[-1]["from"] == "gpt"
+        and all(isinstance(t, dict) and isinstance(t.get("value"), str) and t["value"] and
+                t.get("from") in ("human", "gpt") for t in conv)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 回复 JSON 抽取基准")
+    parser.add_argument("--per-kind", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.per_kind, args.seed)
+    kinds = list(dict.fromkeys(kind for kind, _ in corpus))
+    stats = {kind: [0, 0, 0, 0] for kind in kinds}   # 旧：拿到 / 可用；新：拿到 / 可用
+
+    timings = {}
+    for name, parse in (("旧", old_parse), ("新", lambda raw: parse_conversation(raw)[0])):
+        col = 0 if name == "旧" else 2
+        t0 = time.perf_counter()
+        for kind, raw in corpus:
+            conv = parse(raw)
+            if conv:
+                stats[kind][col] += 1
+                stats[kind][col + 1] += usable(conv)
+        timings[name] = time.perf_counter() - t0
+
+    print(f"{'类型':<10} {'旧 解析成功':>10} {'旧 可用':>8} {'新 解析成功':>10} {'新 可用':>8}")
+    for kind in kinds:
+        a, b, c, d = stats[kind]
+        print(f"{kind:<10} {a:>12} {b:>10} {c:>12} {d:>10}")
+
+    total = len(corpus) - args.per_kind   # garbage 本来就救不回来
+    old_ok = sum(s[1] for k, s in stats.items() if k != "garbage")
+    new_ok = sum(s[3] for k, s in stats.items() if k != "garbage")
+    print(f"\n可救回的 {total} 次调用里，没拿到可用对话（SKIP 或存进了坏数据）："
+          f"旧做法 {total - old_ok} 次（{(total - old_ok) / total:.0%}），"
+          f"新做法 {total - new_ok} 次（{(total - new_ok) / total:.0%}）")
+    per_call = {name: t / len(corpus) * 1e6 for name, t in timings.items()}
+    print(f"解析耗时：旧 {per_call['旧']:.1f}µs/条，新 {per_call['新']:.1f}µs/条")
+    assert stats["garbage"][2] == 0
+    assert all(s[2] == s[3] for s in stats.values()), "新做法返回的对话都应该能直接用"
+    assert new_ok > old_ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+JSONL 检查点 vs 每 10 条全量重写 JSON：检查点总开销、崩溃恢复、整理 / 追加的正确性。
+
+  1. 检查点开销：生成 N 条（每条一段带 system prompt 的对话，约 2KB），
+     旧做法每 10 条 json.dump(全部结果, indent=2)，新做法逐条追加 + 每 10 条 fsync
+     （旧做法是平方级，只跑到 --old-max 条）
+  2. 崩溃恢复：JSONL 尾部写了半行 / 写了一行坏数据，recover_jsonl 截掉后条数正确
+  3. finalize_json 出来的 JSON 数组和逐条写入的记录完全一致
+  4. append_to_json_array：往 indent=2 的非空数组 / 空数组追加，结果和 load + extend 一致
+
+用法：
+  python benchmarks/bench_jsonl_checkpoint.py
+  python benchmarks/bench_jsonl_checkpoint.py --sizes 1000,10000,100000,300000 --old-max 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from jsonl_store import JsonlWriter, append_to_json_array, finalize_json, read_jsonl, recover_jsonl
+
+SYSTEM = "你是雨中的马孔多（Joker），在加拿大读数学系MF。" * 40
+
+
+def record(i: int) -> dict:
+    return {
+        "conversations": [
+            {"from": "system", "value": SYSTEM},
+            {"from": "human", "value": f"在吗 {i}"},
+            {"from": "gpt", "value": "在\n咋了"},
+        ],
+        "style": "daily",
+        "source": f"synthetic_daily_{i}",
+    }
+
+
+def old_checkpoints(path: str, n: int) -> float:
+    results = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        results.append(record(i))
+        if (i + 1) % 10 == 0:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    return time.perf_counter() - t0
+
+
+def new_checkpoints(path: str, n: int) -> float:
+    if os.path.exists(path):
+        os.remove(path)
+    t0 = time.perf_counter()
+    with JsonlWriter(path, fsync_every=10) as writer:
+        for i in range(n):
+            writer.append(record(i))
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSONL 检查点基准")
+    parser.add_argument("--sizes", default="1000,5000,20000,100000")
+    parser.add_argument("--old-max", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jsonl = os.path.join(tmp, "out.jsonl")
+        print("1. 检查点总开销（每条约 2KB）")
+        for n in (int(x) for x in args.sizes.split(",")):
+            new = new_checkpoints(jsonl, n)
+            old = old_checkpoints(os.path.join(tmp, "out.json"), n) if n <= args.old_max else None
+            t0 = time.perf_counter()
+            finalize_json(jsonl, os.path.join(tmp, "final.json"))
+            fin = time.perf_counter() - t0
+            old_text = f"{old:7.2f}s" if old is not None else "   （略）"
+            print(f"  {n:>7} 条 | 全量重写 {old_text} | JSONL 追加 {new:6.2f}s + 整理 {fin:5.2f}s | "
+                  f"JSONL {os.path.getsize(jsonl) / 1e6:6.1f}MB")
+
+        print("\n2. 崩溃恢复")
+        new_checkpoints(jsonl, 100)
+        with open(jsonl, "a", encoding="utf-8") as f:
+            f.write('{"conversations": [{"from": "hum')
+        print(f"  半行尾巴：恢复后 {recover_jsonl(jsonl)} 条")
+        with open(jsonl, "a", encoding="utf-8") as f:
+            f.write('{"conversations": [}\n')
+        print(f"  坏掉的最后一行：恢复后 {recover_jsonl(jsonl)} 条")
+        with JsonlWriter(jsonl) as writer:
+            writer.append(record(100))
+        assert recover_jsonl(jsonl) == 101
+
+        print("\n3. finalize_json")
+        final = os.path.join(tmp, "final.json")
+        finalize_json(jsonl, final)
+        with open(final, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        same = loaded == [record(i) for i in range(101)] == list(read_jsonl(jsonl))
+        print(f"  {len(loaded)} 条，与写入的记录一致 {same}")
+        assert same
+
+        print("\n4. append_to_json_array")
+        for label, base in (("非空 indent=2", [record(-1), record(-2)]), ("空数组", [])):
+            path = os.path.join(tmp, "base.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(base, f, ensure_ascii=False, indent=2)
+            added = append_to_json_array(jsonl, path)
+            with open(path, "r", encoding="utf-8") as f:
+                merged = json.load(f)
+            ok = merged == base + loaded
+            print(f"  {label}: 追加 {added} 条，合计 {len(merged)} 条，与 load + extend 一致 {ok}")
+            assert ok
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+对比每次调用都 new OpenAI() 与共享连接池客户端的单次调用开销。
+
+用法：
+  python benchmarks/bench_llm_client.py            # 默认 200 次
+  python benchmarks/bench_llm_client.py --n 1000
+
+对本地 stub 服务测，stub 延迟为 0，测出来的基本就是客户端构造 + 建连的开销。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from bot_core import call_deepseek
+from llm_client import close_all
+from stub_llm_server import StubLLMServer
+
+MESSAGES = [
+    {"role": "system", "content": "你是晴晴"},
+    {"role": "user", "content": "在干嘛"},
+]
+
+
+def call_fresh_client(base_url: str, api_key: str) -> str:
+    """旧实现：每次调用都新建客户端"""
+    client = OpenAI(api_key=api_key, base_url=base_url)
+    response = client.chat.completions.create(
+        model="deepseek-chat", messages=MESSAGES, temperature=0.85, max_tokens=100,
+    )
+    return response.choices[0].message.content.strip()
+
+
+def call_pooled(base_url: str, api_key: str) -> str:
+    return call_deepseek(
+        messages=MESSAGES, model="deepseek-chat", temperature=0.85,
+        max_tokens=100, base_url=base_url, api_key=api_key,
+    )
+
+
+def run(label: str, fn, stub: StubLLMServer, n: int) -> None:
+    fn(stub.base_url, "sk-stub")  # 预热（import、DNS 等一次性开销）
+    stub.reset_stats()
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn(stub.base_url, "sk-stub")
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    stats = stub.stats()
+    print(
+        f"{label:<12} mean={statistics.mean(samples):6.2f}ms "
+        f"p50={samples[len(samples) // 2]:6.2f}ms "
+        f"p95={samples[int(len(samples) * 0.95) - 1]:6.2f}ms "
+        f"| 请求 {stats['requests']} 次，新建连接 {stats['connections']} 个"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 客户端池基准测试")
+    parser.add_argument("--n", type=int, default=200, help="每种模式调用次数")
+    args = parser.parse_args()
+
+    with StubLLMServer() as stub:
+        run("per-call", call_fresh_client, stub, args.n)
+        run("pooled", call_pooled, stub, args.n)
+    close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+merge_sft_data 近似去重（near_dedup）：规模、召回、和两两比较的对照。
+
+合成一批像 generate_joker 产出的对话：每段 4-12 轮、从几百条短句里随机拼，
+其中一部分样本被复制成 1-5 份「近似重复」（改几个字 / 换一轮 / 原样复制）。
+  1. 规模：--sizes 条样本各跑一遍，看耗时随条数是否线性增长、候选对数量
+  2. 准确性：--exact-max 条以内和两两精确 Jaccard 对照：
+     Jaccard >= 阈值的样本对去重后只剩一条的比例（召回）、两条都留下的对数，
+     以及被去掉的样本和它那簇保留的那条低于阈值的条数（应该是 0，传递相似的不去掉）
+  3. 端到端：merge_sft_data.dedup 在带 system prompt 的 ShareGPT 样本上的去重报告
+
+用法：
+  python benchmarks/bench_near_dedup.py
+  python benchmarks/bench_near_dedup.py --sizes 10000,100000,300000 --threshold 0.7
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from merge_sft_data import conversation_text, dedup
+from near_dedup import jaccard, near_duplicate_clusters, shingles
+
+CHARS = "的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学么之都好看起发当没成只如事把还用第样道想作种开美总从无情己面最女但现前些所同日手又行意动方期它头经长儿回位分爱老因很给名法间斯知世什两次使身者被高已亲其进此话常与活正感"
+SYSTEM = "你是雨中的马孔多（Joker），在加拿大读数学系MF。" * 20
+
+
+def make_phrases(rng: random.Random, n: int = 400):
+    return ["".join(rng.choice(CHARS) for _ in range(rng.randint(3, 12))) for _ in range(n)]
+
+
+def mutate(rng: random.Random, turns, phrases):
+    turns = list(turns)
+    op = rng.random()
+    if op < 0.3:
+        return turns
+    if op < 0.7:
+        # 改几个字
+        i = rng.randrange(len(turns))
+        s = list(turns[i])
+        for _ in range(rng.randint(1, 2)):
+            s[rng.randrange(len(s))] = rng.choice(CHARS)
+        turns[i] = "".join(s)
+        return turns
+    # 换掉一轮
+    turns[rng.randrange(len(turns))] = rng.choice(phrases)
+    return turns
+
+
+def make_corpus(n: int, seed: int = 0):
+    """返回 (每条的轮次列表, 植入的重复条数)"""
+    rng = random.Random(seed)
+    phrases = make_phrases(rng)
+    corpus = []
+    planted = 0
+    while len(corpus) < n:
+        base = [rng.choice(phrases) for _ in range(rng.randint(4, 12))]
+        corpus.append(base)
+        if rng.random() < 0.2:
+            for _ in range(rng.randint(1, 5)):
+                if len(corpus) >= n:
+                    break
+                corpus.append(mutate(rng, base, phrases))
+                planted += 1
+    rng.shuffle(corpus)
+    return corpus, planted
+
+
+def texts(corpus):
+    return ["\n".join(turns) for turns in corpus]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash/LSH 近似去重基准")
+    parser.add_argument("--sizes", default="10000,50000,100000")
+    parser.add_argument("--exact-max", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    print(f"1. 规模（阈值 {args.threshold}）")
+    for n in (int(x) for x in args.sizes.split(",")):
+        corpus, planted = make_corpus(n)
+        t0 = time.perf_counter()
+        clusters, stats = near_duplicate_clusters(texts(corpus), threshold=args.threshold)
+        wall = time.perf_counter() - t0
+        print(f"  {n:>7} 条 | {wall:6.1f}s | {n / wall:7.0f} 条/秒 | 候选对 {stats['candidate_pairs']:>7} | "
+              f"{stats['clusters']} 簇去掉 {stats['removed']} 条（植入副本 {planted} 条，换掉一轮的可能低于阈值）")
+
+    n = args.exact_max
+    print(f"\n2. 准确性（{n} 条，和 {n * (n - 1) // 2} 对两两精确 Jaccard 对照）")
+    corpus, _ = make_corpus(n, seed=1)
+    docs = texts(corpus)
+    t0 = time.perf_counter()
+    grams = [shingles(d) for d in docs]
+    truth = {(i, j) for i in range(n) for j in range(i + 1, n) if jaccard(grams[i], grams[j]) >= args.threshold}
+    brute = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    clusters, stats = near_duplicate_clusters(docs, threshold=args.threshold)
+    lsh = time.perf_counter() - t0
+    dropped = {i: members[0] for members in clusters for i in members[1:]}
+    both_kept = [(i, j) for i, j in truth if i not in dropped and j not in dropped]
+    recall = 1 - len(both_kept) / len(truth) if truth else 1.0
+    below = sum(1 for i, keep in dropped.items() if jaccard(grams[i], grams[keep]) < args.threshold)
+    print(f"  两两比较 {brute:.1f}s，LSH {lsh:.2f}s")
+    print(f"  Jaccard >= {args.threshold} 的 {len(truth)} 对里去重后两条都留下的 {len(both_kept)} 对（召回 {recall:.1%}）")
+    print(f"  去掉的 {len(dropped)} 条里和保留的那条低于阈值 {below} 条；"
+          f"只是传递相似、没去掉的 {stats['transitive_kept']} 条")
+    assert recall >= 0.95 and below == 0
+
+    print("\n3. merge_sft_data.dedup")
+    corpus, planted = make_corpus(5000, seed=2)
+    data = [{
+        "conversations": [{"from": "system", "value": SYSTEM}] + [
+            {"from": "human" if k % 2 == 0 else "gpt", "value": v} for k, v in enumerate(turns)
+        ],
+        "style": "daily",
+        "source": f"bench_{i}",
+    } for i, turns in enumerate(corpus)]
+    assert conversation_text(data[0]) == "\n".join(corpus[0])
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        kept, clusters = dedup(data, args.threshold, 128, 3)
+    print("  " + "\n  ".join(line for line in log.getvalue().splitlines()[:4] if line.strip()))
+    print(f"  植入副本 {planted} 条，去掉 {len(data) - len(kept)} 条")
+    assert kept[0] is data[0]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+消息拼装的单次 CPU 耗时：每轮重新拼 system prompt（旧） vs 按风格 + 示例 hash 缓存（新）。
+
+不调 API。两列：
+  - system prompt：只比生成 system prompt 这一步（_render_* vs 走缓存的 build_*）
+  - 整轮拼装：bot._build_messages()（含 token 预算裁剪）；旧路径在脚本里复刻，
+    除了每轮重新 _render_* 之外和新路径完全一样（同一个 budgeter），差值就是缓存省下的
+晴晴用全量样本模式（--top-k 0，system prompt 最大的情况）。
+
+用法：
+  python benchmarks/bench_prompt_assembly.py
+  python benchmarks/bench_prompt_assembly.py --chat-samples ~/Downloads/chat_samples_副本.txt -n 2000
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import joker_prompt_builder
+import prompt_builder
+from bot_core import JokerBot, QingqingBot
+
+HISTORY = [
+    {"role": "user", "content": "在干嘛"},
+    {"role": "assistant", "content": "刚吃完饭\n好撑"},
+    {"role": "user", "content": "吃的啥"},
+    {"role": "assistant", "content": "火锅哈哈哈哈哈"},
+]
+
+
+def cpu_us_per_call(fn: Callable[[], object], n: int) -> float:
+    fn()
+    t0 = time.process_time()
+    for _ in range(n):
+        fn()
+    return (time.process_time() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="system prompt 缓存前后的消息拼装耗时")
+    parser.add_argument("--chat-samples", default=None)
+    parser.add_argument("-n", type=int, default=1000)
+    args = parser.parse_args()
+
+    qingqing = QingqingBot(
+        config_path=os.path.join(ROOT, "config", "styles.json"),
+        chat_samples_path=args.chat_samples,
+        example_top_k=0,
+    )
+    joker = JokerBot(style_tag="brother", profile_dir=os.path.join(ROOT, "joker_profile"))
+    joker_text = joker._examples_cache.get("brother", "")
+
+    qingqing_text, qingqing_key = qingqing.chat_examples_text, qingqing.examples_key
+    joker_key = joker._examples_keys.get("brother")
+
+    def qingqing_render(text, key=None):
+        return prompt_builder._render_system_prompt(text)
+
+    def joker_render(text, key=None):
+        return joker_prompt_builder._render_joker_system_prompt("brother", text)
+
+    def legacy_messages(bot, render, text, key):
+        text, key, _, history = prompt_builder.fit_prompt_budget(
+            bot.budgeter, render, "你呢", text, key, "", HISTORY,
+        )
+        turn_context = prompt_builder.build_turn_context("", history)
+        return prompt_builder.assemble_messages(render(text), "你呢", history, turn_context)
+
+    print(f"\n晴晴 system prompt {len(qingqing._build_messages('你呢', HISTORY)[0]['content'])} 字 | "
+          f"Joker(brother) {len(joker._build_messages('你呢', HISTORY)[0]['content'])} 字 | "
+          f"tokenizer={qingqing.budgeter.counter.name} | 每项 {args.n} 次\n")
+    rows = [
+        ("晴晴",
+         lambda: qingqing_render(qingqing_text),
+         lambda: prompt_builder.build_system_prompt(qingqing_text, qingqing_key),
+         lambda: legacy_messages(qingqing, qingqing_render, qingqing_text, qingqing_key),
+         lambda: qingqing._build_messages("你呢", HISTORY)),
+        ("Joker",
+         lambda: joker_render(joker_text),
+         lambda: joker_prompt_builder.build_joker_system_prompt("brother", joker_text, joker_key),
+         lambda: legacy_messages(joker, joker_render, joker_text, joker_key),
+         lambda: joker._build_messages("你呢", HISTORY)),
+    ]
+    print(f"{'':<6} {'system prompt（重新拼 → 缓存）':<28} {'整轮拼装（重新拼 → 缓存）'}")
+    for label, render, cached_prompt, legacy, cached in rows:
+        p_before = cpu_us_per_call(render, args.n)
+        p_after = cpu_us_per_call(cached_prompt, args.n)
+        before = cpu_us_per_call(legacy, args.n)
+        after = cpu_us_per_call(cached, args.n)
+        print(f"{label:<6} {p_before:7.1f} → {p_after:5.2f}µs {p_before / p_after:6.1f}x       "
+              f"{before:7.1f} → {after:5.1f}µs {before / after:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
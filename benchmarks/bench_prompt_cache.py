@@ -0,0 +1,88 @@
+"""
+前缀缓存命中率对比：旧 prompt 布局 vs 新布局（稳定前缀在前、易变内容在末尾）。
+
+多个用户各聊若干轮，DeepSeek 指向本地 stub。stub 按消息边界模拟前缀缓存，
+usage 里返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，命中率由
+usage_stats.prompt_cache_stats 统计（和线上 /health 的口径一样）。
+
+旧布局在脚本里按改动前的 build_messages 复刻：检索示例拼进 system prompt，
+有历史时最新一条用户消息前加「（续上面的对话）」。
+
+用法：
+  python benchmarks/bench_prompt_cache.py
+  python benchmarks/bench_prompt_cache.py --users 20 --turns 10 --top-k 0
+"""
+import argparse
+import os
+import random
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from prompt_builder import SYSTEM_TEMPLATE
+from stub_llm_server import StubLLMServer
+from usage_stats import prompt_cache_stats
+
+QUERIES = [
+    "在干嘛", "外面风好大", "你吃饭了吗", "晚安", "今天考试好难", "周末要不要一起出去玩",
+    "我室友好吵", "想你了", "你喜欢什么歌", "下雨了诶", "好累啊", "哈哈哈哈哈",
+]
+
+
+def legacy_build_messages(bot: QingqingBot, user_input: str, history: List[Dict]) -> List[Dict]:
+    """改动前的布局"""
+    system_prompt = SYSTEM_TEMPLATE.replace("{examples}", bot.select_examples(user_input, history))
+    messages = [{"role": "system", "content": system_prompt}]
+    for item in history:
+        messages.append({"role": item["role"], "content": item["content"]})
+    if len(history) >= 2:
+        messages.append({"role": "user", "content": f"（续上面的对话）{user_input}"})
+    else:
+        messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+def run(label: str, bot: QingqingBot, users: int, turns: int, seed: int) -> None:
+    rng = random.Random(seed)
+    prompt_cache_stats.reset()
+    for turn in range(turns):
+        for u in range(users):
+            bot.reply(rng.choice(QUERIES), user_id=f"{label}-{u}")
+    s = prompt_cache_stats.stats()
+    print(
+        f"{label:<12} 命中 {s['hit_tokens']:>9} | 未命中 {s['miss_tokens']:>9} | "
+        f"命中率 {s['hit_rate'] * 100:5.1f}%"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prompt 布局前缀缓存命中率对比")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--top-k", type=int, default=8, help="0 = 全量样本模式")
+    parser.add_argument("--chat-samples", default=None)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with StubLLMServer() as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+        config = os.path.join(ROOT, "config", "styles.json")
+
+        for label, legacy in (("旧布局", True), ("新布局", False)):
+            stub.reset_stats()
+            bot = QingqingBot(
+                config_path=config, chat_samples_path=args.chat_samples, example_top_k=args.top_k,
+            )
+            if legacy:
+                bot._build_messages = lambda user_input, history, summary="", b=bot: legacy_build_messages(
+                    b, user_input, history
+                )
+            run(label, bot, args.users, args.turns, args.seed)
+
+
+if __name__ == "__main__":
+    main()
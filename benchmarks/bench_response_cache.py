@@ -0,0 +1,95 @@
+"""
+生成结果缓存：generate_joker 重跑的耗时 / API 请求数，以及 LRU 淘汰。
+
+  1. 冷跑：generate_joker --cache --seed 7 生成 --count 条（stub 每次请求 --latency 秒）
+  2. 删掉输出文件重跑同样参数：全部命中缓存，0 次 API 请求，结果与冷跑逐条一致
+  3. 换 --seed：key 不同，重新请求
+  4. LRU：max_mb 很小的缓存写满后，最近读过的条目留下，最久没用的被淘汰
+
+用法：
+  python benchmarks/bench_response_cache.py
+  python benchmarks/bench_response_cache.py --count 40 --latency 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import generate_joker
+from response_cache import ResponseCache, cache_key
+from stub_llm_server import StubLLMServer
+
+CONVERSATION = [
+    {"from": "human", "value": "在吗"},
+    {"from": "gpt", "value": "在\n咋了"},
+    {"from": "human", "value": "没事就问问"},
+    {"from": "gpt", "value": "好吧"},
+]
+
+
+def run(stub: StubLLMServer, output: str, cache_path: str, count: int, seed: int):
+    for path in (output, os.path.splitext(output)[0] + ".jsonl"):
+        if os.path.exists(path):
+            os.remove(path)
+    stub.reset_stats()
+    sys.argv = [
+        "generate_joker.py", "--count", str(count), "--style", "daily",
+        "--output", output, "--cache", cache_path, "--seed", str(seed),
+    ]
+    t0 = time.perf_counter()
+    generate_joker.main()
+    wall = time.perf_counter() - t0
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f), wall, stub.stats()["requests"]
+
+
+def check_lru(tmp: str) -> None:
+    cache = ResponseCache(os.path.join(tmp, "lru.db"), max_mb=0.01)  # ~10KB
+    payload = "哈" * 1000  # 3KB
+    keys = [cache_key("m", [{"role": "user", "content": str(i)}], {}) for i in range(4)]
+    for key in keys[:3]:
+        cache.put(key, payload)
+        time.sleep(0.01)
+    cache.get(keys[0])  # 最近读过，应当留下
+    time.sleep(0.01)
+    cache.put(keys[3], payload)
+    kept = [i for i, key in enumerate(keys) if cache.get(key) is not None]
+    print(f"  容量 10KB、每条 3KB，写 4 条（写第 4 条前读过第 0 条）：留下 {kept} | {cache.stats()}")
+    assert kept == [0, 2, 3]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成结果缓存基准")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+    reply = json.dumps(CONVERSATION, ensure_ascii=False)
+    with tempfile.TemporaryDirectory() as tmp, StubLLMServer(reply=reply, latency=args.latency) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        output = os.path.join(tmp, "synthetic.json")
+        cache_path = os.path.join(tmp, "responses.db")
+
+        cold, cold_wall, cold_requests = run(stub, output, cache_path, args.count, seed=7)
+        warm, warm_wall, warm_requests = run(stub, output, cache_path, args.count, seed=7)
+        _, other_wall, other_requests = run(stub, output, cache_path, args.count, seed=8)
+
+        print(f"\n{args.count} 条，stub 每次请求 {args.latency}s")
+        print(f"  冷跑          {cold_wall:6.2f}s | API 请求 {cold_requests}")
+        print(f"  同参数重跑    {warm_wall:6.2f}s | API 请求 {warm_requests} | 结果一致 {cold == warm}")
+        print(f"  换 seed 重跑  {other_wall:6.2f}s | API 请求 {other_requests}")
+        assert warm_requests == 0 and cold == warm and other_requests == args.count
+
+        print("\nLRU 淘汰")
+        check_lru(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+对比「全部样本塞进 prompt」和「按相关度检索示例」的单轮 prompt token 数与回复延迟。
+
+用法：
+  python benchmarks/bench_retrieval.py
+  python benchmarks/bench_retrieval.py --chat-samples ~/Downloads/chat_samples_副本.txt --top-k 8
+
+回复延迟对本地 stub 测，stub 按未命中前缀缓存的 prompt 长度模拟预填充开销（--prefill-ms-per-1k），
+所以这里的延迟差距只反映 prompt 变短带来的那一部分。token 数优先用 tiktoken 计，
+没装就按 1 字 ≈ 1.5 token 估。
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from example_retriever import approx_tokens
+from stub_llm_server import StubLLMServer
+
+QUERIES = [
+    "在干嘛", "外面风好大", "你吃饭了吗", "晚安", "今天考试好难", "周末要不要一起出去玩",
+    "我室友好吵", "想你了", "你喜欢什么歌", "下雨了诶", "好累啊", "哈哈哈哈哈",
+]
+
+
+def _token_counter():
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text)), "tiktoken"
+    except Exception:  # 没装，或者离线下载不了 BPE 文件
+        return approx_tokens, "估算"
+
+
+def run(label: str, bot: QingqingBot, count) -> None:
+    tokens, build_ms, reply_ms = [], [], []
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        messages = bot._build_messages(q, [])
+        build_ms.append((time.perf_counter() - t0) * 1000)
+        tokens.append(sum(count(m["content"]) for m in messages))
+
+        t0 = time.perf_counter()
+        bot.reply(q, user_id=f"bench-{label}")
+        reply_ms.append((time.perf_counter() - t0) * 1000)
+        bot.clear_history(f"bench-{label}")
+    print(
+        f"{label:<10} prompt tokens 平均 {statistics.mean(tokens):8.0f} | "
+        f"拼装 {statistics.mean(build_ms):6.2f}ms | 回复 {statistics.mean(reply_ms):7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="示例检索 vs 全量样本基准")
+    parser.add_argument("--chat-samples", default=None)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--budget", type=int, default=2000)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=20.0)
+    args = parser.parse_args()
+
+    count, counter_name = _token_counter()
+    print(f"token 计数方式: {counter_name}")
+
+    with StubLLMServer(prefill_ms_per_1k=args.prefill_ms_per_1k) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+        config = os.path.join(ROOT, "config", "styles.json")
+        full = QingqingBot(config_path=config, chat_samples_path=args.chat_samples, example_top_k=0)
+        retrieval = QingqingBot(
+            config_path=config, chat_samples_path=args.chat_samples,
+            example_top_k=args.top_k, example_token_budget=args.budget,
+        )
+        print()
+        run("全量", full, count)
+        run("检索", retrieval, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+多后端路由验证 + 基准：用 StubBackend 模拟快 / 慢 / 挂掉的后端。
+
+  1. 选路：fast（50ms，并发 8）+ slow（200ms，并发 32），32 并发压 400 次，
+     对比 latency 策略和按权重随机的流量分布与延迟
+  2. 溢出：fast 并发上限 4，超出的请求分到 slow，不排队等 fast
+  3. 故障转移：fast 挂掉，所有请求转到 slow，全部成功
+  4. 端到端：QingqingBot + 两个 OpenAI 兼容 stub 服务（其中一个持续 503），
+     reply / areply_stream 都能拿到回复
+
+用法：
+  python benchmarks/bench_router.py
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from history_backend import MemoryHistoryBackend
+from llm_router import LLMRouter, OpenAICompatibleBackend, StubBackend
+from stub_llm_server import StubLLMServer
+
+MESSAGES = [{"role": "system", "content": "你是晴晴"}, {"role": "user", "content": "在干嘛"}]
+
+
+def load(router: LLMRouter, calls: int, concurrency: int) -> Tuple[List[float], float]:
+    def one(_) -> float:
+        t0 = time.perf_counter()
+        router.complete(MESSAGES, 0.85, 100)
+        return time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = sorted(pool.map(one, range(calls)))
+    return samples, time.perf_counter() - t0
+
+
+def summarize(label: str, router: LLMRouter, result: Tuple[List[float], float]) -> None:
+    samples, wall = result
+    backends = router.stats()["backends"]
+    share = " / ".join(f"{name} {b['share']:.0%}" for name, b in backends.items())
+    failovers = sum(b["failovers"] for b in backends.values())
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"  {label:<14} p50 {samples[len(samples) // 2] * 1000:5.0f}ms | p99 {p99 * 1000:5.0f}ms | "
+          f"总耗时 {wall:5.2f}s | 流量 {share} | 故障转移 {failovers} 次")
+
+
+def stubs(fast_limit: int = 8):
+    return [
+        StubBackend("fast", latency=0.05, jitter=0.01, max_concurrency=fast_limit),
+        StubBackend("slow", latency=0.2, jitter=0.02, max_concurrency=32),
+    ]
+
+
+def main():
+    print("1. 选路（32 并发 × 400 次）")
+    for policy in ("latency", "weighted"):
+        router = LLMRouter(stubs(), policy=policy)
+        summarize(policy, router, load(router, 400, 32))
+
+    print("\n2. 溢出（fast 并发上限 4）")
+    router = LLMRouter(stubs(fast_limit=4))
+    summarize("latency", router, load(router, 400, 32))
+
+    print("\n3. 故障转移（fast 挂掉）")
+    backends = stubs()
+    backends[0].down = True
+    router = LLMRouter(backends)
+    summarize("latency", router, load(router, 200, 32))
+    print(f"  fast 错误 {router.stats()['backends']['fast']['errors']} 次，200 次调用全部成功")
+
+    print("\n4. 端到端（QingqingBot + 两个 OpenAI 兼容 stub，primary 持续 503）")
+    with StubLLMServer(reply="主线路") as primary, StubLLMServer(reply="备用线路\n没事") as backup:
+        primary.inject_fault(status=503, count=-1)
+        router = LLMRouter([
+            OpenAICompatibleBackend("primary", primary.base_url, "sk-stub", "deepseek-chat", weight=3),
+            OpenAICompatibleBackend("backup", backup.base_url, "sk-stub", "deepseek-chat"),
+        ])
+        bot = QingqingBot(
+            config_path=os.path.join(ROOT, "config", "styles.json"),
+            history_backend=MemoryHistoryBackend(), summary_token_threshold=0, router=router,
+        )
+        replies = [bot.reply("在干嘛", user_id=f"u{i}") for i in range(5)]
+
+        async def stream_once() -> List[str]:
+            return [line async for line in bot.areply_stream("周末去哪玩", user_id="s")]
+
+        lines = asyncio.run(stream_once())
+        print(f"  reply: {set(replies)} | areply_stream: {lines}")
+        for name, b in bot.session_stats()["router"]["backends"].items():
+            print(f"  {name}: 调用 {b['calls']} 次，错误 {b['errors']} 次，延迟估计 {b['ewma_ms']}ms")
+
+
+if __name__ == "__main__":
+    main()
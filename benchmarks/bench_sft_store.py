@@ -0,0 +1,86 @@
+"""
+sft_store interned 格式 vs ShareGPT JSON：文件大小、加载耗时、往返是否逐字节一致。
+
+  1. training_data/ 下的 sft-*.json：各自 pack 成 interned，比文件大小和加载时间
+     （ShareGPT 用 json.load，interned 用 load_sft 展开成同样的样本列表），
+     再 unpack 回 ShareGPT，和原文件逐字节比较
+  2. 规模：把 sft-daily.json 复制到 --scale 条（style / source 加编号），看大数据集上的差距
+
+用法：
+  python benchmarks/bench_sft_store.py
+  python benchmarks/bench_sft_store.py --scale 100000
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sft_store import load_sft, save_interned, save_sharegpt
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def load_plain(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(label: str, sharegpt: str, interned: str) -> None:
+    plain = best_of(lambda: load_plain(sharegpt))
+    packed = best_of(lambda: load_sft(interned))
+    a, b = os.path.getsize(sharegpt), os.path.getsize(interned)
+    print(f"  {label:<32} {a / 1e6:7.2f}MB → {b / 1e6:6.2f}MB ({a / b:4.1f}x) | "
+          f"加载 {plain * 1000:7.1f}ms → {packed * 1000:6.1f}ms ({plain / packed:4.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SFT interned 格式基准")
+    parser.add_argument("--scale", type=int, default=20000)
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(ROOT, "training_data", "sft-*.json")))
+    with tempfile.TemporaryDirectory() as tmp:
+        print("1. training_data/")
+        for path in files:
+            name = os.path.basename(path)
+            interned = os.path.join(tmp, name + ".interned")
+            samples = load_plain(path)
+            save_interned(samples, interned)
+            compare(name, path, interned)
+            back = os.path.join(tmp, name)
+            save_sharegpt(load_sft(interned), back)
+            with open(path, "rb") as f1, open(back, "rb") as f2:
+                same = f1.read() == f2.read()
+            assert same, f"{name} 往返后不一致"
+        print(f"  unpack 回来的 {len(files)} 个文件和原文件逐字节一致")
+
+        print(f"\n2. 规模（sft-daily.json 复制到 {args.scale} 条）")
+        base = load_plain(os.path.join(ROOT, "training_data", "sft-daily.json"))
+        big = []
+        for i in range(args.scale):
+            sample = dict(base[i % len(base)])
+            sample["source"] = f"{sample.get('source', '')}#{i}"
+            big.append(sample)
+        sharegpt = os.path.join(tmp, "big.json")
+        interned = os.path.join(tmp, "big.interned.json")
+        save_sharegpt(big, sharegpt)
+        save_interned(big, interned)
+        compare(f"{args.scale} 条", sharegpt, interned)
+        assert load_sft(interned) == big
+
+
+if __name__ == "__main__":
+    main()
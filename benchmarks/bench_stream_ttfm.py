@@ -0,0 +1,96 @@
+"""
+首条消息到达时间（TTFM）：整段生成后再逐行发送 vs 流式生成、每生成一行就发。
+
+DeepSeek 指向本地流式 stub：首 token 前等 --latency 秒，之后每行再等 --line-latency 秒。
+发送走真实的 OutboundDispatcher（相邻两行间隔 --interval 秒），send_fn 只记录时间。
+从「开始生成」算起，统计每个用户收到第一条 / 最后一条消息的耗时。
+
+用法：
+  python benchmarks/bench_stream_ttfm.py
+  python benchmarks/bench_stream_ttfm.py --users 50 --latency 0.4 --line-latency 0.3
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from history_backend import MemoryHistoryBackend
+from outbound import OutboundDispatcher
+from stub_llm_server import StubLLMServer
+
+REPLY = "哈哈哈哈哈哈哈\n真的假的\n我也想去\n下次带上我呗"
+
+
+def run(bot: QingqingBot, users: int, interval: float, stream: bool) -> Dict[str, List[float]]:
+    lock = threading.Lock()
+    started: Dict[str, float] = {}
+    first: Dict[str, float] = {}
+    last: Dict[str, float] = {}
+
+    def send(user_id: str, content: str) -> bool:
+        now = time.perf_counter()
+        with lock:
+            first.setdefault(user_id, now)
+            last[user_id] = now
+        return True
+
+    dispatcher = OutboundDispatcher(send, interval=interval, rate_per_sec=0, name="bench")
+
+    def one(i: int) -> None:
+        user_id = f"u{i}"
+        started[user_id] = time.perf_counter()
+        if stream:
+            for line in bot.reply_stream("周末去爬山了", user_id=user_id):
+                dispatcher.enqueue(user_id, [line])
+        else:
+            reply = bot.reply("周末去爬山了", user_id=user_id)
+            dispatcher.enqueue(user_id, [l.strip() for l in reply.split("\n") if l.strip()])
+
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(one, range(users)))
+    dispatcher.flush()
+    dispatcher.stop()
+    return {
+        "ttfm": [first[u] - started[u] for u in started],
+        "last": [last[u] - started[u] for u in started],
+    }
+
+
+def _fmt(values: List[float]) -> str:
+    values = sorted(values)
+    return f"p50 {statistics.median(values) * 1000:6.0f}ms | max {values[-1] * 1000:6.0f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式回复 TTFM 基准")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.4, help="首 token 之前的延迟（秒）")
+    parser.add_argument("--line-latency", type=float, default=0.3, help="每生成一行的耗时（秒）")
+    parser.add_argument("--interval", type=float, default=0.6, help="同一用户相邻两条的发送间隔")
+    args = parser.parse_args()
+
+    n_lines = len(REPLY.split("\n"))
+    with StubLLMServer(latency=args.latency, line_latency=args.line_latency, reply=REPLY) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+        print(f"{args.users} 个用户并发，每条回复 {n_lines} 行，首 token {args.latency}s + 每行 {args.line_latency}s，"
+              f"发送间隔 {args.interval}s\n")
+        for label, stream in (("整段", False), ("流式", True)):
+            bot = QingqingBot(
+                config_path=os.path.join(ROOT, "config", "styles.json"),
+                history_backend=MemoryHistoryBackend(), summary_token_threshold=0,
+            )
+            result = run(bot, args.users, args.interval, stream)
+            print(f"{label}  首条 {_fmt(result['ttfm'])}   最后一条 {_fmt(result['last'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+滚动摘要和 max_rounds 上限一起工作时不丢轮次：摘要函数换成可控的假实现，对着本地 stub 跑三个场景。
+
+  1. 折叠进行中又来了几轮（内存后端）→ 上限挤出去的轮次没丢：每一轮要么在摘要里、要么还在历史里，
+     摘要写好后删掉的正好是折叠的那几条
+  2. 短轮次一直到不了 token 阈值      → 到了 max_rounds 上限照样折叠，不会被直接截掉
+  3. 场景 1 换成 SQLite 后端           → 落盘后重新打开，库里的历史和热层一致
+
+用法：
+  python benchmarks/check_history_summary.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_llm_server import StubLLMServer
+
+
+def check(label: str, ok: bool, detail: str) -> bool:
+    print(f"[{'OK' if ok else 'FAIL'}] {label}: {detail}")
+    return ok
+
+
+class GatedSummarize:
+    """假的摘要函数：把折叠的用户消息原样拼进摘要；gate 没打开时一直卡着"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def __call__(self, old_summary, turns):
+        self.started.set()
+        self.gate.wait(timeout=10)
+        folded = [t.content for t in turns if t.role == "user"]
+        return "|".join(filter(None, [old_summary] + folded))
+
+
+def reply_for(req: dict) -> str:
+    return "a" + req["messages"][-1]["content"][1:]
+
+
+def make_bot(backend, threshold: int):
+    from bot_core import JokerBot
+    bot = JokerBot(max_rounds=4, history_backend=backend, summary_token_threshold=threshold)
+    fake = GatedSummarize()
+    bot.summarizer.summarize_fn = fake
+    bot.summarizer.max_chars = 10000
+    return bot, fake
+
+
+def coverage(bot, user_id: str, sent: int):
+    """(漏掉的轮次, 在摘要和历史里都出现的轮次, 历史条数)"""
+    summarized = set(filter(None, bot.get_summary(user_id).split("|")))
+    kept = [m["content"] for m in bot.get_history(user_id) if m["role"] == "user"]
+    asked = {f"q{i}" for i in range(sent)}
+    lost = sorted(asked - summarized - set(kept), key=lambda q: int(q[1:]))
+    both = sorted(summarized & set(kept), key=lambda q: int(q[1:]))
+    return lost, both, len(bot.get_history(user_id))
+
+
+def fold_during_pending(bot, fake, user_id: str) -> int:
+    """先聊到触发折叠，摘要卡住期间再来 3 轮，然后放行；返回一共发了多少轮"""
+    sent = 0
+    fake.gate.clear()
+    while not fake.started.is_set():
+        bot.reply(f"q{sent}", user_id=user_id)
+        sent += 1
+        fake.started.wait(timeout=0.2)
+    for _ in range(3):
+        bot.reply(f"q{sent}", user_id=user_id)
+        sent += 1
+    fake.gate.set()
+    bot.summarizer.drain(timeout=10)
+    return sent
+
+
+def main():
+    from history_backend import MemoryHistoryBackend, SQLiteHistoryBackend
+
+    results = []
+    with StubLLMServer(responder=reply_for) as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+
+        # 1. 折叠进行中又来了几轮
+        bot, fake = make_bot(MemoryHistoryBackend(), threshold=10)
+        sent = fold_during_pending(bot, fake, "u1")
+        lost, both, size = coverage(bot, "u1", sent)
+        results.append(check(
+            "折叠期间来新轮次", not lost and not both and size <= 8,
+            f"发了 {sent} 轮，漏掉 {lost}，摘要和历史重复 {both}，prompt 历史 {size} 条，"
+            f"摘要 {bot.get_summary('u1')!r}",
+        ))
+
+        # 2. 到不了 token 阈值的短轮次
+        bot, fake = make_bot(MemoryHistoryBackend(), threshold=100000)
+        for i in range(12):
+            bot.reply(f"q{i}", user_id="u2")
+            bot.summarizer.drain(timeout=10)
+        lost, both, size = coverage(bot, "u2", 12)
+        results.append(check(
+            "上限触发折叠", not lost and not both and size <= 8,
+            f"12 轮，漏掉 {lost}，prompt 历史 {size} 条，折叠 {bot.summarizer.stats()['compactions']} 次",
+        ))
+
+        # 3. SQLite 后端
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "history.db")
+            backend = SQLiteHistoryBackend(path, flush_interval=0.05)
+            bot, fake = make_bot(backend, threshold=10)
+            sent = fold_during_pending(bot, fake, "u3")
+            lost, both, _ = coverage(bot, "u3", sent)
+            hot = [t.content for t in backend.load("u3", 100)]
+            backend.close()
+            reopened = SQLiteHistoryBackend(path)
+            disk = [t.content for t in reopened.load("u3", 100)]
+            reopened.close()
+            results.append(check(
+                "SQLite 落盘一致", not lost and not both and hot == disk,
+                f"发了 {sent} 轮，漏掉 {lost}，热层 {hot}，库里 {disk}",
+            ))
+
+    print(f"\n{sum(results)}/{len(results)} 通过")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+DeepSeek 容错层验证：对着会注入故障的本地 stub 跑几个场景。
+
+  1. 连续 2 次 503            → 退避重试后成功，stub 收到 3 次请求
+  2. 429 + Retry-After: 0.5   → 按服务端要求等够 0.5s 再重试
+  3. 请求卡住 5s（总时限 1.5s）→ 1.5s 左右超时返回，不会挂满 5s
+  4. 持续 503                  → 连续失败 3 次后熔断，之后的调用立即失败、不再打到 stub
+  5. 冷却后探测                → 探测失败重新熔断；故障恢复后探测成功，熔断器关闭
+  6. 异步路径                  → call_deepseek_async 同样重试成功
+  7. 半开探测被取消            → 探测名额让出来，下一次调用照常探测并恢复，不会卡在 half_open
+  8. 本地连接池排队超时        → 连续 PoolTimeout 不计入熔断（服务商没问题，是客户端自己满了）
+
+用法：
+  python benchmarks/check_llm_resilience.py
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 在导入 bot_core 之前把时限 / 冷却调小，场景跑得快一点
+os.environ.update({
+    "LLM_CALL_DEADLINE": "1.5",
+    "LLM_MAX_RETRIES": "2",
+    "LLM_BACKOFF_BASE": "0.05",
+    "LLM_BREAKER_FAILURES": "3",
+    "LLM_BREAKER_COOLDOWN": "1",
+})
+
+from stub_llm_server import StubLLMServer
+
+
+def check(label: str, ok: bool, detail: str) -> bool:
+    print(f"[{'OK' if ok else 'FAIL'}] {label}: {detail}")
+    return ok
+
+
+def main():
+    from bot_core import call_deepseek, call_deepseek_async
+    from llm_client import aclose_all
+    from llm_resilience import CircuitOpenError, get_breaker, is_pool_timeout, resilience_stats, retry_policy
+
+    results = []
+    with StubLLMServer(reply="好嘞") as stub:
+        kwargs = dict(
+            messages=[{"role": "user", "content": "在吗"}], model="deepseek-chat",
+            temperature=0.8, max_tokens=20, base_url=stub.base_url, api_key="sk-stub",
+        )
+        breaker = get_breaker(stub.base_url)
+
+        def timed_call():
+            t0 = time.perf_counter()
+            try:
+                return call_deepseek(**kwargs), time.perf_counter() - t0
+            except Exception as e:
+                return e, time.perf_counter() - t0
+
+        # 1. 503 重试
+        stub.reset_stats()
+        stub.inject_fault(status=503, count=2)
+        reply, _ = timed_call()
+        results.append(check(
+            "503 重试", reply == "好嘞" and stub.stats()["requests"] == 3,
+            f"回复 {reply!r}，stub 收到 {stub.stats()['requests']} 次请求",
+        ))
+
+        # 2. Retry-After
+        stub.inject_fault(status=429, count=1, retry_after=0.5)
+        reply, elapsed = timed_call()
+        results.append(check(
+            "Retry-After", reply == "好嘞" and elapsed >= 0.5,
+            f"回复 {reply!r}，耗时 {elapsed:.2f}s",
+        ))
+
+        # 3. 总时限
+        stub.inject_fault(status=0, count=-1, hang=5)
+        err, elapsed = timed_call()
+        stub.clear_faults()
+        results.append(check(
+            "总时限", isinstance(err, Exception) and elapsed < 2.0,
+            f"{type(err).__name__}，耗时 {elapsed:.2f}s（stub 卡 5s）",
+        ))
+        call_deepseek(**kwargs)  # 成功一次，清零连续失败计数
+
+        # 4. 熔断
+        stub.inject_fault(status=503, count=-1)
+        for _ in range(3):
+            timed_call()
+        before = stub.stats()["requests"]
+        err, elapsed = timed_call()
+        results.append(check(
+            "熔断", isinstance(err, CircuitOpenError) and elapsed < 0.01
+            and stub.stats()["requests"] == before and breaker.state == "open",
+            f"{type(err).__name__}，耗时 {elapsed * 1000:.2f}ms，期间 stub 请求数 {stub.stats()['requests'] - before}",
+        ))
+
+        # 5. 半开探测：先失败一次，再恢复
+        time.sleep(1.1)
+        err, _ = timed_call()
+        reopened = breaker.state == "open"
+        time.sleep(1.1)
+        stub.clear_faults()
+        reply, _ = timed_call()
+        results.append(check(
+            "半开探测", reopened and reply == "好嘞" and breaker.state == "closed",
+            f"探测失败后重新熔断={reopened}，恢复后回复 {reply!r}，状态 {breaker.state}",
+        ))
+
+        # 6. 异步路径
+        stub.inject_fault(status=502, count=1)
+
+        async def run_async():
+            try:
+                return await call_deepseek_async(**kwargs)
+            finally:
+                await aclose_all()
+
+        reply = asyncio.run(run_async())
+        results.append(check("异步重试", reply == "好嘞", f"回复 {reply!r}"))
+
+        # 7. 半开探测被取消
+        stub.inject_fault(status=503, count=-1)
+        while breaker.state != "open":
+            timed_call()
+        time.sleep(1.1)
+        stub.inject_fault(status=0, count=1, hang=3)
+
+        async def cancel_probe():
+            task = asyncio.create_task(call_deepseek_async(**kwargs))
+            await asyncio.sleep(0.3)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            finally:
+                await aclose_all()
+
+        asyncio.run(cancel_probe())
+        cancelled_state = breaker.state
+        reply, _ = timed_call()
+        results.append(check(
+            "取消探测", reply == "好嘞" and breaker.state == "closed",
+            f"探测被取消后状态 {cancelled_state}，下一次调用回复 {reply!r}，状态 {breaker.state}",
+        ))
+
+        # 8. 连接池排队超时：只有 1 个连接，被一个卡住的请求占着
+        import httpx
+        from openai import OpenAI
+        client = OpenAI(api_key="sk-stub", base_url=stub.base_url, max_retries=0,
+                        http_client=httpx.Client(limits=httpx.Limits(max_connections=1)))
+        create = dict(model="deepseek-chat", messages=kwargs["messages"], max_tokens=20)
+        stub.inject_fault(status=0, count=1, hang=2)
+        hog = threading.Thread(target=lambda: client.chat.completions.create(timeout=5, **create))
+        hog.start()
+        time.sleep(0.2)
+        errors = []
+        for _ in range(4):
+            try:
+                retry_policy.call(lambda t: client.chat.completions.create(timeout=t, **create),
+                                  breaker=breaker, deadline=0.3)
+            except Exception as e:
+                errors.append(e)
+        hog.join()
+        client.close()
+        results.append(check(
+            "连接池排队超时", len(errors) == 4 and all(map(is_pool_timeout, errors)) and breaker.state == "closed",
+            f"{len(errors)} 次 {type(errors[0]).__name__ if errors else '-'}，熔断器 {breaker.stats()}",
+        ))
+
+        print(f"\n/health 里的 llm 字段: {resilience_stats()}")
+
+    print(f"\n{sum(results)}/{len(results)} 通过")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
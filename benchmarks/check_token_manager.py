@@ -0,0 +1,93 @@
+"""
+access_token 管理器验证：对着本地 stub token 服务跑三个场景。
+
+  1. 冷启动 200 个线程同时 get()        → token 接口只被请求 1 次
+  2. 服务端让 token 失效，50 个线程同时发客服消息 → 都收到 40001，但只刷新 1 次，全部重试成功
+  3. 后台续期（token 有效期 4s）         → 续期在后台完成，get() 始终不阻塞
+
+用法：
+  python benchmarks/check_token_manager.py
+"""
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_llm_server import StubLLMServer
+
+
+def check(label: str, ok: bool, detail: str) -> bool:
+    print(f"[{'OK' if ok else 'FAIL'}] {label}: {detail}")
+    return ok
+
+
+def main():
+    results = []
+    with StubLLMServer(token_latency=0.2) as stub:
+        os.environ.update({
+            "MP_API_BASE": stub.root_url,
+            "MP_APP_ID": "wx_stub",
+            "MP_APP_SECRET": "stub",
+        })
+        import mp_bot
+        from wechat_token import AccessTokenManager
+
+        # 1. 冷启动单飞
+        barrier = threading.Barrier(200)
+
+        def cold_get(_):
+            barrier.wait()
+            return mp_bot.get_access_token()
+
+        with ThreadPoolExecutor(200) as pool:
+            tokens = set(pool.map(cold_get, range(200)))
+        results.append(check(
+            "冷启动单飞", stub.stats()["tokens_issued"] == 1 and len(tokens) == 1,
+            f"200 个并发 get()，token 接口请求 {stub.stats()['tokens_issued']} 次",
+        ))
+
+        # 2. 40001 强制刷新
+        stub.reset_stats()
+        stub.revoke_token()
+        with ThreadPoolExecutor(50) as pool:
+            sent = list(pool.map(lambda i: mp_bot.send_custom_message(f"u{i}", "hi"), range(50)))
+        stats = stub.stats()
+        results.append(check(
+            "40001 强制刷新", all(sent) and stats["tokens_issued"] == 1,
+            f"50 条消息成功 {sum(sent)} 条，token 接口请求 {stats['tokens_issued']} 次",
+        ))
+
+        # 3. 后台续期
+        stub.token_ttl = 4
+        stub.token_latency = 0.0
+        stub.reset_stats()
+
+        def fetch():
+            return mp_bot._fetch_access_token()
+
+        manager = AccessTokenManager(fetch, name="renew-test", refresh_margin=2)
+        manager.get()
+        manager.start_background()
+        slowest = 0.0
+        deadline = time.time() + 9
+        while time.time() < deadline:
+            t0 = time.perf_counter()
+            manager.get()
+            slowest = max(slowest, time.perf_counter() - t0)
+            time.sleep(0.05)
+        manager.stop()
+        refreshes = stub.stats()["tokens_issued"]
+        results.append(check(
+            "后台续期", refreshes >= 4 and slowest < 0.05,
+            f"9s 内续期 {refreshes} 次，get() 最慢 {slowest * 1000:.1f}ms",
+        ))
+
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+mp_bot 异步模式压测：5k 条消息瞬时涌入，观察内存和线程数是否稳定。
+
+直接在进程内调用 mp_bot.asgi_app（不经过 uvicorn），DeepSeek 和微信 API
+都指向本地 stub。每 0.5s 采样一次线程数 / 内存 / 队列状态。
+
+用法：
+  python benchmarks/load_mp_async.py
+  python benchmarks/load_mp_async.py --messages 5000 --users 500 --latency 0.3 \\
+      --concurrency 64 --queue-size 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_llm_server import StubLLMServer
+
+MP_TOKEN = "load_test_token"
+
+
+def _signed_query() -> bytes:
+    timestamp, nonce = str(int(time.time())), str(random.randint(1, 10 ** 9))
+    signature = hashlib.sha1("".join(sorted([MP_TOKEN, timestamp, nonce])).encode()).hexdigest()
+    return f"signature={signature}&timestamp={timestamp}&nonce={nonce}".encode()
+
+
+def _xml(from_user: str, msg_type: str, content: str, msg_id: int) -> bytes:
+    return (
+        "<xml>"
+        "<ToUserName><![CDATA[gh_test]]></ToUserName>"
+        f"<FromUserName><![CDATA[{from_user}]]></FromUserName>"
+        f"<CreateTime>{int(time.time())}</CreateTime>"
+        f"<MsgType><![CDATA[{msg_type}]]></MsgType>"
+        f"<Content><![CDATA[{content}]]></Content>"
+        f"<MsgId>{msg_id}</MsgId>"
+        "</xml>"
+    ).encode("utf-8")
+
+
+async def post(app, path: str, query: bytes, body: bytes) -> int:
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": query}
+    sent = False
+    status = 0
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(event):
+        nonlocal status
+        if event["type"] == "http.response.start":
+            status = event["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def _app_threads() -> int:
+    """排除 stub 服务自己的连接线程"""
+    return sum(1 for t in threading.enumerate() if "process_request" not in t.name)
+
+
+async def run(mp_bot, args) -> None:
+    queue = await mp_bot.start_reply_queue()
+    dispatcher = mp_bot.init_dispatcher()
+    tracemalloc.start()
+    samples = []
+    stop = asyncio.Event()
+
+    async def sampler():
+        while not stop.is_set():
+            current, _ = tracemalloc.get_traced_memory()
+            samples.append((
+                _app_threads(), current / 1e6,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                queue.stats(),
+            ))
+            await asyncio.sleep(0.5)
+
+    sampler_task = asyncio.create_task(sampler())
+    t0 = time.perf_counter()
+
+    statuses = await asyncio.gather(*(
+        post(
+            mp_bot.asgi_app, "/wx/callback", _signed_query(),
+            _xml(
+                f"user_{i % args.users}",
+                "image" if i % 10 == 0 else "text",
+                random.choice(["在干嘛", "你吃了吗", "哈哈哈", "晚安"]),
+                i,
+            ),
+        )
+        for i in range(args.messages)
+    ))
+    accepted_at = time.perf_counter() - t0
+
+    await queue.join()
+    elapsed = time.perf_counter() - t0
+    await asyncio.to_thread(dispatcher.flush, 120)
+    sent_at = time.perf_counter() - t0
+    stop.set()
+    await sampler_task
+    await mp_bot.stop_reply_queue()
+
+    threads = [s[0] for s in samples]
+    heap = [s[1] for s in samples]
+    print(f"{args.messages} 条消息全部应答用时 {accepted_at:.2f}s（HTTP 状态: {sorted(set(statuses))}）")
+    print(f"队列排空用时 {elapsed:.2f}s | 最终队列状态: {queue.stats()}")
+    print(f"客服消息全部发出用时 {sent_at:.2f}s | 出站状态: {dispatcher.stats()}")
+    print(f"线程数: min={min(threads)} max={max(threads)}（不含 stub）")
+    print(f"Python 堆: 峰值 {max(heap):.1f}MB 末尾 {heap[-1]:.1f}MB | RSS 峰值 {samples[-1][2]:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mp_bot 异步模式突发压测")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub DeepSeek 延迟（秒）")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--queue-size", type=int, default=2000)
+    parser.add_argument("--send-rate", type=float, default=500, help="客服消息全局限速（条/秒）")
+    args = parser.parse_args()
+
+    with StubLLMServer(latency=args.latency, reply="哈哈哈哈哈") as stub:
+        os.environ.update({
+            "DEEPSEEK_BASE_URL": stub.base_url,
+            "DEEPSEEK_API_KEY": "sk-stub",
+            "MP_API_BASE": stub.root_url,
+            "MP_TOKEN": MP_TOKEN,
+            "MP_APP_ID": "wx_stub",
+            "MP_APP_SECRET": "stub",
+            "MP_REPLY_CONCURRENCY": str(args.concurrency),
+            "MP_REPLY_QUEUE_SIZE": str(args.queue_size),
+            "MP_SEND_RATE": str(args.send_rate),
+        })
+        import mp_bot
+        from bot_core import QingqingBot
+
+        mp_bot.bot = QingqingBot(config_path=os.path.join(ROOT, "config", "styles.json"))
+        asyncio.run(run(mp_bot, args))
+        print(f"stub 统计: {stub.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+"""
+本地 OpenAI 兼容 stub 服务 — 只依赖标准库，给 benchmarks/ 下的压测脚本用。
+
+支持：
+  POST .../chat/completions          返回固定回复（可配置延迟），usage 里带模拟的
+                                     prompt_cache_hit_tokens / prompt_cache_miss_tokens；
+                                     stream=true 时按 SSE 逐块返回（可配置每行生成耗时）；
+                                     inject_fault() 可让接下来的请求返回 429/5xx 或卡住
+  GET  /cgi-bin/token                公众号 access_token（假 token，可配置有效期 / 延迟）
+  GET  /cgi-bin/gettoken             企业微信 access_token（同上）
+  POST /cgi-bin/message/custom/send  公众号客服消息（只认最新 token，旧的返回 40001）
+  POST /cgi-bin/message/send         企业微信应用消息（同上）
+  GET  /stats                        返回请求数 / 新建连接数 / 发出的客服消息数
+
+用法：
+  python benchmarks/stub_llm_server.py --port 18080 --latency 0.05
+
+或在脚本里：
+  with StubLLMServer(latency=0.05) as stub:
+      call_deepseek(..., base_url=stub.base_url, api_key="sk-stub")
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+TOKEN_PATHS = {"/cgi-bin/token", "/cgi-bin/gettoken"}
+SEND_PATHS = {"/cgi-bin/message/custom/send", "/cgi-bin/message/send"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能保持 keep-alive，否则每个请求都会断开重连
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.stub.on_connection()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/stats":
+            self._send_json(200, self.server.stub.stats())
+        elif path in TOKEN_PATHS:
+            self._send_json(200, self.server.stub.issue_token())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        if path in SEND_PATHS:
+            token = parse_qs(url.query).get("access_token", [""])[0]
+            self._send_json(200, self.server.stub.send_message(token))
+            return
+        if not path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            req = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            self._send_json(400, {"error": "bad json"})
+            return
+        stub = self.server.stub
+        stub.on_request()
+        fault = stub.take_fault()
+        if fault is not None:
+            if fault["hang"] > 0:
+                time.sleep(fault["hang"])
+            if fault["status"]:
+                headers = {}
+                if fault["retry_after"] is not None:
+                    headers["Retry-After"] = str(fault["retry_after"])
+                error = {"message": f"injected {fault['status']}", "type": "stub_fault"}
+                self._send_json(fault["status"], {"error": error}, headers)
+                return
+        hit_chars, miss_chars = stub.prefix_cache_lookup(req)
+        delay = stub.request_latency() + stub.prefill_delay(req, miss_chars)
+        if req.get("stream"):
+            if delay > 0:
+                time.sleep(delay)
+            self._send_stream(stub, req, hit_chars, miss_chars)
+            return
+        delay += stub.generation_delay(req)
+        if delay > 0:
+            time.sleep(delay)
+        self._send_json(200, stub.completion(req, hit_chars, miss_chars))
+
+    def _send_stream(self, stub: "StubLLMServer", req: dict, hit_chars: int, miss_chars: int) -> None:
+        # 不带 Content-Length，发完关连接
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for event in stub.stream_events(req, hit_chars, miss_chars):
+            if isinstance(event, float):
+                time.sleep(event)
+                continue
+            self.wfile.write(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认 listen backlog 只有 5，上百个连接同时建连时多出来的 SYN 被丢掉、等 1s / 3s 重传，
+    # 压测耗时会随并发超线性增长（测的是 stub 的 accept 队列，不是客户端）
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class StubLLMServer:
+    """在后台线程里跑的 OpenAI 兼容 stub"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        reply: str = "哈哈哈哈哈\n是嘛",
+        token_ttl: int = 7200,
+        token_latency: float = 0.0,
+        prefill_ms_per_1k: float = 0.0,
+        line_latency: float = 0.0,
+        chunk_chars: int = 3,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        responder: Optional[Callable[[dict], str]] = None,
+    ):
+        """
+        prefill_ms_per_1k: 每 1000 字 prompt 额外增加的延迟，模拟长 prompt 的预填充开销
+        line_latency: 每生成一行回复的耗时（非流式请求等全部行生成完才返回）
+        chunk_chars: 流式返回时每个 chunk 几个字
+        slow_rate / slow_latency: 按这个比例随机挑请求，延迟换成 slow_latency（模拟长尾）
+        responder: 按请求体生成回复（优先于固定的 reply），例如按 prompt 里的条数拼批量回复
+        """
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.line_latency = line_latency
+        self.chunk_chars = max(1, chunk_chars)
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.reply = reply
+        self.responder = responder
+        self.token_ttl = token_ttl
+        self.token_latency = token_latency
+        self.current_token = ""
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.tokens_issued = 0
+        # token 编号单独递增，reset_stats() 不清零：不然清零后发的新 token 和客户端手里的旧 token 同名
+        self._token_seq = 0
+        self.messages_sent = 0
+        # 模拟 DeepSeek 前缀缓存：按消息边界记录见过的前缀（只存 hash）
+        self._prefix_cache = set()
+        self._fault: Optional[dict] = None
+        self.faults_served = 0
+
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.root_url}/v1"
+
+    def on_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def issue_token(self) -> dict:
+        if self.token_latency > 0:
+            time.sleep(self.token_latency)
+        with self._lock:
+            self.tokens_issued += 1
+            self._token_seq += 1
+            self.current_token = f"stub-token-{self._token_seq}"
+            return {"errcode": 0, "access_token": self.current_token, "expires_in": self.token_ttl}
+
+    def revoke_token(self) -> None:
+        """模拟服务端让当前 token 失效（比如别处又刷新了一次）"""
+        with self._lock:
+            self.current_token = "revoked"
+
+    def send_message(self, token: str) -> dict:
+        with self._lock:
+            if token != self.current_token:
+                return {"errcode": 40001, "errmsg": "invalid credential, access_token is invalid or not latest"}
+            self.messages_sent += 1
+            return {"errcode": 0, "errmsg": "ok"}
+
+    def inject_fault(
+        self,
+        status: int = 503,
+        count: int = 1,
+        retry_after: Optional[float] = None,
+        hang: float = 0.0,
+    ) -> None:
+        """
+        接下来 count 个对话请求注入故障（count < 0 表示一直持续到 clear_faults()）。
+        status 非 0 时返回该状态码（可带 Retry-After 头）；hang > 0 时先卡住这么多秒，
+        status 为 0 则卡完照常返回（模拟慢响应 / 超时）
+        """
+        with self._lock:
+            self._fault = {"status": status, "count": count, "retry_after": retry_after, "hang": hang}
+
+    def clear_faults(self) -> None:
+        with self._lock:
+            self._fault = None
+
+    def take_fault(self) -> Optional[dict]:
+        with self._lock:
+            fault = self._fault
+            if fault is None:
+                return None
+            if fault["count"] > 0:
+                fault["count"] -= 1
+                if fault["count"] == 0:
+                    self._fault = None
+            self.faults_served += 1
+            return dict(fault)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "tokens_issued": self.tokens_issued,
+                "messages_sent": self.messages_sent,
+                "faults_served": self.faults_served,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+            self.tokens_issued = 0
+            self.messages_sent = 0
+            self.faults_served = 0
+            self._prefix_cache.clear()
+
+    def prefix_cache_lookup(self, req: dict) -> tuple:
+        """
+        返回 (命中字数, 未命中字数)：从头开始最长的、之前请求里出现过的消息前缀算命中，
+        然后把本次请求的所有前缀记下来。真实服务按 64 token 块缓存，这里按消息粒度近似。
+        """
+        messages = req.get("messages", [])
+        digest = hashlib.sha256()
+        prefixes, lengths = [], []
+        for m in messages:
+            content = m.get("content") or ""
+            digest.update(f"{m.get('role')}\x00{content}\x01".encode("utf-8"))
+            prefixes.append(digest.copy().hexdigest())
+            lengths.append(len(content))
+
+        with self._lock:
+            hit_chars = 0
+            for key, length in zip(prefixes, lengths):
+                if key not in self._prefix_cache:
+                    break
+                hit_chars += length
+            if len(self._prefix_cache) > 200000:
+                self._prefix_cache.clear()
+            self._prefix_cache.update(prefixes)
+        return hit_chars, sum(lengths) - hit_chars
+
+    def prefill_delay(self, req: dict, miss_chars: Optional[int] = None) -> float:
+        """只有未命中缓存的部分需要预填充"""
+        if self.prefill_ms_per_1k <= 0:
+            return 0.0
+        if miss_chars is None:
+            miss_chars = sum(len(m.get("content") or "") for m in req.get("messages", []))
+        return miss_chars / 1000 * self.prefill_ms_per_1k / 1000
+
+    def request_latency(self) -> float:
+        if self.slow_rate > 0 and random.random() < self.slow_rate:
+            return self.slow_latency
+        return self.latency
+
+    def reply_for(self, req: dict) -> str:
+        return self.responder(req) if self.responder is not None else self.reply
+
+    def generation_delay(self, req: Optional[dict] = None) -> float:
+        reply = self.reply_for(req) if req is not None else self.reply
+        return self.line_latency * len(reply.split("\n"))
+
+    def _usage(self, req: dict, hit_chars: int, miss_chars: Optional[int]) -> dict:
+        prompt_chars = sum(len(m.get("content") or "") for m in req.get("messages", []))
+        if miss_chars is None:
+            miss_chars = prompt_chars - hit_chars
+        reply = self.reply_for(req)
+        return {
+            "prompt_tokens": prompt_chars,
+            "completion_tokens": len(reply),
+            "total_tokens": prompt_chars + len(reply),
+            "prompt_cache_hit_tokens": hit_chars,
+            "prompt_cache_miss_tokens": miss_chars,
+        }
+
+    def stream_events(self, req: dict, hit_chars: int = 0, miss_chars: Optional[int] = None):
+        """流式回复：依次产出 chunk（dict）和要等待的秒数（float），每行先等 line_latency 再发"""
+        base = {
+            "id": f"chatcmpl-stub-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": req.get("model", "stub"),
+        }
+        lines = self.reply_for(req).split("\n")
+        for i, line in enumerate(lines):
+            if self.line_latency > 0:
+                yield self.line_latency
+            text = line + ("\n" if i < len(lines) - 1 else "")
+            for j in range(0, len(text), self.chunk_chars):
+                delta = {"content": text[j:j + self.chunk_chars]}
+                yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if (req.get("stream_options") or {}).get("include_usage"):
+            yield {**base, "choices": [], "usage": self._usage(req, hit_chars, miss_chars)}
+
+    def completion(self, req: dict, hit_chars: int = 0, miss_chars: Optional[int] = None) -> dict:
+        return {
+            "id": f"chatcmpl-stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply_for(req)},
+                "finish_reason": "stop",
+            }],
+            "usage": self._usage(req, hit_chars, miss_chars),
+        }
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 stub 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求的模拟延迟（秒）")
+    parser.add_argument("--line-latency", type=float, default=0.0, help="每生成一行回复的耗时（秒）")
+    args = parser.parse_args()
+
+    stub = StubLLMServer(host=args.host, port=args.port, latency=args.latency, line_latency=args.line_latency)
+    print(f"[stub] 监听 {stub.base_url}（Ctrl+C 退出）")
+    try:
+        stub._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+200 轮模拟对话的每轮 prompt token 轨迹：只截断 / 不截断 / 滚动摘要 三种历史策略对比。
+
+DeepSeek 指向本地 stub（摘要请求也打到 stub，返回固定文本）。默认每轮结束后
+等后台摘要任务做完再进下一轮，让轨迹可复现；--no-drain 则按真实情况异步进行。
+
+用法：
+  python benchmarks/trace_history_summary.py
+  python benchmarks/trace_history_summary.py --turns 200 --threshold 1000 --every 10
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot_core import QingqingBot
+from example_retriever import approx_tokens
+from history_backend import MemoryHistoryBackend
+from stub_llm_server import StubLLMServer
+
+OPENERS = ["今天", "刚才", "昨天晚上", "等会儿", "周末"]
+TOPICS = [
+    "去食堂吃了麻辣烫，辣到怀疑人生", "实验室的离心机又坏了", "室友半夜打游戏好吵",
+    "被导师抓去改了一下午报告", "路上看到一只超可爱的橘猫", "羽毛球馆又约不到场地",
+    "外卖小哥送错了楼", "期中考试成绩出来了还行", "想去看那个新上的电影",
+]
+
+
+def _token_counter():
+    try:
+        import tiktoken
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(enc.encode(text)), "tiktoken"
+    except Exception:  # 没装，或者离线下载不了 BPE 文件
+        return approx_tokens, "估算"
+
+
+def trace(label: str, bot: QingqingBot, turns: int, drain: bool, count, seed: int):
+    rng = random.Random(seed)
+    user_id = f"trace-{label}"
+    totals, convs = [], []
+    for _ in range(turns):
+        user_input = f"{rng.choice(OPENERS)}{rng.choice(TOPICS)}"
+        messages = bot._build_messages(user_input, bot.get_history(user_id), bot.get_summary(user_id))
+        totals.append(sum(count(m["content"]) for m in messages))
+        # 去掉第一条固定 system prompt 之后的部分（摘要 + 历史 + 本轮）
+        convs.append(sum(count(m["content"]) for m in messages[1:]))
+        bot.reply(user_input, user_id=user_id)
+        if drain and bot.summarizer is not None:
+            bot.summarizer.drain(timeout=30)
+    return totals, convs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="滚动摘要 prompt token 轨迹")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=1000, help="摘要触发阈值（token）")
+    parser.add_argument("--every", type=int, default=10, help="每隔多少轮打印一次")
+    parser.add_argument("--no-drain", action="store_true")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    count, counter_name = _token_counter()
+    config = os.path.join(ROOT, "config", "styles.json")
+    with StubLLMServer(reply="哈哈哈哈哈哈\n是嘛\n那你现在还好吗") as stub:
+        os.environ["DEEPSEEK_BASE_URL"] = stub.base_url
+        os.environ["DEEPSEEK_API_KEY"] = "sk-stub"
+
+        def make(max_rounds: int, threshold: int) -> QingqingBot:
+            return QingqingBot(
+                config_path=config, example_top_k=0, max_rounds=max_rounds,
+                history_backend=MemoryHistoryBackend(), summary_token_threshold=threshold,
+            )
+
+        bots = [
+            ("截断8轮", make(8, 0)),
+            ("不截断", make(args.turns, 0)),
+            # 和截断一样是默认的 8 轮上限，挤出去的轮次折叠进摘要
+            ("滚动摘要8轮", make(8, args.threshold)),
+        ]
+        results = [(label, *trace(label, bot, args.turns, not args.no_drain, count, args.seed))
+                   for label, bot in bots]
+
+    print(f"\ntoken 计数方式: {counter_name}（括号里是去掉固定 system prompt 后的对话部分）\n")
+    print("轮次  " + "".join(f"{label:>22}" for label, _, _ in results))
+    for i in range(args.every - 1, args.turns, args.every):
+        row = "".join(f"{totals[i]:>13} ({convs[i]:>5})  " for _, totals, convs in results)
+        print(f"{i + 1:>4}  {row}")
+    print("最大  " + "".join(f"{max(t):>13} ({max(c):>5})  " for _, t, c in results))
+    summary_bot = bots[-1][1]
+    print(f"\n滚动摘要统计: {summary_bot.summarizer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,31 @@
 核心机器人逻辑 — 供 CLI (main.py) 和企业微信 (wecom_bot.py) 共用。
 负责加载聊天样本、构建 prompt、调用 DeepSeek API。
 支持两种人格：QingqingBot（晴晴）和 JokerBot（数字分身）。
+两者都提供同步 reply()（CLI / Flask 线程用）和异步 areply()（事件循环用），
+以及边生成边按行吐出的 reply_stream() / areply_stream()。
 """
+import asyncio
 import os
-from typing import Dict, List, Optional
-
-from openai import OpenAI
+import threading
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from chat_parser import parse_chat_file, conversations_to_example_text
-from prompt_builder import load_styles, build_messages, build_system_prompt
+from prompt_builder import load_styles, build_messages, examples_digest, invalidate_prompt_cache
 from joker_prompt_builder import build_joker_messages
+from llm_client import get_async_client, get_client
+from llm_resilience import get_breaker, retry_policy
+from llm_hedge import LLM_HEDGE, get_hedger
+from example_retriever import ExampleRetriever, build_query
+from usage_stats import prompt_cache_stats
+from session_store import Turn, unpack_history
+from history_backend import HistoryBackend, make_history_backend
+from history_summary import SUMMARY_PROMPT, HistorySummarizer, format_dialogue
+from token_budget import PROMPT_TOKEN_BUDGET, TokenBudgeter, count_tokens
+from greeting_cache import GreetingCache
+
+if TYPE_CHECKING:
+    from llm_router import LLMRouter
 
 
 def load_dotenv(path: str = ".env") -> None:
@@ -35,17 +51,168 @@ def call_deepseek(
     max_tokens: int,
     base_url: str,
     api_key: str,
+    deadline: Optional[float] = None,
+    hedge: Optional[bool] = None,
 ) -> str:
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=max_tokens,
-    )
+    """
+    超时 / 429 / 5xx 会在 deadline（默认 LLM_CALL_DEADLINE）内退避重试；
+    该服务商熔断中时直接抛 CircuitOpenError。
+    hedge: 慢于近期延迟分位时补发一个相同请求（默认看 LLM_HEDGE）
+    """
+    client = get_client(base_url, api_key)
+
+    def request():
+        return retry_policy.call(
+            lambda timeout: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            ),
+            breaker=get_breaker(base_url),
+            deadline=deadline,
+        )
+
+    if LLM_HEDGE if hedge is None else hedge:
+        response = get_hedger(base_url, model).call(request)
+    else:
+        response = request()
+    prompt_cache_stats.record(getattr(response, "usage", None))
+    return response.choices[0].message.content.strip()
+
+
+async def call_deepseek_async(
+    messages: List[Dict],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    base_url: str,
+    api_key: str,
+    deadline: Optional[float] = None,
+    hedge: Optional[bool] = None,
+) -> str:
+    """call_deepseek 的 asyncio 版本，成千上万个会话可以复用同一个事件循环"""
+    client = get_async_client(base_url, api_key)
+
+    def request():
+        return retry_policy.acall(
+            lambda timeout: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            ),
+            breaker=get_breaker(base_url),
+            deadline=deadline,
+        )
+
+    if LLM_HEDGE if hedge is None else hedge:
+        response = await get_hedger(base_url, model).acall(request)
+    else:
+        response = await request()
+    prompt_cache_stats.record(getattr(response, "usage", None))
     return response.choices[0].message.content.strip()
 
 
+def _split_lines(text: str) -> List[str]:
+    """整段回复切成一条条消息（去掉首尾空白、跳过空行），和 _LineBuffer 流式切出来的一致"""
+    return [l.strip() for l in text.split("\n") if l.strip()]
+
+
+class _LineBuffer:
+    """把流式返回的增量文本切成整行：遇到换行才吐出一行（去掉首尾空白、跳过空行）"""
+
+    def __init__(self):
+        self._tail = ""
+
+    def feed(self, delta: str) -> List[str]:
+        if "\n" not in delta:
+            self._tail += delta
+            return []
+        text, _, self._tail = (self._tail + delta).rpartition("\n")
+        return _split_lines(text)
+
+    def close(self) -> List[str]:
+        tail, self._tail = self._tail.strip(), ""
+        return [tail] if tail else []
+
+
+def _stream_kwargs(model: str, temperature: float, max_tokens: int) -> Dict:
+    return {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+        # 最后一个 chunk 带 usage，前缀缓存命中率照常统计
+        "stream_options": {"include_usage": True},
+    }
+
+
+def _chunk_delta(chunk) -> str:
+    if not chunk.choices:
+        return ""
+    return getattr(chunk.choices[0].delta, "content", None) or ""
+
+
+def stream_deepseek(
+    messages: List[Dict],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    base_url: str,
+    api_key: str,
+) -> Iterator[str]:
+    """
+    call_deepseek 的流式版本：每生成完一整行就 yield 一行，不用等整段回复。
+    只有建立流（拿到响应头）这一步会重试：已经发出去的行没法撤回，中途断了不能重来
+    """
+    client = get_client(base_url, api_key)
+    kwargs = _stream_kwargs(model, temperature, max_tokens)
+    stream = retry_policy.call(
+        lambda timeout: client.chat.completions.create(messages=messages, timeout=timeout, **kwargs),
+        breaker=get_breaker(base_url),
+    )
+    lines = _LineBuffer()
+    usage = None
+    for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        delta = _chunk_delta(chunk)
+        if delta:
+            yield from lines.feed(delta)
+    prompt_cache_stats.record(usage)
+    yield from lines.close()
+
+
+async def astream_deepseek(
+    messages: List[Dict],
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    base_url: str,
+    api_key: str,
+) -> AsyncIterator[str]:
+    """stream_deepseek 的 asyncio 版本"""
+    client = get_async_client(base_url, api_key)
+    kwargs = _stream_kwargs(model, temperature, max_tokens)
+    stream = await retry_policy.acall(
+        lambda timeout: client.chat.completions.create(messages=messages, timeout=timeout, **kwargs),
+        breaker=get_breaker(base_url),
+    )
+    lines = _LineBuffer()
+    usage = None
+    async for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        delta = _chunk_delta(chunk)
+        if delta:
+            for line in lines.feed(delta):
+                yield line
+    prompt_cache_stats.record(usage)
+    for line in lines.close():
+        yield line
+
+
 def find_chat_samples(base_dir: str = ".") -> str:
     candidates = [
         os.path.join(base_dir, "chat_samples_副本.txt"),
@@ -58,7 +225,265 @@ def find_chat_samples(base_dir: str = ".") -> str:
     return ""
 
 
-class QingqingBot:
+# 历史超过多少 token 开始滚动摘要（默认 0 = 关闭，只保留最近 max_rounds 轮）。
+# 开了 prompt 里的历史也不会超过 max_rounds 轮：到了上限要挤出去的轮次先折叠进摘要
+SUMMARY_TOKEN_THRESHOLD = int(os.getenv("HISTORY_SUMMARY_TOKENS", "0"))
+
+# 样本文件 mtime 检查间隔（秒），避免每条回复都 stat 一次
+SAMPLES_CHECK_INTERVAL = 5.0
+
+
+class _SampleFiles:
+    """记录一组样本文件的 mtime，隔一段时间检查一次有没有被修改 / 新建 / 删除"""
+
+    def __init__(self, paths: Sequence[str], check_interval: float = SAMPLES_CHECK_INTERVAL):
+        self.paths = [p for p in paths if p]
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtimes = self._snapshot()
+        self._next_check = time.monotonic() + check_interval
+
+    def _snapshot(self) -> Tuple[Optional[float], ...]:
+        return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in self.paths)
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            if now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            snapshot = self._snapshot()
+            if snapshot == self._mtimes:
+                return False
+            self._mtimes = snapshot
+            return True
+
+
+class _ChatBotBase:
+    """两种人格共用的部分：会话历史管理 + 同步/异步回复流程。子类只负责拼 messages。"""
+
+    model: str
+    temperature: float
+    max_tokens: int
+    max_rounds: int
+    api_key: str
+    base_url: str
+    _histories: HistoryBackend
+    summarizer: Optional[HistorySummarizer] = None
+    budgeter: Optional[TokenBudgeter] = None
+    router: Optional["LLMRouter"] = None
+    greeting_cache: Optional[GreetingCache] = None
+
+    def _build_messages(self, user_input: str, history: List[Dict], summary: str = "") -> List[Dict]:
+        raise NotImplementedError
+
+    def _cache_scope(self) -> str:
+        """寒暄缓存按人格 + 当前风格分开存"""
+        raise NotImplementedError
+
+    def _init_summarizer(self, token_threshold: int) -> None:
+        """
+        token_threshold > 0 且保留历史时开启滚动摘要。prompt 里的历史始终不超过 max_rounds 轮；
+        历史到了这个上限就折叠（不等 token 阈值），要被挤出去的轮次先进摘要再删
+        """
+        limit = max(self.max_rounds, 0) * 2
+        if token_threshold > 0 and limit > 0:
+            self.summarizer = HistorySummarizer(
+                self._summarize, token_threshold=token_threshold, token_counter=count_tokens,
+                # 折叠后留一半以内，不然到了上限之后每轮都要折叠一次
+                keep_recent=min(6, limit // 4 * 2), fold_messages=limit,
+                # 摘要还没写好时存下来的原始历史可以超过 max_rounds 轮，这是摘要一直失败时的兜底
+                max_messages=max(limit * 2, 100),
+            )
+
+    def _summarize(self, old_summary: str, turns: Sequence[Turn]) -> str:
+        """把旧摘要和要折叠的消息压成新摘要（在摘要线程里跑）"""
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=self.summarizer.max_chars,
+            summary=old_summary or "（无）",
+            dialogue=format_dialogue(turns),
+        )
+        kwargs = self._llm_kwargs()
+        kwargs.update(temperature=0.3, max_tokens=400)
+        # 后台任务，不在回复路径上，不需要对冲
+        return call_deepseek(messages=[{"role": "user", "content": prompt}], hedge=False, **kwargs)
+
+    def _complete(self, messages: List[Dict]) -> str:
+        """配了路由就在多个后端之间选，否则直接调 DeepSeek"""
+        if self.router is not None:
+            return self.router.complete(messages, self.temperature, self.max_tokens)
+        return call_deepseek(messages=messages, **self._llm_kwargs())
+
+    async def _acomplete(self, messages: List[Dict]) -> str:
+        if self.router is not None:
+            return await self.router.acomplete(messages, self.temperature, self.max_tokens)
+        return await call_deepseek_async(messages=messages, **self._llm_kwargs())
+
+    def _stream_lines(self, messages: List[Dict]) -> Iterator[str]:
+        if self.router is not None:
+            return self.router.stream_lines(messages, self.temperature, self.max_tokens)
+        return stream_deepseek(messages=messages, **self._llm_kwargs())
+
+    def _astream_lines(self, messages: List[Dict]) -> AsyncIterator[str]:
+        if self.router is not None:
+            return self.router.astream_lines(messages, self.temperature, self.max_tokens)
+        return astream_deepseek(messages=messages, **self._llm_kwargs())
+
+    def _cached_greeting(self, user_input: str, user_id: str, history: List[Dict]) -> Tuple[Optional[str], Optional[str]]:
+        """(缓存命中的回复, 未命中时写回用的 key)，没开缓存时都是 None"""
+        if self.greeting_cache is None:
+            return None, None
+        return self.greeting_cache.lookup(self._cache_scope(), user_id, user_input, history)
+
+    def _reply_messages(self, user_input: str, user_id: str, history: List[Dict], cache_key: Optional[str]) -> List[Dict]:
+        """
+        要写进寒暄缓存的回复会发给同 scope 的所有用户，只用这句寒暄本身生成，
+        不带这个用户的历史和摘要，免得把一个人的私人上下文发给别人
+        """
+        if cache_key is not None:
+            return self._build_messages(user_input, [], "")
+        return self._build_messages(user_input, history, self.get_summary(user_id))
+
+    def _cache_greeting(self, key: Optional[str], answer: str, started: float) -> None:
+        if key is not None:
+            self.greeting_cache.store(self._cache_scope(), key, answer, time.monotonic() - started)
+
+    def _llm_kwargs(self) -> Dict:
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "base_url": self.base_url,
+            "api_key": self.api_key,
+        }
+
+    def _history_limit(self) -> int:
+        """prompt 里最多带多少条历史消息：max_rounds 轮是硬上限，开了摘要也一样"""
+        return max(self.max_rounds, 0) * 2
+
+    def _store_limit(self) -> int:
+        """后端最多存多少条：开了摘要时还没折叠进摘要的轮次先留着，不随上限截掉"""
+        if self.summarizer is not None:
+            return self.summarizer.max_messages
+        return self._history_limit()
+
+    def _stored_turns(self, user_id: str) -> Tuple[Turn, ...]:
+        return self._histories.load(user_id, self._store_limit())
+
+    def get_history(self, user_id: str) -> List[Dict]:
+        limit = self._history_limit()
+        if limit <= 0:
+            return []
+        return unpack_history(self._stored_turns(user_id)[-limit:])
+
+    def get_summary(self, user_id: str) -> str:
+        return self.summarizer.get(user_id) if self.summarizer is not None else ""
+
+    def clear_history(self, user_id: str) -> None:
+        self._histories.clear(user_id)
+        if self.summarizer is not None:
+            self.summarizer.reset(user_id)
+
+    async def aget_history(self, user_id: str) -> List[Dict]:
+        # 热层没有时要查库，放到线程里，别卡住事件循环
+        if self._histories.is_hot(user_id):
+            return self.get_history(user_id)
+        return await asyncio.to_thread(self.get_history, user_id)
+
+    async def aclear_history(self, user_id: str) -> None:
+        self.clear_history(user_id)
+
+    def _remember(self, user_id: str, user_input: str, answer: str) -> None:
+        """把本轮问答追加到历史（后端负责取最新历史再追加，避免并发回复互相覆盖）"""
+        self._histories.append(
+            user_id,
+            (Turn("user", user_input), Turn("assistant", answer)),
+            keep=self._store_limit(),
+        )
+        if self.summarizer is not None:
+            # 超过阈值或到了上限就在后台把旧轮次折叠进摘要，不阻塞这轮回复
+            self.summarizer.maybe_schedule(
+                user_id, self._stored_turns(user_id), self._histories.drop_folded, reload=self._stored_turns,
+            )
+
+    def session_stats(self) -> Dict:
+        """当前在内存里的会话数 / 淘汰数 / 摘要情况（给 /health 看）"""
+        stats = self._histories.stats()
+        if self.summarizer is not None:
+            stats["summary"] = self.summarizer.stats()
+        if self.budgeter is not None:
+            stats["prompt_budget"] = self.budgeter.stats()
+        if self.router is not None:
+            stats["router"] = self.router.stats()
+        if self.greeting_cache is not None:
+            stats["greeting_cache"] = self.greeting_cache.stats()
+        return stats
+
+    def reply(self, user_input: str, user_id: str = "default") -> str:
+        """生成回复并自动维护会话历史（阻塞版，给 CLI 和线程模型的服务用）"""
+        history = self.get_history(user_id)
+        answer, cache_key = self._cached_greeting(user_input, user_id, history)
+        if answer is None:
+            messages = self._reply_messages(user_input, user_id, history, cache_key)
+            started = time.monotonic()
+            answer = self._complete(messages)
+            self._cache_greeting(cache_key, answer, started)
+        self._remember(user_id, user_input, answer)
+        return answer
+
+    async def areply(self, user_input: str, user_id: str = "default") -> str:
+        """reply() 的异步版本：等待 DeepSeek 时不占线程"""
+        history = await self.aget_history(user_id)
+        answer, cache_key = self._cached_greeting(user_input, user_id, history)
+        if answer is None:
+            messages = self._reply_messages(user_input, user_id, history, cache_key)
+            started = time.monotonic()
+            answer = await self._acomplete(messages)
+            self._cache_greeting(cache_key, answer, started)
+        self._remember(user_id, user_input, answer)
+        return answer
+
+    def reply_stream(self, user_input: str, user_id: str = "default") -> Iterator[str]:
+        """边生成边按行 yield（服务端拿到一行就发一行）；整段生成完才写进历史"""
+        history = self.get_history(user_id)
+        cached, cache_key = self._cached_greeting(user_input, user_id, history)
+        if cached is not None:
+            yield from _split_lines(cached)
+            self._remember(user_id, user_input, cached)
+            return
+        messages = self._reply_messages(user_input, user_id, history, cache_key)
+        started = time.monotonic()
+        lines = []
+        for line in self._stream_lines(messages):
+            lines.append(line)
+            yield line
+        answer = "\n".join(lines)
+        self._cache_greeting(cache_key, answer, started)
+        self._remember(user_id, user_input, answer)
+
+    async def areply_stream(self, user_input: str, user_id: str = "default") -> AsyncIterator[str]:
+        """reply_stream() 的异步版本"""
+        history = await self.aget_history(user_id)
+        cached, cache_key = self._cached_greeting(user_input, user_id, history)
+        if cached is not None:
+            for line in _split_lines(cached):
+                yield line
+            self._remember(user_id, user_input, cached)
+            return
+        messages = self._reply_messages(user_input, user_id, history, cache_key)
+        started = time.monotonic()
+        lines = []
+        async for line in self._astream_lines(messages):
+            lines.append(line)
+            yield line
+        answer = "\n".join(lines)
+        self._cache_greeting(cache_key, answer, started)
+        self._remember(user_id, user_input, answer)
+
+
+class QingqingBot(_ChatBotBase):
     """晴晴机器人核心：加载样本 + 管理会话历史 + 生成回复"""
 
     def __init__(
@@ -70,12 +495,30 @@ class QingqingBot:
         temperature: float = 0.85,
         max_tokens: int = 100,
         max_rounds: int = 8,
+        example_top_k: int = 8,
+        example_token_budget: int = 2000,
+        history_backend: Optional[HistoryBackend] = None,
+        summary_token_threshold: int = SUMMARY_TOKEN_THRESHOLD,
+        prompt_token_budget: int = PROMPT_TOKEN_BUDGET,
+        router: Optional["LLMRouter"] = None,
+        greeting_cache: Optional[GreetingCache] = None,
     ):
+        """
+        example_top_k: 每轮按相关度检索多少段示例对话；<= 0 时退回旧行为，把全部样本塞进 prompt
+        example_token_budget: 每轮检索示例的 token 上限
+        history_backend: 历史对话存储，默认按 HISTORY_DB 环境变量选（SQLite / 内存）
+        summary_token_threshold: 历史超过多少 token 就把旧轮次折叠成摘要，0 表示关闭
+        prompt_token_budget: 单次请求输入 token 上限，超了先裁示例再裁最早的历史，0 表示不限
+        router: 多后端路由（llm_router.make_router），None 时直接调 DeepSeek
+        greeting_cache: 短寒暄的回复缓存（greeting_cache.make_greeting_cache），None 时不缓存
+        """
         self.tag = tag
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.max_rounds = max_rounds
+        self.example_top_k = example_top_k
+        self.example_token_budget = example_token_budget
 
         # 环境变量
         self.api_key = os.getenv("DEEPSEEK_API_KEY", "")
@@ -84,19 +527,31 @@ class QingqingBot:
         # 加载风格配置
         self.styles = load_styles(config_path)
 
-        # 加载聊天样本
+        # 加载聊天样本（文件被修改后会自动重新加载）
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        samples_path = chat_samples_path or find_chat_samples(base_dir)
+        self._samples_path = chat_samples_path or find_chat_samples(base_dir)
+        self._generated_path = os.path.join(base_dir, "chat_samples_generated.txt")
+        self._reload_lock = threading.Lock()
+        self._load_samples()
+        self._sample_files = _SampleFiles([self._samples_path, self._generated_path])
+
+        # 每个用户独立的对话历史（内存热层有 LRU / 闲置 / 内存上限，可选 SQLite 持久化）
+        self._histories = history_backend if history_backend is not None else make_history_backend()
+        self._init_summarizer(summary_token_threshold)
+        self.budgeter = TokenBudgeter(prompt_token_budget)
+        self.router = router
+        self.greeting_cache = greeting_cache
+
+    def _load_samples(self) -> None:
         all_conversations = []
 
-        if samples_path and os.path.exists(samples_path):
-            real_convs = parse_chat_file(samples_path)
+        if self._samples_path and os.path.exists(self._samples_path):
+            real_convs = parse_chat_file(self._samples_path)
             all_conversations.extend(real_convs)
             print(f"[bot_core] 已加载 {len(real_convs)} 条真实对话")
 
-        generated_path = os.path.join(base_dir, "chat_samples_generated.txt")
-        if os.path.exists(generated_path):
-            gen_convs = parse_chat_file(generated_path)
+        if os.path.exists(self._generated_path):
+            gen_convs = parse_chat_file(self._generated_path)
             all_conversations.extend(gen_convs)
             print(f"[bot_core] 已加载 {len(gen_convs)} 条生成对话")
 
@@ -105,55 +560,70 @@ class QingqingBot:
             total_chars = len(self.chat_examples_text)
             print(
                 f"[bot_core] 共 {len(all_conversations)} 条对话"
-                f"（约 {total_chars} 字 / ~{int(total_chars * 1.5)} tokens）"
+                f"（约 {total_chars} 字 / {count_tokens(self.chat_examples_text)} tokens）"
             )
         else:
             self.chat_examples_text = ""
             print("[bot_core] 未找到聊天记录文件，将使用纯 prompt 模式")
+        self.examples_key = examples_digest(self.chat_examples_text)
 
-        # 每个用户独立的对话历史 {user_id: [messages]}
-        self._histories: Dict[str, List[Dict]] = {}
-
-    def _cap_history(self, history: List[Dict]) -> List[Dict]:
-        if self.max_rounds <= 0:
-            return []
-        max_items = self.max_rounds * 2
-        return history[-max_items:]
-
-    def get_history(self, user_id: str) -> List[Dict]:
-        return self._histories.get(user_id, [])
-
-    def clear_history(self, user_id: str) -> None:
-        self._histories.pop(user_id, None)
-
-    def reply(self, user_input: str, user_id: str = "default") -> str:
-        """生成回复并自动维护会话历史"""
-        history = self.get_history(user_id)
+        self.conversations = all_conversations
+        self.retriever: Optional[ExampleRetriever] = None
+        if all_conversations and self.example_top_k > 0:
+            self.retriever = ExampleRetriever(all_conversations, token_counter=count_tokens)
+            print(
+                f"[bot_core] 示例检索已开启：每轮取最相关的 {self.example_top_k} 段"
+                f"（≤{self.example_token_budget} tokens）"
+            )
 
-        messages = build_messages(
+    def reload_samples_if_changed(self) -> bool:
+        """样本文件改过就重新加载，并让旧示例对应的 system prompt 缓存失效"""
+        if not self._sample_files.changed():
+            return False
+        with self._reload_lock:
+            old_key = self.examples_key
+            print("[bot_core] 检测到样本文件变化，重新加载")
+            self._load_samples()
+            if old_key != self.examples_key:
+                invalidate_prompt_cache(old_key)
+        return True
+
+    def select_examples(self, user_input: str, history: Optional[List[Dict]] = None) -> str:
+        """本轮要放进 prompt 的示例文本：检索模式下按相关度挑，否则用全部样本"""
+        if self.retriever is None:
+            return self.chat_examples_text
+        convs = self.retriever.select(
+            build_query(user_input, history),
+            top_k=self.example_top_k,
+            token_budget=self.example_token_budget,
+        )
+        return conversations_to_example_text(convs)
+
+    def _cache_scope(self) -> str:
+        return f"qingqing:{self.tag}"
+
+    def _build_messages(self, user_input: str, history: List[Dict], summary: str = "") -> List[Dict]:
+        self.reload_samples_if_changed()
+        # 全量样本每轮都一样，放 system prompt 里吃前缀缓存；
+        # 检索出的示例每轮都变，放到消息末尾，不打断前面的缓存前缀
+        if self.retriever is None:
+            static_examples, static_key = self.chat_examples_text, self.examples_key
+            turn_examples = ""
+        else:
+            static_examples, static_key = "", ""
+            turn_examples = self.select_examples(user_input, history)
+        return build_messages(
             user_input=user_input,
             styles=self.styles,
             tag_key=self.tag,
-            chat_examples_text=self.chat_examples_text,
+            chat_examples_text=static_examples,
             history=history,
+            turn_examples_text=turn_examples,
+            examples_key=static_key,
+            summary=summary,
+            budgeter=self.budgeter,
         )
 
-        answer = call_deepseek(
-            messages=messages,
-            model=self.model,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            base_url=self.base_url,
-            api_key=self.api_key,
-        )
-
-        # 更新历史
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": answer})
-        self._histories[user_id] = self._cap_history(history)
-
-        return answer
-
 
 # ──────────────────────────────────────────────────────────────────
 # JokerBot — 数字分身
@@ -169,7 +639,7 @@ JOKER_CHAT_SOURCES = {
 }
 
 
-class JokerBot:
+class JokerBot(_ChatBotBase):
     """Joker 数字分身：多风格聊天 + 会话历史管理"""
 
     def __init__(
@@ -180,6 +650,11 @@ class JokerBot:
         temperature: float = 0.90,
         max_tokens: int = 150,
         max_rounds: int = 10,
+        history_backend: Optional[HistoryBackend] = None,
+        summary_token_threshold: int = SUMMARY_TOKEN_THRESHOLD,
+        prompt_token_budget: int = PROMPT_TOKEN_BUDGET,
+        router: Optional["LLMRouter"] = None,
+        greeting_cache: Optional[GreetingCache] = None,
     ):
         self.style_tag = style_tag
         self.model = model
@@ -191,24 +666,35 @@ class JokerBot:
         self.api_key = os.getenv("DEEPSEEK_API_KEY", "")
         self.base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
 
-        # 按风格加载聊天样本
+        # 按风格加载聊天样本 {tag: 示例文本}，以及对应的内容 hash 和文件 mtime
         self._examples_cache: Dict[str, str] = {}
+        self._examples_keys: Dict[str, str] = {}
+        self._example_files: Dict[str, _SampleFiles] = {}
         self._load_examples(style_tag)
 
-        self._histories: Dict[str, List[Dict]] = {}
+        self._histories = history_backend if history_backend is not None else make_history_backend()
+        self._init_summarizer(summary_token_threshold)
+        self.budgeter = TokenBudgeter(prompt_token_budget)
+        self.router = router
+        self.greeting_cache = greeting_cache
         print(f"[JokerBot] 初始化完成 | 风格={style_tag} | 模型={model}")
 
-    def _load_examples(self, tag: str) -> None:
+    def _load_examples(self, tag: str, force: bool = False) -> None:
         """加载指定风格的聊天样本"""
-        if tag in self._examples_cache:
+        if tag in self._examples_cache and not force:
             return
+        self._read_examples(tag)
+        self._examples_keys[tag] = examples_digest(self._examples_cache[tag])
 
+    def _read_examples(self, tag: str) -> None:
         source_file = JOKER_CHAT_SOURCES.get(tag)
         if not source_file:
             self._examples_cache[tag] = ""
             return
 
         path = os.path.join(self.profile_dir, source_file)
+        if tag not in self._example_files:
+            self._example_files[tag] = _SampleFiles([path])
         if not os.path.exists(path):
             print(f"[JokerBot] 警告：找不到聊天记录 {path}")
             self._examples_cache[tag] = ""
@@ -232,45 +718,35 @@ class JokerBot:
         self._load_examples(new_tag)
         print(f"[JokerBot] 风格切换为: {new_tag}")
 
-    def _cap_history(self, history: List[Dict]) -> List[Dict]:
-        if self.max_rounds <= 0:
-            return []
-        max_items = self.max_rounds * 2
-        return history[-max_items:]
-
-    def get_history(self, user_id: str) -> List[Dict]:
-        return self._histories.get(user_id, [])
-
-    def clear_history(self, user_id: str) -> None:
-        self._histories.pop(user_id, None)
-
-    def reply(self, user_input: str, user_id: str = "default") -> str:
-        """生成 Joker 风格的回复"""
-        history = self.get_history(user_id)
-        examples = self._examples_cache.get(self.style_tag, "")
-
-        messages = build_joker_messages(
+    def reload_examples_if_changed(self, tag: str) -> bool:
+        """当前风格的聊天记录文件改过就重新加载，并让旧的 system prompt 缓存失效"""
+        files = self._example_files.get(tag)
+        if files is None or not files.changed():
+            return False
+        old_key = self._examples_keys.get(tag)
+        print(f"[JokerBot] 检测到聊天记录变化，重新加载 ({tag})")
+        self._load_examples(tag, force=True)
+        if old_key != self._examples_keys[tag]:
+            invalidate_prompt_cache(old_key)
+        return True
+
+    def _cache_scope(self) -> str:
+        return f"joker:{self.style_tag}"
+
+    def _build_messages(self, user_input: str, history: List[Dict], summary: str = "") -> List[Dict]:
+        """按当前风格拼 Joker 的 messages"""
+        tag = self.style_tag
+        self.reload_examples_if_changed(tag)
+        return build_joker_messages(
             user_input=user_input,
-            style_tag=self.style_tag,
-            chat_examples_text=examples,
+            style_tag=tag,
+            chat_examples_text=self._examples_cache.get(tag, ""),
             history=history,
+            examples_key=self._examples_keys.get(tag),
+            summary=summary,
+            budgeter=self.budgeter,
         )
 
-        answer = call_deepseek(
-            messages=messages,
-            model=self.model,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            base_url=self.base_url,
-            api_key=self.api_key,
-        )
-
-        history.append({"role": "user", "content": user_input})
-        history.append({"role": "assistant", "content": answer})
-        self._histories[user_id] = self._cap_history(history)
-
-        return answer
-
 
 # ── Joker 聊天记录解析 ────────────────────────────────────────────
 
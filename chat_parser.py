@@ -145,4 +145,5 @@ if __name__ == "__main__":
     # 生成示例文本并统计字符数
     text = conversations_to_example_text(convs)
     print(f"\n示例文本总字符数: {len(text)}")
-    print(f"预估 token 数: ~{int(len(text) * 1.5)}")
+    from token_budget import count_tokens
+    print(f"token 数: {count_tokens(text)}")
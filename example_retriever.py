@@ -0,0 +1,119 @@
+"""
+Few-shot 示例检索 — 按当前对话挑最相关的几段聊天记录，而不是把全部样本塞进 system prompt。
+
+之前 QingqingBot 把 chat_samples 里所有对话拼成 chat_examples_text，每次请求都带着，
+不管对方说了什么都是几千 token。这里对 parse_chat_file 解析出的对话建一个进程内
+BM25 索引：
+  - 中文不分词，直接用字 unigram + bigram 作为 term（对短句微信聊天足够好）
+  - 英文/数字按连续串切
+  - 查询 = 当前用户输入 + 最近几轮用户消息
+  - 按 BM25 分数从高到低取对话，直到 top_k 条或 token 预算用完
+"""
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Conversation = List[Dict[str, str]]
+
+_ASCII_RUN = re.compile(r"[a-z0-9]+")
+_CJK = re.compile(r"[㐀-鿿]")
+
+
+def approx_tokens(text: str) -> int:
+    """粗估 token 数（和 chat_parser 里的估算口径一致）"""
+    return int(len(text) * 1.5)
+
+
+def tokenize(text: str) -> List[str]:
+    """字 unigram + bigram（只在连续汉字内部取 bigram），外加英文/数字串"""
+    text = text.lower()
+    terms: List[str] = _ASCII_RUN.findall(text)
+    prev = ""
+    for ch in text:
+        if _CJK.match(ch):
+            terms.append(ch)
+            if prev:
+                terms.append(prev + ch)
+            prev = ch
+        else:
+            prev = ""
+    return terms
+
+
+class ExampleRetriever:
+    """对话级 BM25 索引"""
+
+    def __init__(
+        self,
+        conversations: Sequence[Conversation],
+        k1: float = 1.2,
+        b: float = 0.75,
+        token_counter: Callable[[str], int] = approx_tokens,
+    ):
+        self.conversations = list(conversations)
+        self.k1 = k1
+        self.b = b
+        self.token_counter = token_counter
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_len: List[int] = []
+        self._doc_tokens: List[int] = []
+        for doc_id, conv in enumerate(self.conversations):
+            text = "\n".join(m["content"] for m in conv)
+            tf = Counter(tokenize(text))
+            for term, count in tf.items():
+                self._postings[term].append((doc_id, count))
+            self._doc_len.append(sum(tf.values()))
+            self._doc_tokens.append(self.token_counter(text))
+
+        n = len(self.conversations)
+        self._avg_len = (sum(self._doc_len) / n) if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.conversations)
+
+    def search(self, query: str, top_n: Optional[int] = None) -> List[Tuple[int, float]]:
+        """返回 [(对话下标, 分数)]，按分数降序，只含分数 > 0 的"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term, qtf in Counter(tokenize(query)).items():
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / (self._avg_len or 1))
+                scores[doc_id] += qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranked[:top_n] if top_n else ranked
+
+    def select(self, query: str, top_k: int = 8, token_budget: int = 2000) -> List[Conversation]:
+        """取最相关的对话，总 token 不超过预算；一条都没命中时按原顺序补几条兜底"""
+        ranked = [doc_id for doc_id, _ in self.search(query)]
+        if len(ranked) < top_k:
+            hit = set(ranked)
+            ranked += [i for i in range(len(self.conversations)) if i not in hit]
+
+        chosen: List[int] = []
+        used = 0
+        for doc_id in ranked:
+            cost = self._doc_tokens[doc_id]
+            if used + cost > token_budget:
+                continue
+            chosen.append(doc_id)
+            used += cost
+            if len(chosen) >= top_k:
+                break
+        return [self.conversations[i] for i in chosen]
+
+
+def build_query(user_input: str, history: Optional[List[Dict]] = None, context_turns: int = 2) -> str:
+    """检索查询：当前输入 + 最近几条对方消息（接话时上下文也很重要）"""
+    parts = [user_input]
+    if history:
+        recent_user = [m.get("content", "") for m in history if m.get("role") == "user"]
+        parts.extend(recent_user[-context_turns:])
+    return "\n".join(parts)
@@ -11,6 +11,12 @@ Phase 2: 用 DeepSeek 生成 Joker 风格的合成训练数据。
   python generate_joker.py                    # 默认生成 100 条
   python generate_joker.py --count 200        # 生成 200 条
   python generate_joker.py --style brother    # 只生成 brother 风格
+  python generate_joker.py --cache --seed 7   # 开缓存：同样参数重跑直接读缓存，不再调 API
+  python generate_joker.py --concurrency 16 --rpm 300 --tpm 300000   # 并发 + 限流
+  python generate_joker.py --batch-size 5     # 一次请求生成 5 段，省掉重复的人物设定 token
+
+生成过程中逐条追加到 --output 旁边的 .jsonl 检查点（崩了重跑从最后一条完整记录接着来），
+跑完再整理成 --output 的 JSON 数组。
 """
 import argparse
 import json
@@ -18,10 +24,15 @@ import os
 import random
 import sys
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 from bot_core import load_dotenv, call_deepseek
 from joker_prompt_builder import build_joker_system_prompt
+from generation_engine import RateLimiter, imap_ordered
+from json_extract import extract_json_array
+from jsonl_store import JsonlWriter, append_to_json_array, finalize_json, read_jsonl, recover_jsonl
+from response_cache import RESPONSE_CACHE_PATH, ResponseCache, cache_key
+from token_budget import count_tokens
 
 
 # ── 场景模板 ─────────────────────────────────────────────────────
@@ -275,6 +286,40 @@ GENERATION_PROMPT_SHORT = """你是一个对话生成器。根据人物设定和
 ```"""
 
 
+GENERATION_PROMPT_BATCH = """你是一个对话生成器。根据人物设定，为下面每个场景各生成一段自然的微信聊天对话。
+
+【人物设定】
+{persona_summary}
+
+【场景列表】
+{scenarios}
+
+【生成要求】
+1. 每个场景单独一段对话，场景之间互不相关，人物和事件不要串
+2. 对话要自然、口语化，像真实微信聊天
+3. "雨中的马孔多"（Joker）的回复必须严格遵循人物设定的说话风格，每条消息极短，一句话拆多条发
+4. 每段的轮数按场景后括号里的要求（一个人说一次算一轮，连续多条算同一轮）
+5. 对方的消息也要自然，不要太刻意
+6. 如果涉及个人信息（专业/学校/身高等），Joker 的回答必须与设定一致
+
+【输出格式】
+严格按以下 JSON 格式输出一个数组，每个场景一个元素，id 是场景编号，不要加任何其他文字：
+```json
+[
+  {{"id": 1, "conversation": [
+    {{"from": "human", "value": "对方的消息（多条用\\n分隔）"}},
+    {{"from": "gpt", "value": "Joker的回复（多条用\\n分隔）"}}
+  ]}},
+  ...
+]
+```"""
+
+# 批量模式里每个场景后面的长度要求（对应单条模式的两个模板）
+BATCH_LENGTH_HINT = {
+    "daily": "极短的日常闲聊，2-4 轮，每条 3-15 字，不要编造复杂的背景或剧情",
+    "default": "6-12 轮，每条 3-10 字",
+}
+
 PERSONA_SUMMARY = """雨中的马孔多（Joker），男，在加拿大[学校]数学系读MF（Mathematical Finance）。INFP。
 身高180，体重180（自嘲胖了），健身每次半途而废。咸豆腐脑党。
 
@@ -307,14 +352,88 @@ PERSONA_SUMMARY = """雨中的马孔多（Joker），男，在加拿大[学校]
 - 被问个人信息时回答要准确（专业是MF不是别的）"""
 
 
+GENERATOR_SYSTEM = "你是一个专业的对话数据生成器。只输出JSON，不要输出其他任何内容。"
+
+
+def _request(
+    messages: List[Dict],
+    params: Dict,
+    api_key: str,
+    base_url: str,
+    model: str,
+    cache: Optional[ResponseCache],
+    key: Optional[str],
+    limiter: Optional[RateLimiter],
+) -> Tuple[str, bool]:
+    """查缓存 / 限流 / 调 DeepSeek，返回 (原始回复, 是否来自缓存)；写缓存由调用方在校验通过后做"""
+    raw = cache.get(key) if cache is not None else None
+    if raw is not None:
+        return raw, True
+    if limiter is not None:
+        prompt_tokens = sum(count_tokens(m["content"]) for m in messages)
+        limiter.acquire(prompt_tokens + params["max_tokens"])
+    raw = call_deepseek(
+        messages=messages,
+        model=model,
+        base_url=base_url,
+        api_key=api_key,
+        # 800 token 的长生成，比聊天回复的默认时限放宽
+        deadline=120,
+        **params,
+    )
+    if limiter is not None:
+        limiter.refund(params["max_tokens"] - count_tokens(raw))
+    return raw, False
+
+
+def _valid_turn(turn) -> bool:
+    """human / gpt 的非空消息"""
+    return (
+        isinstance(turn, dict) and turn.get("from") in ("human", "gpt")
+        and isinstance(turn.get("value"), str) and bool(turn["value"].strip())
+    )
+
+
+def _salvage_turns(turns: List) -> List[Dict]:
+    """
+    截断 / 中间坏了的对话：保留第一条不合格的消息之前的部分，去掉结尾没有回复的 human，
+    剩下不到一问一答时返回 []
+    """
+    kept = []
+    for turn in turns:
+        if not _valid_turn(turn):
+            break
+        kept.append({"from": turn["from"], "value": turn["value"]})
+    while kept and kept[-1]["from"] != "gpt":
+        kept.pop()
+    return kept if len(kept) >= 2 else []
+
+
+def parse_conversation(raw: str) -> Tuple[List[Dict], bool]:
+    """单条模式的回复 → (对话, 是否完整)；回复前后的多余文字忽略，截断时保留完整的轮次"""
+    turns, complete = extract_json_array(raw, objects_only=True)
+    conv = _salvage_turns(turns)
+    return conv, complete and len(conv) == len(turns)
+
+
 def generate_one(
     scenario: str,
     style: str,
     api_key: str,
     base_url: str,
     model: str = "deepseek-chat",
+    cache: Optional[ResponseCache] = None,
+    sample: Union[int, str] = 0,
+    limiter: Optional[RateLimiter] = None,
 ) -> List[Dict]:
-    """生成一条合成对话"""
+    """
+    生成一条合成对话
+
+    cache: 传了就先按 (model, messages, 采样参数, sample) 查缓存，
+           只有解析成功的结果才写回缓存
+    sample: 第几条样本（缓存 key 的一部分，温度 > 0 时区分同一 prompt 的多次采样）
+    limiter: 真要发请求时才占 RPM / TPM 配额（命中缓存不占）
+    """
     template = GENERATION_PROMPT_SHORT if style == "daily" else GENERATION_PROMPT
     prompt = template.format(
         persona_summary=PERSONA_SUMMARY,
@@ -322,36 +441,101 @@ def generate_one(
     )
 
     messages = [
-        {"role": "system", "content": "你是一个专业的对话数据生成器。只输出JSON，不要输出其他任何内容。"},
+        {"role": "system", "content": GENERATOR_SYSTEM},
         {"role": "user", "content": prompt},
     ]
 
-    try:
-        raw = call_deepseek(
-            messages=messages,
-            model=model,
-            temperature=0.95,
-            max_tokens=800,
-            base_url=base_url,
-            api_key=api_key,
-        )
-
-        # 提取 JSON
-        raw = raw.strip()
-        if raw.startswith("```"):
-            lines = raw.split("\n")
-            lines = [l for l in lines if not l.strip().startswith("```")]
-            raw = "\n".join(lines)
+    params = {"temperature": 0.95, "max_tokens": 800}
+    key = cache_key(model, messages, params, sample) if cache is not None else None
 
-        conv = json.loads(raw)
-        if isinstance(conv, list) and len(conv) >= 2:
+    try:
+        raw, from_cache = _request(messages, params, api_key, base_url, model, cache, key, limiter)
+        conv, complete = parse_conversation(raw)
+        if conv:
+            if not complete:
+                print(f"  [修复] 回复截断或有坏消息，保留前 {len(conv)} 条")
+            if cache is not None and not from_cache:
+                cache.put(key, raw, model=model)
             return conv
+        print(f"  [解析失败] {raw[:60]!r}")
     except Exception as e:
         print(f"  [错误] {e}")
 
     return []
 
 
+def _split_batch(raw: str, n: int) -> List[Optional[List[Dict]]]:
+    """
+    按 id 把批量回复拆成 n 段对话，缺失 / 格式不对的位置是 None。
+    回复被截断时前面完整的段照样用，写了一半的那段不要（下一轮单独重试）
+    """
+    out: List[Optional[List[Dict]]] = [None] * n
+    items, _ = extract_json_array(raw, objects_only=True)
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        idx = item.get("id")
+        if not isinstance(idx, int) or not 1 <= idx <= n or out[idx - 1] is not None:
+            continue
+        turns = item.get("conversation")
+        if isinstance(turns, list):
+            out[idx - 1] = _salvage_turns(turns) or None
+    return out
+
+
+def generate_batch(
+    items: Sequence[Tuple[str, str]],
+    api_key: str,
+    base_url: str,
+    model: str = "deepseek-chat",
+    cache: Optional[ResponseCache] = None,
+    sample: Union[int, str] = 0,
+    limiter: Optional[RateLimiter] = None,
+    retries: int = 2,
+) -> List[List[Dict]]:
+    """
+    一次请求生成多段对话（人物设定只发一次），返回和 items [(style, scenario)] 一一对应的结果，
+    失败的位置是 []。回复里格式不对 / 缺失的条目单独再请求，最多 retries 轮。
+    """
+    results: List[List[Dict]] = [[] for _ in items]
+    todo = list(range(len(items)))
+    for attempt in range(retries + 1):
+        if not todo:
+            break
+        prompt = GENERATION_PROMPT_BATCH.format(
+            persona_summary=PERSONA_SUMMARY,
+            scenarios="\n".join(
+                f"{k}. {items[i][1]}（{BATCH_LENGTH_HINT['daily' if items[i][0] == 'daily' else 'default']}）"
+                for k, i in enumerate(todo, 1)
+            ),
+        )
+        messages = [
+            {"role": "system", "content": GENERATOR_SYSTEM},
+            {"role": "user", "content": prompt},
+        ]
+        params = {"temperature": 0.95, "max_tokens": min(8000, 800 * len(todo))}
+        key = cache_key(model, messages, params, f"{sample}/{attempt}") if cache is not None else None
+
+        try:
+            raw, from_cache = _request(messages, params, api_key, base_url, model, cache, key, limiter)
+        except Exception as e:
+            print(f"  [错误] {e}")
+            continue
+        convs = _split_batch(raw, len(todo))
+        if cache is not None and not from_cache and any(convs):
+            cache.put(key, raw, model=model)
+        failed = []
+        for i, conv in zip(todo, convs):
+            if conv is None:
+                failed.append(i)
+            else:
+                results[i] = conv
+        if failed:
+            print(f"  [批量] {len(todo)} 段里 {len(failed)} 段格式不对，" + ("重试" if attempt < retries else "放弃"))
+        todo = failed
+    return results
+
+
 def main():
     parser = argparse.ArgumentParser(description="生成 Joker 合成训练数据")
     parser.add_argument("--count", type=int, default=100, help="本次生成条数")
@@ -360,6 +544,16 @@ def main():
     parser.add_argument("--output", default="./training_data/sft-joker-synthetic.json")
     parser.add_argument("--append-to", default=None,
                         help="追加到已有数据文件（如 sft-joker-balanced.json），生成结果也单独存 --output")
+    parser.add_argument("--cache", nargs="?", const=RESPONSE_CACHE_PATH, default=None,
+                        help=f"开启生成结果缓存（可指定路径，默认 {RESPONSE_CACHE_PATH}）")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="随机种子（daily 风格的随机分配 + 缓存 key），固定后重跑结果完全一致")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在跑的生成请求数")
+    parser.add_argument("--rpm", type=float, default=0, help="每分钟请求数上限（0 不限）")
+    parser.add_argument("--tpm", type=float, default=0,
+                        help="每分钟 token 上限（0 不限；按 prompt + max_tokens 预扣，回复后退回差额）")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="每次请求生成几段对话（人物设定只发一次，格式不对的条目单独重试），默认 1")
     args = parser.parse_args()
 
     load_dotenv()
@@ -370,6 +564,10 @@ def main():
         print("缺少 DEEPSEEK_API_KEY", file=sys.stderr)
         sys.exit(1)
 
+    if args.seed is not None:
+        random.seed(args.seed)
+    cache = ResponseCache(args.cache) if args.cache else None
+
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
 
     if args.style and args.style not in SCENARIOS:
@@ -387,96 +585,143 @@ def main():
         for s in scenarios:
             all_scenarios.append((style, s))
 
-    # 断点续传
-    results = []
-    if os.path.exists(args.output):
+    # 断点续传：检查点是输出文件旁边的 .jsonl，每条追加一行，结束时再整理成 JSON 数组
+    checkpoint = os.path.splitext(args.output)[0] + ".jsonl"
+    if not os.path.exists(checkpoint) and os.path.exists(args.output):
+        # 旧版本只留了 JSON 数组：转成检查点再接着生成
         try:
             with open(args.output, "r", encoding="utf-8") as f:
-                results = json.load(f)
-            print(f"[续传] 已加载 {len(results)} 条，从 {len(results)+1} 继续")
+                previous = json.load(f)
         except Exception:
-            results = []
+            previous = []
+        with JsonlWriter(checkpoint) as writer:
+            for item in previous:
+                writer.append(item)
+    generated = recover_jsonl(checkpoint)
+    if generated:
+        print(f"[续传] 已加载 {generated} 条，从 {generated+1} 继续")
 
     total = args.count
-    generated = len(results)
 
     if generated >= total:
         print(f"已有 {generated} 条 >= 目标 {total}，无需继续")
+        finalize_json(checkpoint, args.output)
         return
 
     remaining = total - generated
     print(f"目标: {total} 条 | 已完成: {generated} | 剩余: {remaining}")
     print(f"风格: {args.style or '全部'} | 场景数: {len(all_scenarios)}")
 
-    start_offset = generated % len(all_scenarios)
+    print(f"并发: {args.concurrency} | 每次请求 {args.batch_size} 段 | 限流: RPM {args.rpm or '不限'} / TPM {args.tpm or '不限'}")
+
+    limiter = RateLimiter(rpm=args.rpm, tpm=args.tpm)
     errors_in_row = 0
     MAX_ERRORS = 10
 
-    while generated < total:
-        for i, (style, scenario) in enumerate(all_scenarios):
-            if generated >= total:
-                break
-            if start_offset > 0:
-                if i < start_offset:
-                    continue
-                start_offset = 0
-
-            print(f"  [{generated+1}/{total}] {style}: {scenario[:30]}...", end=" ", flush=True)
-
-            conv_turns = generate_one(
+    resumed_from = generated
+
+    batch_size = max(1, args.batch_size)
+
+    def jobs():
+        # 第 j 个任务用第 j % 场景数 个场景；续传从已完成条数接着排，和串行时的起点一致。
+        # 每 batch_size 个任务打成一批，一次请求生成
+        j = resumed_from
+        while True:
+            batch = []
+            for k in range(j, j + batch_size):
+                style, scenario = all_scenarios[k % len(all_scenarios)]
+                batch.append((k, style, scenario))
+            yield batch
+            j += batch_size
+
+    def work(batch):
+        # 任务序号作为缓存 key：同样的 --seed 重跑、续传补跑都按同样的位置命中缓存
+        j = batch[0][0]
+        sample = j if args.seed is None else f"{args.seed}:{j}"
+        if batch_size == 1:
+            _, style, scenario = batch[0]
+            return [generate_one(
                 scenario=scenario, style=style,
                 api_key=api_key, base_url=base_url, model=args.model,
-            )
-
-            if conv_turns:
-                actual_style = style
-                if style == "daily":
-                    actual_style = random.choice(["brother", "female_friend", "crush", "ex", "default"])
-                system_prompt = build_joker_system_prompt(style_tag=actual_style, chat_examples_text="")
-                full_conv = [{"from": "system", "value": system_prompt}] + conv_turns
-                results.append({
-                    "conversations": full_conv,
-                    "style": actual_style,
-                    "source": f"synthetic_daily_{scenario[:20]}",
-                })
-                generated += 1
-                errors_in_row = 0
-                print("OK")
-
-                if generated % 10 == 0:
-                    with open(args.output, "w", encoding="utf-8") as f:
-                        json.dump(results, f, ensure_ascii=False, indent=2)
-                    print(f"  [saved {generated}]")
-            else:
-                errors_in_row += 1
-                print("SKIP")
-                if errors_in_row >= MAX_ERRORS:
-                    print(f"\n连续 {MAX_ERRORS} 次失败，保存退出")
-                    break
+                cache=cache, sample=sample, limiter=limiter,
+            )]
+        return generate_batch(
+            [(style, scenario) for _, style, scenario in batch],
+            api_key=api_key, base_url=base_url, model=args.model,
+            cache=cache, sample=sample, limiter=limiter,
+        )
 
-            time.sleep(0.5)
+    def more(in_flight: int) -> bool:
+        # 已完成 + 在跑的够目标条数了就先不提交，有失败的再补
+        return generated + in_flight * batch_size < total and errors_in_row < MAX_ERRORS
 
-        if errors_in_row >= MAX_ERRORS:
-            break
+    started = time.monotonic()
+
+    def throughput() -> float:
+        elapsed = time.monotonic() - started
+        return (generated - resumed_from) / elapsed * 60 if elapsed > 0 else 0.0
+
+    # 结果按任务顺序交回：落盘顺序、续传位置、连续失败计数都和串行时一样
+    stop = False
+    with JsonlWriter(checkpoint, fsync_every=10) as writer:
+        for batch, convs, error in imap_ordered(work, jobs(), args.concurrency, more):
+            for (j, style, scenario), conv_turns in zip(batch, convs or [[]] * len(batch)):
+                if generated >= total:
+                    stop = True
+                    break
+                label = f"  [{generated+1}/{total}] {style}: {scenario[:30]}..."
+
+                if conv_turns:
+                    actual_style = style
+                    if style == "daily":
+                        actual_style = random.choice(["brother", "female_friend", "crush", "ex", "default"])
+                    system_prompt = build_joker_system_prompt(style_tag=actual_style, chat_examples_text="")
+                    full_conv = [{"from": "system", "value": system_prompt}] + conv_turns
+                    writer.append({
+                        "conversations": full_conv,
+                        "style": actual_style,
+                        "source": f"synthetic_daily_{scenario[:20]}",
+                    })
+                    generated += 1
+                    errors_in_row = 0
+                    print(f"{label} OK")
+
+                    # writer 每 10 条 fsync 一次
+                    if generated % 10 == 0:
+                        print(f"  [saved {generated}] {throughput():.1f} 条/分钟")
+                else:
+                    errors_in_row += 1
+                    print(f"{label} SKIP" + (f" ({error})" if error else ""))
+                    if errors_in_row >= MAX_ERRORS:
+                        print(f"\n连续 {MAX_ERRORS} 次失败，保存退出")
+                        stop = True
+                        break
+            if stop:
+                break
 
-    # 保存生成结果
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    # 检查点整理成 ShareGPT JSON 数组（逐行拷贝，不整体加载）
+    finalize_json(checkpoint, args.output)
 
-    print(f"\n本次生成: {len(results)} 条 → {args.output}")
+    print(f"\n本次生成: {generated} 条 → {args.output}（检查点 {checkpoint}）")
+    usage = limiter.stats()
+    per_sample = usage["tokens"] / (generated - resumed_from) if generated > resumed_from else 0
+    print(f"[吞吐] 耗时 {time.monotonic() - started:.1f}s | {throughput():.1f} 条/分钟 | "
+          f"{per_sample:.0f} token/条（估算） | 限流 {usage}")
+    if cache is not None:
+        print(f"[cache] {cache.stats()}")
 
     # 如果指定了 --append-to，合并到已有数据
+    # （只改 base 文件尾部的 `]`，不把整个数据集读进来再写回去）
     if args.append_to and os.path.exists(args.append_to):
-        with open(args.append_to, "r", encoding="utf-8") as f:
-            base_data = json.load(f)
-        base_data.extend(results)
-        with open(args.append_to, "w", encoding="utf-8") as f:
-            json.dump(base_data, f, ensure_ascii=False, indent=2)
-        print(f"已追加到 {args.append_to}，总计: {len(base_data)} 条")
+        added = append_to_json_array(checkpoint, args.append_to)
+        if added is None:
+            print(f"{args.append_to} 不是 JSON 数组，未追加", file=sys.stderr)
+        else:
+            print(f"已追加 {added} 条到 {args.append_to}")
 
     # 统计
     from collections import Counter
-    dist = Counter(item["style"] for item in results)
+    dist = Counter(item["style"] for item in read_jsonl(checkpoint))
     print(f"本次风格分布: {dict(dist)}")
 
 
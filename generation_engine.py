@@ -0,0 +1,141 @@
+"""
+离线数据生成的并发引擎 — generate_joker 不再一条一条地调 DeepSeek、中间再睡 0.5 秒。
+
+  - imap_ordered(fn, jobs, concurrency, more)：线程池里最多同时跑 concurrency 个任务，
+    结果按提交顺序交回（落盘顺序、续传位置、连续失败计数都和串行时一样），
+    more(in_flight) 返回 False 时暂停提交，例如「已完成 + 在跑的已经够目标条数了」
+  - RateLimiter(rpm, tpm)：两个令牌桶，每次请求前按「prompt + max_tokens」预扣 token，
+    拿到回复后把多扣的退回去；0 表示不限。桶里最多攒 burst 秒的配额，
+    刚启动时不会一下子把整分钟的额度打出去
+  - 调用方在 fn 里自己 acquire()，命中缓存之类不发请求的任务不占配额
+
+用法：
+  limiter = RateLimiter(rpm=300, tpm=200_000)
+  for job, result, error in imap_ordered(work, jobs, concurrency=8):
+      ...
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class TokenBucket:
+    """每秒补 rate 个令牌、最多攒 capacity 个（线程安全，acquire 阻塞等待）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n: float = 1.0) -> float:
+        """
+        拿 n 个令牌，不够就睡到够为止，返回等了多少秒。
+        n 超过 capacity 时等桶满再拿（余额变负，后面的请求替它还），不会永远等下去
+        """
+        need = min(n, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= need:
+                    self._tokens -= n
+                    return waited
+                delay = (need - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def refund(self, n: float) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + n)
+
+
+class RateLimiter:
+    """RPM + TPM 两个令牌桶"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, burst: float = 5.0):
+        """burst: 桶容量，按几秒的配额算"""
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst)) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst)) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.tokens = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """发请求前调用：占一个请求名额 + 预扣 tokens 个 token"""
+        waited = 0.0
+        if self._requests is not None:
+            waited += self._requests.acquire(1)
+        if self._tokens is not None and tokens > 0:
+            waited += self._tokens.acquire(tokens)
+        with self._lock:
+            self.acquired += 1
+            self.tokens += tokens
+            self.waited_seconds += waited
+
+    def refund(self, tokens: int) -> None:
+        """实际用量比预扣的少，退回差额（不限 TPM 时也记账，tokens 是实际用量的估算）"""
+        if tokens <= 0:
+            return
+        with self._lock:
+            self.tokens -= tokens
+        if self._tokens is not None:
+            self._tokens.refund(tokens)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "requests": self.acquired,
+                "tokens": self.tokens,
+                "waited_s": round(self.waited_seconds, 1),
+            }
+
+
+def imap_ordered(
+    fn: Callable[[T], R],
+    jobs: Iterable[T],
+    concurrency: int = 8,
+    more: Optional[Callable[[int], bool]] = None,
+) -> Iterator[Tuple[T, Optional[R], Optional[BaseException]]]:
+    """
+    并发跑 fn(job)，按 jobs 的顺序 yield (job, 结果, 异常)。
+    jobs 可以是无限迭代器；more(in_flight) 返回 False 时先不提交新任务，
+    等交回一个结果后再问一次，一个都不在跑且 more() 仍为 False 就结束。
+    调用方提前 break 时，还没开始的任务会被取消，正在跑的等它跑完。
+    """
+    jobs = iter(jobs)
+    pending: Deque[Tuple[T, Future]] = deque()
+    exhausted = False
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="gen")
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency and (more is None or more(len(pending))):
+                try:
+                    job = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((job, pool.submit(fn, job)))
+            if not pending:
+                return
+            job, future = pending.popleft()
+            error = future.exception()
+            yield job, (future.result() if error is None else None), error
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
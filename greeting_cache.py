@@ -0,0 +1,235 @@
+"""
+高频寒暄回复缓存 — 「在嘛」「晚安」「早」「哈哈哈」不再每条都走一次完整的 many-shot 请求。
+
+线上很大一部分消息是这种短、不依赖上下文的寒暄（generate_1000.py 的 quick_exchanges
+就是典型），每条都要带着几千 token 的示例去调 DeepSeek。GreetingCache 在调 LLM 之前查一下：
+  - 归一化：NFKC、小写、去标点 / 表情 / [旺柴] 这类表情码，连续重复字压到两个
+    （哈哈哈哈哈 → 哈哈），吗 / 么 统一成 嘛
+  - 先按归一化文本精确查，查不到再按字 unigram + bigram 的 Dice 相似度找最像的 key
+    （早 ≈ 早早、晚安 ≈ 晚安安），低于 similarity 不算
+  - 每个 key 攒 variants 个不同的回复，攒满之前照常调 LLM 并把回复收进来；攒满后随机
+    挑一个，另外有 refresh 的概率仍去调 LLM 换掉最旧的一条，保持回复有变化
+  - 每条回复 ttl 秒后过期
+  - 绕过：归一化后超过 max_chars 字、带数字 / 链接、纯表情；该用户 idle 秒内说过话
+    （对话进行中，「哈哈哈」多半是在接上一句）；上一条是我们发的问句（短消息是在回答它）
+  - 按 scope（人格 + 风格）分开存，晴晴和 Joker 的回复不会串
+  - 池子是同 scope 所有用户共用的：攒回复时 bot 只拿这句寒暄本身去生成（不带该用户的
+    历史和摘要），缓存里不会有某个用户的私人上下文
+
+环境变量：
+  GREETING_CACHE            1 开启（默认 0，不开）
+  GREETING_CACHE_TTL        回复过期秒数（默认 21600，6 小时）
+  GREETING_CACHE_VARIANTS   每个 key 攒几条回复（默认 5）
+  GREETING_CACHE_MAX_CHARS  只缓存归一化后不超过这么多字的消息（默认 8）
+  GREETING_CACHE_IDLE       用户多少秒没说话才算新开话头（默认 600）
+"""
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+GREETING_CACHE = os.getenv("GREETING_CACHE", "0") == "1"
+GREETING_CACHE_TTL = float(os.getenv("GREETING_CACHE_TTL", "21600"))
+GREETING_CACHE_VARIANTS = int(os.getenv("GREETING_CACHE_VARIANTS", "5"))
+GREETING_CACHE_MAX_CHARS = int(os.getenv("GREETING_CACHE_MAX_CHARS", "8"))
+GREETING_CACHE_IDLE = float(os.getenv("GREETING_CACHE_IDLE", "600"))
+
+_EMOTE = re.compile(r"\[[^\[\]]{1,6}\]")
+_NON_WORD = re.compile(r"[\W_]+")
+_REPEAT = re.compile(r"(.)\1{2,}")
+_CONTEXTUAL = re.compile(r"\d|https?://|www\.", re.IGNORECASE)
+_PARTICLES = str.maketrans({"吗": "嘛", "么": "嘛", "麽": "嘛"})
+_QUESTION_END = ("?", "？", "嘛", "吗")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _EMOTE.sub("", text)
+    text = _NON_WORD.sub("", text)
+    text = _REPEAT.sub(r"\1\1", text)
+    return text.translate(_PARTICLES)
+
+
+def ngrams(text: str) -> FrozenSet[str]:
+    """字 unigram + bigram"""
+    return frozenset(text) | frozenset(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def dice(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class _Pool:
+    """一个 key 下攒的几条回复 [(回复, 写入时间)]"""
+
+    __slots__ = ("grams", "variants")
+
+    def __init__(self, grams: FrozenSet[str]):
+        self.grams = grams
+        self.variants: List[Tuple[str, float]] = []
+
+    def fresh(self, now: float, ttl: float) -> List[Tuple[str, float]]:
+        self.variants = [v for v in self.variants if now - v[1] < ttl]
+        return self.variants
+
+
+class GreetingCache:
+    """短寒暄的回复池（线程安全）"""
+
+    def __init__(
+        self,
+        ttl: float = GREETING_CACHE_TTL,
+        variants: int = GREETING_CACHE_VARIANTS,
+        max_chars: int = GREETING_CACHE_MAX_CHARS,
+        idle: float = GREETING_CACHE_IDLE,
+        similarity: float = 0.6,
+        refresh: float = 0.1,
+        max_reply_chars: int = 60,
+        max_keys: int = 2000,
+        max_users: int = 100_000,
+    ):
+        """
+        similarity: 精确查不到时，相似度不低于这个值才借用别的 key
+        refresh: 回复池攒满后仍去调 LLM 换新回复的概率
+        max_reply_chars: LLM 回复超过这么长就不收（寒暄不该回这么多，多半是接了上下文）
+        max_keys / max_users: key 数和「最近说话时间」表的上限，超了按 LRU 淘汰
+        """
+        self.ttl = ttl
+        self.variants = variants
+        self.max_chars = max_chars
+        self.idle = idle
+        self.similarity = similarity
+        self.refresh = refresh
+        self.max_reply_chars = max_reply_chars
+        self.max_keys = max_keys
+        self.max_users = max_users
+
+        self._pools: Dict[str, "OrderedDict[str, _Pool]"] = {}
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.fills = 0
+        self.refreshes = 0
+        self.bypassed: Dict[str, int] = {"long": 0, "contextual": 0, "active": 0, "question": 0}
+        self.llm_seconds = 0.0
+        self.llm_calls = 0
+
+    # ── 查 ──
+
+    def _bypass_reason(self, text: str, norm: str, user_id: str, history: List[Dict], now: float) -> Optional[str]:
+        if not norm or len(norm) > self.max_chars:
+            return "long"
+        if _CONTEXTUAL.search(text):
+            return "contextual"
+        last = self._last_seen.get(user_id)
+        if last is not None and now - last < self.idle:
+            return "active"
+        if history and history[-1]["role"] == "assistant" and history[-1]["content"].rstrip().endswith(_QUESTION_END):
+            return "question"
+        return None
+
+    def _touch_user(self, user_id: str, now: float) -> None:
+        self._last_seen[user_id] = now
+        self._last_seen.move_to_end(user_id)
+        while len(self._last_seen) > self.max_users:
+            self._last_seen.popitem(last=False)
+
+    def _find(self, pools: "OrderedDict[str, _Pool]", norm: str, grams: FrozenSet[str]) -> Optional[str]:
+        if norm in pools:
+            return norm
+        # key 都很短、每个 scope 最多 max_keys 个，直接线性扫
+        best, best_score = None, self.similarity
+        for key, pool in pools.items():
+            score = dice(grams, pool.grams)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def lookup(self, scope: str, user_id: str, text: str, history: List[Dict]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        返回 (命中的回复, 写回用的 key)：
+          命中 → (回复, None)；该攒回复 → (None, key)，LLM 回复后调 store(scope, key, ...)；
+          不该走缓存 → (None, None)
+        """
+        now = time.time()
+        norm = normalize(text)
+        with self._lock:
+            self.lookups += 1
+            reason = self._bypass_reason(text, norm, user_id, history, now)
+            self._touch_user(user_id, now)
+            if reason is not None:
+                self.bypassed[reason] += 1
+                return None, None
+
+            pools = self._pools.setdefault(scope, OrderedDict())
+            key = self._find(pools, norm, ngrams(norm))
+            if key is None:
+                self.fills += 1
+                return None, norm
+            pools.move_to_end(key)
+            fresh = pools[key].fresh(now, self.ttl)
+            if len(fresh) < self.variants:
+                self.fills += 1
+                return None, key
+            if random.random() < self.refresh:
+                self.refreshes += 1
+                return None, key
+            self.hits += 1
+            if key != norm:
+                self.fuzzy_hits += 1
+            return random.choice(fresh)[0], None
+
+    # ── 写 ──
+
+    def store(self, scope: str, key: str, reply: str, latency: float) -> None:
+        """把这次 LLM 回复收进 key 的回复池；latency 是这次 LLM 调用的耗时"""
+        reply = reply.strip()
+        now = time.time()
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += latency
+            if not reply or len(reply) > self.max_reply_chars:
+                return
+            pools = self._pools.setdefault(scope, OrderedDict())
+            pool = pools.get(key)
+            if pool is None:
+                pool = pools[key] = _Pool(ngrams(key))
+                while len(pools) > self.max_keys:
+                    pools.popitem(last=False)
+            pools.move_to_end(key)
+            # 重复的回复也收：池子里的分布跟着模型自己的分布走
+            variants = pool.fresh(now, self.ttl)
+            variants.append((reply, now))
+            if len(variants) > self.variants:
+                variants.sort(key=lambda v: v[1])
+                del variants[0]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            avg_llm = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "fuzzy_hits": self.fuzzy_hits,
+                "fills": self.fills,
+                "refreshes": self.refreshes,
+                "bypassed": dict(self.bypassed),
+                "keys": sum(len(p) for p in self._pools.values()),
+                "avg_llm_ms": round(avg_llm * 1000),
+                "latency_saved_ms": round(self.hits * avg_llm * 1000),
+            }
+
+
+def make_greeting_cache() -> Optional[GreetingCache]:
+    """按 GREETING_CACHE 环境变量决定开不开"""
+    return GreetingCache() if GREETING_CACHE else None
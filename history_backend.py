@@ -0,0 +1,361 @@
+"""
+历史对话存储后端 — QingqingBot / JokerBot 可插拔。
+
+  MemoryHistoryBackend   只放内存（SessionStore），重启就没了，CLI / 测试用
+  SQLiteHistoryBackend   SQLite（WAL 模式）持久化，前面挡一层内存热数据：
+    - 热层：SessionStore（LRU + 闲置 TTL），命中时读写都不碰磁盘
+    - 懒加载：用户第一次发消息（热层没有）才按 user_id 索引查最近几轮
+    - 批量写：append 只进热层 + 待写队列，后台线程每 flush_interval 秒
+      （或攒够 batch_size 条）在一个事务里 executemany 落盘，顺带裁掉超出的旧轮次
+    - 被淘汰出热层、但还没落盘的用户，下次读之前会先同步 flush，不会读到旧数据
+
+bot 服务用 make_history_backend() 按环境变量选择：
+  HISTORY_DB   SQLite 文件路径，不设则用内存后端
+"""
+import atexit
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from session_store import History, SessionStore, Turn, history_store
+
+HISTORY_DB = os.getenv("HISTORY_DB", "")
+
+
+class HistoryBackend:
+    """历史后端接口：按 user_id 取最近几轮、追加一轮、清空"""
+
+    def load(self, user_id: str, limit: int) -> History:
+        """最近 limit 条消息（按时间正序）"""
+        raise NotImplementedError
+
+    def append(self, user_id: str, turns: Sequence[Turn], keep: int) -> None:
+        """追加若干条消息，只保留最近 keep 条"""
+        raise NotImplementedError
+
+    def clear(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def drop_folded(self, user_id: str, folded: Sequence[Turn]) -> None:
+        """
+        删掉已经折叠进摘要的那几条。按对象身份认，不按条数：摘要在后台生成期间
+        又有新轮次追加、旧轮次被截断，条数早就对不上了
+        """
+        raise NotImplementedError
+
+    def is_hot(self, user_id: str) -> bool:
+        """读这个用户的历史是否不需要碰磁盘（异步路径据此决定要不要丢到线程里读）"""
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+def _keep_last(history: History, keep: int) -> History:
+    if keep <= 0:
+        return ()
+    return history[-keep:]
+
+
+def _folded_prefix(history: History, folded: Sequence[Turn]) -> int:
+    """history 开头有几条是 folded 里的对象（折叠的总是最早的一段，只会在队头）"""
+    ids = {id(t) for t in folded}
+    n = 0
+    while n < len(history) and id(history[n]) in ids:
+        n += 1
+    return n
+
+
+class MemoryHistoryBackend(HistoryBackend):
+    """纯内存后端（之前的行为），有 SessionStore 的数量 / 内存上限"""
+
+    def __init__(self, store: Optional[SessionStore] = None):
+        self.store = store if store is not None else history_store()
+        self._lock = threading.Lock()
+
+    def load(self, user_id: str, limit: int) -> History:
+        return _keep_last(self.store.get(user_id, ()), limit)
+
+    def append(self, user_id: str, turns: Sequence[Turn], keep: int) -> None:
+        # 取最新的历史再追加，避免同一用户的并发回复互相覆盖
+        with self._lock:
+            history = self.store.get(user_id, ()) + tuple(turns)
+            self.store.set(user_id, _keep_last(history, keep))
+
+    def clear(self, user_id: str) -> None:
+        self.store.pop(user_id)
+
+    def drop_folded(self, user_id: str, folded: Sequence[Turn]) -> None:
+        with self._lock:
+            history = self.store.get(user_id)
+            if history:
+                count = _folded_prefix(history, folded)
+                if count:
+                    self.store.set(user_id, history[count:])
+
+    def stats(self) -> Dict:
+        return {"backend": "memory", **self.store.stats()}
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id    TEXT    NOT NULL,
+    role       TEXT    NOT NULL,
+    content    TEXT    NOT NULL,
+    created_at REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_turns_user ON turns (user_id, id);
+"""
+
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """SQLite WAL 持久化 + 内存热层 + 后台批量写（线程安全）"""
+
+    def __init__(
+        self,
+        path: str,
+        hot: Optional[SessionStore] = None,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+    ):
+        """
+        hot: 热层，默认按 SESSION_* 环境变量建
+        batch_size: 待写条数达到这么多就立刻唤醒写线程
+        flush_interval: 最多攒多少秒落一次盘（进程崩溃最多丢这么久的历史）
+        """
+        self.path = path
+        self.hot = hot if hot is not None else history_store()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._local = threading.local()
+        self._write_conn = self._connect()
+        self._write_conn.executescript(_SCHEMA)
+
+        self._lock = threading.Lock()         # 保护热层读改写 + 待写队列
+        self._write_lock = threading.Lock()   # 同一时刻只有一个 flush
+        # 待写操作按顺序执行：("append", user_id, [(role, content, ts)], keep) /
+        # ("clear", user_id) / ("drop", user_id, count)
+        self._pending: List[Tuple] = []
+        self._pending_turns = 0
+        self._pending_users: Set[str] = set()
+        self._flushing_users: Set[str] = set()   # 正在写入、还没提交的用户
+
+        self.cold_loads = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.write_errors = 0
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._writer_loop, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """读连接每个线程一个，WAL 模式下读写互不阻塞"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ── 读 ──
+
+    def is_hot(self, user_id: str) -> bool:
+        return user_id in self.hot
+
+    def load(self, user_id: str, limit: int) -> History:
+        history = self.hot.get(user_id)
+        if history is not None:
+            return _keep_last(history, limit)
+
+        # 被挤出热层但还有没落盘的写入：先落盘（或等正在进行的 flush 提交），再从库里读
+        if user_id in self._pending_users or user_id in self._flushing_users:
+            self.flush()
+        history = self._select(user_id, limit)
+        with self._lock:
+            # 查库期间别的线程可能已经写进热层了，以热层为准
+            current = self.hot.get(user_id)
+            if current is not None:
+                return _keep_last(current, limit)
+            self.hot.set(user_id, history)
+        self.cold_loads += 1
+        return history
+
+    def _select(self, user_id: str, limit: int) -> History:
+        if limit <= 0:
+            return ()
+        rows = self._read_conn().execute(
+            "SELECT role, content FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return tuple(Turn(role, content) for role, content in reversed(rows))
+
+    # ── 写 ──
+
+    def append(self, user_id: str, turns: Sequence[Turn], keep: int) -> None:
+        turns = tuple(turns)
+        # 热层没有就先懒加载，保证追加后的内容是完整的最近 keep 条
+        if not self.is_hot(user_id):
+            self.load(user_id, keep)
+        now = time.time()
+        with self._lock:
+            history = self.hot.get(user_id, ()) + turns
+            self.hot.set(user_id, _keep_last(history, keep))
+            self._pending.append(("append", user_id, [(t.role, t.content, now) for t in turns], keep))
+            self._pending_turns += len(turns)
+            self._pending_users.add(user_id)
+            wake = self._pending_turns >= self.batch_size
+        if wake:
+            self._wakeup.set()
+
+    def clear(self, user_id: str) -> None:
+        with self._lock:
+            self.hot.pop(user_id)
+            self._pending.append(("clear", user_id))
+            self._pending_users.add(user_id)
+        self._wakeup.set()
+
+    def drop_folded(self, user_id: str, folded: Sequence[Turn]) -> None:
+        with self._lock:
+            history = self.hot.get(user_id)
+            # 不在热层（被淘汰后重新从库里读）的话对象已经换了，认不出来就不删，
+            # 下次折叠会把它们再摘要一遍，不会丢
+            count = _folded_prefix(history, folded) if history is not None else 0
+            if count <= 0:
+                return
+            self.hot.set(user_id, history[count:])
+            # 热层和「库 + 待写队列」一致，在锁里按热层算出的条数排进队列，落盘时删的是同样几条
+            self._pending.append(("drop", user_id, count))
+            self._pending_users.add(user_id)
+
+    def flush(self) -> None:
+        """把待写队列在一个事务里落盘"""
+        with self._write_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+                self._pending_turns = 0
+                users, self._pending_users = self._pending_users, set()
+                self._flushing_users = users
+            if not ops:
+                return
+            try:
+                self._apply(ops)
+            except sqlite3.Error as e:
+                self.write_errors += 1
+                print(f"[history] 写入 SQLite 失败: {e}", file=sys.stderr, flush=True)
+                with self._lock:
+                    # 放回队头，下次再试
+                    self._pending = ops + self._pending
+                    self._pending_turns += sum(len(op[2]) for op in ops if op[0] == "append")
+                    self._pending_users |= users
+                return
+            finally:
+                self._flushing_users = set()
+            self.flushes += 1
+
+    def _apply(self, ops: List[Tuple]) -> None:
+        conn = self._write_conn
+        rows: List[Tuple[str, str, str, float]] = []
+        keeps: Dict[str, int] = {}
+        conn.execute("BEGIN")
+        try:
+            for op in ops:
+                if op[0] == "append":
+                    _, user_id, turns, keep = op
+                    rows.extend((user_id, role, content, ts) for role, content, ts in turns)
+                    keeps[user_id] = keep
+                    continue
+                # clear / drop 之前的追加先写进去，保证顺序
+                self._insert(conn, rows)
+                rows = []
+                if op[0] == "clear":
+                    conn.execute("DELETE FROM turns WHERE user_id = ?", (op[1],))
+                    keeps.pop(op[1], None)
+                else:
+                    # 热层是追加时先截到 keep 条、再删最早的 count 条，这里按同样的顺序：
+                    # 不然先删再截会多删，留下的反而是已经折叠进摘要的旧消息
+                    keep = keeps.pop(op[1], None)
+                    if keep is not None:
+                        self._trim(conn, op[1], keep)
+                    conn.execute(
+                        "DELETE FROM turns WHERE id IN ("
+                        "SELECT id FROM turns WHERE user_id = ? ORDER BY id LIMIT ?)",
+                        (op[1], op[2]),
+                    )
+            self._insert(conn, rows)
+            # 每个用户只保留最近 keep 条
+            for user_id, keep in keeps.items():
+                self._trim(conn, user_id, keep)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _trim(self, conn: sqlite3.Connection, user_id: str, keep: int) -> None:
+        """只保留该用户最近 keep 条"""
+        conn.execute(
+            "DELETE FROM turns WHERE user_id = ? AND id <= COALESCE(("
+            "SELECT id FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?), -1)",
+            (user_id, user_id, max(keep, 0)),
+        )
+
+    def _insert(self, conn: sqlite3.Connection, rows: List[Tuple[str, str, str, float]]) -> None:
+        if rows:
+            conn.executemany(
+                "INSERT INTO turns (user_id, role, content, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self.flushed_rows += len(rows)
+
+    def _writer_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = self._pending_turns
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            **self.hot.stats(),
+            "cold_loads": self.cold_loads,
+            "pending_turns": pending,
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "write_errors": self.write_errors,
+        }
+
+
+def make_history_backend(db_path: Optional[str] = None) -> HistoryBackend:
+    """db_path（或 HISTORY_DB 环境变量）非空时用 SQLite，否则用内存"""
+    path = db_path if db_path is not None else HISTORY_DB
+    if path:
+        print(f"[history] 历史对话持久化到 {path}")
+        return SQLiteHistoryBackend(path)
+    return MemoryHistoryBackend()
@@ -0,0 +1,182 @@
+"""
+滚动摘要 — 长对话时把较早的轮次折叠成一段简短摘要，prompt 大小不随对话长度增长。
+
+之前 _cap_history 只保留最近 max_rounds 轮，更早的内容直接丢掉；调大 max_rounds
+又会让每次请求线性变大。HistorySummarizer：
+  - 每轮回复后检查该用户历史的 token 数，超过 token_threshold、或者条数到了 fold_messages
+    （bot 传 max_rounds 上限：再追加就要被截掉了）就把「除最近 keep_recent 条以外」的
+    旧消息交给后台线程，和已有摘要一起压成新摘要
+  - 摘要生成不在回复路径上：当前这轮照常用完整历史，摘要好了之后再替换
+  - 摘要写好后按对象身份删掉折叠过的那几条（不按条数：折叠期间又来的轮次会让条数对不上）
+  - 摘要按用户缓存在 SessionStore 里（和历史一样有数量 / 闲置上限）
+  - 同一用户同时只有一个摘要任务；清空历史时 epoch +1，进行中的旧任务结果直接丢弃
+"""
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+from example_retriever import approx_tokens
+from session_store import SessionStore, Turn
+
+# summarize_fn(旧摘要, 要折叠的消息) -> 新摘要
+SummarizeFn = Callable[[str, Sequence[Turn]], str]
+
+SUMMARY_PROMPT = """下面是一段微信聊天记录的前情摘要和后续对话。请把它们合并成一段新的摘要，供之后继续聊天时参考。
+
+要求：
+- 用第三人称，只记事实：聊过的话题、对方提到的近况 / 计划 / 喜好、两人之间约好的事
+- 不要记语气词、表情和寒暄
+- 不超过 {max_chars} 字，只输出摘要本身
+
+【已有摘要】
+{summary}
+
+【后续对话】
+{dialogue}"""
+
+
+def format_dialogue(turns: Sequence[Turn], user_label: str = "对方", bot_label: str = "我") -> str:
+    return "\n".join(f"{user_label if t.role == 'user' else bot_label}：{t.content}" for t in turns)
+
+
+class _Summary:
+    __slots__ = ("text", "epoch")
+
+    def __init__(self, text: str = "", epoch: int = 0):
+        self.text = text
+        self.epoch = epoch
+
+
+class HistorySummarizer:
+    """按 token 阈值触发、后台生成、按用户缓存的滚动摘要"""
+
+    def __init__(
+        self,
+        summarize_fn: SummarizeFn,
+        token_threshold: int = 1000,
+        keep_recent: int = 6,
+        max_messages: int = 100,
+        fold_messages: int = 0,
+        max_chars: int = 300,
+        token_counter: Callable[[str], int] = approx_tokens,
+        workers: int = 2,
+    ):
+        """
+        token_threshold: 历史（不含摘要）超过多少 token 触发折叠
+        keep_recent: 折叠时保留最近多少条原始消息（取偶数，保证一问一答成对）
+        max_messages: 原始历史的硬上限，摘要跟不上时兜底
+        fold_messages: 原始历史到这么多条时不管 token 数也折叠，0 表示只看 token
+        """
+        self.summarize_fn = summarize_fn
+        self.token_threshold = token_threshold
+        self.keep_recent = keep_recent + keep_recent % 2
+        self.max_messages = max(max_messages, self.keep_recent + 2)
+        self.fold_messages = fold_messages
+        self.max_chars = max_chars
+        self.token_counter = token_counter
+
+        self._summaries = SessionStore(name="summaries")
+        self._running: Dict[str, int] = {}   # user_id -> 任务开始时的 epoch
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+        self.compactions = 0
+        self.failures = 0
+        self.folded_messages = 0
+
+    def get(self, user_id: str) -> str:
+        entry = self._summaries.get(user_id)
+        return entry.text if entry is not None else ""
+
+    def reset(self, user_id: str) -> None:
+        """清空历史时调用：丢掉摘要，进行中的任务作废"""
+        with self._lock:
+            entry = self._summaries.get(user_id)
+            epoch = entry.epoch + 1 if entry is not None else 1
+            self._summaries.set(user_id, _Summary("", epoch))
+
+    def history_tokens(self, turns: Sequence[Turn]) -> int:
+        return sum(self.token_counter(t.content) for t in turns)
+
+    def _fold_of(self, turns: Sequence[Turn]) -> List[Turn]:
+        """该折叠的旧消息（不需要折叠时为空）"""
+        if len(turns) <= self.keep_recent:
+            return []
+        full = self.fold_messages > 0 and len(turns) >= self.fold_messages
+        if not full and self.history_tokens(turns) <= self.token_threshold:
+            return []
+        return list(turns[: len(turns) - self.keep_recent])
+
+    def maybe_schedule(
+        self,
+        user_id: str,
+        turns: Sequence[Turn],
+        on_folded: Callable[[str, Sequence[Turn]], None],
+        reload: Optional[Callable[[str], Sequence[Turn]]] = None,
+    ) -> bool:
+        """
+        turns: 该用户当前的全部原始历史（时间正序）
+        on_folded(user_id, folded): 摘要写好后回调，由 bot 从历史里删掉 folded 这几条
+        reload(user_id): 删完后重新取历史；折叠期间又攒够了就接着折叠，不用等下一轮回复
+        """
+        fold = self._fold_of(turns)
+        if not fold:
+            return False
+        with self._lock:
+            if user_id in self._running:
+                return False
+            entry = self._summaries.get(user_id) or _Summary()
+            self._running[user_id] = entry.epoch
+        self._pool.submit(self._compact, user_id, entry.text, entry.epoch, fold, on_folded, reload)
+        return True
+
+    def _compact(
+        self,
+        user_id: str,
+        summary: str,
+        epoch: int,
+        fold: List[Turn],
+        on_folded: Callable[[str, Sequence[Turn]], None],
+        reload: Optional[Callable[[str], Sequence[Turn]]],
+    ) -> None:
+        try:
+            while fold:
+                try:
+                    text = self.summarize_fn(summary, fold).strip()[: self.max_chars]
+                except Exception as e:
+                    self.failures += 1
+                    print(f"[summary] 生成摘要失败（{user_id}）: {e}", file=sys.stderr, flush=True)
+                    return
+                with self._lock:
+                    entry = self._summaries.get(user_id)
+                    current_epoch = entry.epoch if entry is not None else 0
+                    if not text or current_epoch != epoch:
+                        return
+                    self._summaries.set(user_id, _Summary(text, epoch))
+                    self.compactions += 1
+                    self.folded_messages += len(fold)
+                # 先写摘要再删历史：中间来的请求最多重复看到一段已被摘要的内容，不会丢上下文
+                on_folded(user_id, fold)
+                summary = text
+                fold = self._fold_of(reload(user_id)) if reload is not None else []
+        finally:
+            with self._lock:
+                self._running.pop(user_id, None)
+                self._idle.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """等所有进行中的摘要任务完成（测试 / 基准脚本用）"""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._running, timeout=timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running = len(self._running)
+        return {
+            "cached": len(self._summaries),
+            "running": running,
+            "compactions": self.compactions,
+            "folded_messages": self.folded_messages,
+            "failures": self.failures,
+        }
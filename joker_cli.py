@@ -18,6 +18,7 @@ import os
 import sys
 
 from bot_core import load_dotenv, JokerBot
+from llm_router import make_router
 
 
 VALID_STYLES = ["brother", "female_friend", "crush", "ex", "default"]
@@ -44,6 +45,10 @@ def parse_args() -> argparse.Namespace:
         "--max-rounds", type=int, default=10,
         help="保留的历史轮数"
     )
+    parser.add_argument(
+        "--backends", default=None,
+        help="推理后端，如 deepseek,openai_ft,qwen_lora（默认读 LLM_BACKENDS，空则只用 DeepSeek）",
+    )
     parser.add_argument("--input", help="单次输入（不传则进入交互模式）")
     return parser.parse_args()
 
@@ -64,6 +69,7 @@ def main() -> None:
         temperature=args.temperature,
         max_tokens=args.max_tokens,
         max_rounds=args.max_rounds,
+        router=make_router("joker", args.backends, model=args.model),
     )
 
     if args.input:
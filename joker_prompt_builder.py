@@ -7,6 +7,9 @@ import os
 import re
 from typing import Dict, List, Optional
 
+from prompt_builder import assemble_messages, build_turn_context, cached_system_prompt, fit_prompt_budget
+from token_budget import TokenBudgeter
+
 
 def load_styles(path: str) -> Dict:
     with open(path, "r", encoding="utf-8") as f:
@@ -187,8 +190,17 @@ STYLE_LAYERS = {
 def build_joker_system_prompt(
     style_tag: str = "default",
     chat_examples_text: str = "",
+    examples_key: Optional[str] = None,
 ) -> str:
-    """组装 Joker 的 system prompt"""
+    """组装 Joker 的 system prompt（按风格 + 示例 hash 缓存）"""
+    return cached_system_prompt(
+        "joker", style_tag, chat_examples_text,
+        lambda: _render_joker_system_prompt(style_tag, chat_examples_text),
+        examples_key,
+    )
+
+
+def _render_joker_system_prompt(style_tag: str, chat_examples_text: str) -> str:
     style_layer = STYLE_LAYERS.get(style_tag, STYLE_LAYERS["default"])
 
     parts = [
@@ -219,24 +231,20 @@ def build_joker_messages(
     style_tag: str = "default",
     chat_examples_text: str = "",
     history: Optional[List[Dict]] = None,
+    examples_key: Optional[str] = None,
+    summary: str = "",
+    budgeter: Optional[TokenBudgeter] = None,
 ) -> List[Dict]:
-    """构建完整的 messages 列表"""
-    system_prompt = build_joker_system_prompt(style_tag, chat_examples_text)
-    messages: List[Dict] = [{"role": "system", "content": system_prompt}]
-
-    if history:
-        for item in history:
-            role = item.get("role")
-            content = item.get("content")
-            if role in ("user", "assistant") and content:
-                messages.append({"role": role, "content": content})
-
-    if history and len(history) >= 2:
-        messages.append({
-            "role": "user",
-            "content": f"（续上面的对话）{user_input}",
-        })
-    else:
-        messages.append({"role": "user", "content": user_input})
-
-    return messages
+    """
+    构建完整的 messages 列表。
+    同一风格的 system prompt 逐字节不变，接话提醒放在末尾，保证前缀缓存能命中。
+    传了 budgeter 就按 token 预算先裁示例、再裁最早的历史。
+    """
+    chat_examples_text, examples_key, _, history = fit_prompt_budget(
+        budgeter,
+        lambda text, key: build_joker_system_prompt(style_tag, text, key),
+        user_input, chat_examples_text, examples_key, "", history, summary,
+    )
+    system_prompt = build_joker_system_prompt(style_tag, chat_examples_text, examples_key)
+    turn_context = build_turn_context(history=history)
+    return assemble_messages(system_prompt, user_input, history, turn_context, summary)
@@ -0,0 +1,119 @@
+"""
+从 LLM 输出里容错地抽 JSON 数组 — 生成脚本不再因为一点多余文字或截断就整条作废。
+
+generate_joker 之前是逐行去掉 ``` 再对整段回复 json.loads：数组前后多一句说明、
+或者到 max_tokens 被截断，整次调用都算 SKIP，钱白花了。这里：
+  - JsonArrayScanner：逐字符扫描（可以分多次 feed 流式输入），跳过数组前的说明文字 / ```json，
+    在顶层的 `,` / `]` 处切出一个元素就解析一个，扫过的部分不会重复解析
+  - 截断时保留已经完整的元素，complete=False；数组后面的文字直接忽略
+  - 看着像数组开头、但第一个元素解析不了（例如说明文字里的「[注意]」），就从下一个 `[` 重新找
+  - 中间某个元素坏了：保留它前面的元素，后面的不要
+
+用法：
+  items, complete = extract_json_array(raw, objects_only=True)
+"""
+import json
+from typing import Any, List, Tuple
+
+# `[` 后面第一个非空白字符是这些之一，才当作 JSON 数组的开头
+_VALUE_START = '{["-0123456789tfn]'
+_OBJECT_START = "{]"
+
+
+class JsonArrayScanner:
+    """增量扫描第一个 JSON 数组，items 是已经完整解析出来的顶层元素"""
+
+    def __init__(self, value_start: str = _VALUE_START):
+        """value_start: 数组第一个元素允许的开头字符（只要对象数组时传 "{]"，少认错说明文字里的方括号）"""
+        self.value_start = value_start
+        self.items: List[Any] = []
+        self.complete = False
+        self.stopped = False
+        self._buf = ""
+        self._reset(0)
+
+    def _reset(self, pos: int) -> None:
+        """回到「找数组开头」的状态，从 pos 开始找"""
+        self.items = []
+        self._pos = pos
+        self._open = -1          # 当前候选数组的 `[` 位置
+        self._elem_start = -1    # 当前元素的起始位置
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """追加一段输出，返回这次新解析出来的元素"""
+        if self.complete or self.stopped:
+            return []
+        before = len(self.items)
+        self._buf += chunk
+        self._scan()
+        return self.items[before:]
+
+    def _scan(self) -> None:
+        buf = self._buf
+        while self._pos < len(buf) and not (self.complete or self.stopped):
+            i = self._pos
+            c = buf[i]
+            self._pos += 1
+
+            if self._open < 0:
+                if c == "[":
+                    self._open = i
+                    self._elem_start = i + 1
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                continue
+
+            # 候选数组的第一个字符不像 JSON 值：不是数组，往后接着找
+            if (not self.items and self._depth == 1 and not c.isspace()
+                    and c not in self.value_start and not buf[self._elem_start:i].strip()):
+                self._reset(self._open + 1)
+                continue
+
+            if c == '"':
+                self._in_string = True
+            elif c in "[{":
+                self._depth += 1
+            elif c in "]}":
+                self._depth -= 1
+                if self._depth == 0 and self._take(buf[self._elem_start:i]):
+                    self.complete = True
+            elif c == "," and self._depth == 1:
+                if self._take(buf[self._elem_start:i]):
+                    self._elem_start = i + 1
+
+    def _take(self, text: str) -> bool:
+        """解析一个顶层元素；失败时换下一个候选数组（还没有元素）或就此停下（已有元素）"""
+        text = text.strip()
+        if not text:
+            # `[]` 或尾随逗号
+            return True
+        try:
+            self.items.append(json.loads(text))
+            return True
+        except ValueError:
+            if self.items:
+                self.stopped = True
+            else:
+                self._reset(self._open + 1)
+            return False
+
+
+def extract_json_array(text: str, objects_only: bool = False) -> Tuple[List[Any], bool]:
+    """
+    抽出 text 里第一个 JSON 数组，返回 (完整的元素, 数组是否正常闭合)。
+    没找到数组时返回 ([], False)
+    """
+    scanner = JsonArrayScanner(_OBJECT_START if objects_only else _VALUE_START)
+    scanner.feed(text)
+    return scanner.items, scanner.complete
@@ -0,0 +1,187 @@
+"""
+追加写的 JSONL 检查点 — 生成脚本不用每 10 条就把整个结果数组重写一遍。
+
+generate_joker 之前每 10 条 json.dump(results, indent=2) 全量重写输出文件：几十万条时
+每次检查点都是几百 MB 的写入，总开销随条数平方增长，写到一半崩了整个文件就坏了。
+这里：
+  - JsonlWriter：每条样本一行紧凑 JSON，追加写；每 fsync_every 条 fsync 一次
+  - recover_jsonl：续传前从尾部找最后一个完整的行，把写了一半的尾巴截掉，返回条数
+    （只扫换行符，不解析前面的内容）
+  - finalize_json：把 JSONL 原样拼成 ShareGPT 的 JSON 数组（逐行拷贝，不整体加载），
+    先写临时文件再 os.replace，最终文件要么是旧的要么是完整的新的
+  - append_to_json_array：往已有的 JSON 数组文件末尾追加（只改文件尾的 `]`），
+    不再把整个 base 数据集读进来再写回去
+"""
+import json
+import os
+from typing import Dict, Iterator, Optional
+
+_CHUNK = 1 << 20
+
+
+class JsonlWriter:
+    """追加写 JSONL，按条数批量 fsync"""
+
+    def __init__(self, path: str, fsync_every: int = 10):
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self._f = open(path, "a", encoding="utf-8")
+        self._unsynced = 0
+        self.written = 0
+
+    def append(self, record: Dict) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.written += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._unsynced = 0
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self.sync()
+        self._f.close()
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _last_line_start(f, end: int) -> int:
+    """end 之前最后一个换行符之后的位置（文件里没有换行符时是 0）"""
+    pos = end
+    while pos > 0:
+        step = min(_CHUNK, pos)
+        f.seek(pos - step)
+        chunk = f.read(step)
+        i = chunk.rfind(b"\n")
+        if i >= 0:
+            return pos - step + i + 1
+        pos -= step
+    return 0
+
+
+def recover_jsonl(path: str) -> int:
+    """
+    截掉崩溃时写了一半的尾巴，返回完整的条数。
+    最后一行没有换行符，或者有换行符但解析不了，都算没写完。
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        good = size
+        start = _last_line_start(f, size)
+        if start < size:
+            # 没有以换行结尾：最后一行是半截
+            good = start
+        elif size > 0:
+            prev = _last_line_start(f, size - 1)
+            f.seek(prev)
+            try:
+                json.loads(f.read(size - prev))
+            except ValueError:
+                good = prev
+        if good < size:
+            f.truncate(good)
+            print(f"[jsonl] {path} 尾部有 {size - good} 字节没写完，已截掉")
+
+        f.seek(0)
+        lines = 0
+        while True:
+            chunk = f.read(_CHUNK)
+            if not chunk:
+                break
+            lines += chunk.count(b"\n")
+    return lines
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _copy_records(src, dst, first: bool) -> bool:
+    """把 src 里的每一行作为数组元素写进 dst，返回之后是否仍是第一个元素"""
+    for line in src:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        dst.write(("\n" if first else ",\n") + line)
+        first = False
+    return first
+
+
+def finalize_json(jsonl_path: str, json_path: str) -> None:
+    """JSONL → JSON 数组（紧凑格式，一条一行），原子替换 json_path"""
+    tmp = json_path + ".tmp"
+    with open(jsonl_path, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        dst.write("[")
+        _copy_records(src, dst, first=True)
+        dst.write("\n]\n")
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(tmp, json_path)
+
+
+def _prev_non_space(f, end: int) -> Optional[bytes]:
+    """end 之前最后一个非空白字节"""
+    pos = end
+    while pos > 0:
+        step = min(4096, pos)
+        f.seek(pos - step)
+        chunk = f.read(step).rstrip()
+        if chunk:
+            return chunk[-1:]
+        pos -= step
+    return None
+
+
+def append_to_json_array(jsonl_path: str, json_path: str) -> Optional[int]:
+    """
+    把 JSONL 里的记录追加到已有的 JSON 数组文件末尾，只改文件尾部。
+    返回追加的条数；json_path 不是以 `]` 结尾的数组时不动它，返回 None
+    """
+    with open(json_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        # 从尾部往前找收尾的 `]`，再往前看一个非空白字符判断数组是不是空的
+        pos = size
+        tail = b""
+        while pos > 0 and b"]" not in tail:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        close = tail.rfind(b"]")
+        if close < 0 or tail[close + 1:].strip():
+            return None
+        close += pos
+        before = _prev_non_space(f, close)
+        if before is None:
+            return None
+        first = before == b"["
+
+        f.seek(close)
+        f.truncate()
+        count = 0
+        with open(jsonl_path, "r", encoding="utf-8") as src:
+            for line in src:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                f.write((("\n" if first else ",\n") + line).encode("utf-8"))
+                first = False
+                count += 1
+        f.write(b"\n]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return count
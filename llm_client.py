@@ -0,0 +1,102 @@
+"""
+LLM 客户端池 — 按 (base_url, api_key) 复用长连接的 OpenAI 客户端。
+
+之前 call_deepseek 每次回复都会 new 一个 OpenAI()，每条消息都要重新建客户端 +
+重新做一次 TCP/TLS 握手。这里维护一个进程级注册表：同一个 (base_url, api_key)
+只创建一次客户端，底层 httpx 连接池保持 keep-alive，QingqingBot / JokerBot /
+generate_joker 全部共用。
+
+连接池参数可通过环境变量调整：
+  LLM_POOL_MAX_CONNECTIONS   单个客户端最大连接数（默认 100）
+  LLM_POOL_MAX_KEEPALIVE     最大空闲保活连接数（默认 20）
+  LLM_POOL_KEEPALIVE_EXPIRY  空闲连接保活秒数（默认 60）
+每个客户端只对应一个 base_url（一个 host），所以上面的上限也就是每个 host 的上限。
+
+客户端关掉了 SDK 自带的重试（max_retries=0），超时 / 重试 / 熔断统一由
+llm_resilience 控制。
+
+异步路径（areply / call_deepseek_async）用 get_async_client()。httpx.AsyncClient
+的连接绑定在创建它的事件循环上，所以异步客户端按「事件循环 + (base_url, api_key)」
+缓存，循环被回收后对应客户端自动释放。
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Tuple
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+POOL_MAX_CONNECTIONS = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+
+# 建连超时单独收紧，读超时放宽（生成本身可能比较慢）
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+# {event_loop: {(base_url, api_key): AsyncOpenAI}}
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def get_client(base_url: str, api_key: str) -> OpenAI:
+    """获取 (base_url, api_key) 对应的共享客户端，不存在则创建（线程安全）"""
+    key = (base_url, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            http_client = httpx.Client(limits=_pool_limits(), timeout=_timeout())
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            _clients[key] = client
+    return client
+
+
+def get_async_client(base_url: str, api_key: str) -> AsyncOpenAI:
+    """获取当前事件循环上 (base_url, api_key) 对应的共享异步客户端（需在协程内调用）"""
+    loop = asyncio.get_running_loop()
+    key = (base_url, api_key)
+    with _clients_lock:
+        per_loop = _async_clients.setdefault(loop, {})
+        client = per_loop.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(limits=_pool_limits(), timeout=_timeout())
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            per_loop[key] = client
+    return client
+
+
+async def aclose_all() -> None:
+    """关闭当前事件循环上的所有异步客户端"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        per_loop = _async_clients.pop(loop, {})
+    for client in per_loop.values():
+        await client.close()
+
+
+def close_all() -> None:
+    """关闭所有共享客户端（进程退出 / 测试清理时用）"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
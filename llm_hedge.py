@@ -0,0 +1,277 @@
+"""
+对冲请求（hedged request）— 压 DeepSeek 偶发慢响应造成的回复长尾。
+
+回复延迟的 p99 主要来自少数特别慢的请求，同样的请求再发一次大概率是正常速度。
+Hedger：
+  - 记录最近一批调用的耗时，第一个请求超过其中第 percentile 分位还没回来，
+    就再发一个一模一样的请求，谁先成功用谁
+  - 全局对冲预算（HedgeBudget，所有 Hedger 共用一个）：每次调用攒 budget_ratio 个令牌，
+    对冲一次花一个，整个进程的额外请求不超过调用数的 budget_ratio（默认 5%）；
+    样本不够 min_samples 时不对冲
+  - 同步路径：拿不到令牌的调用直接在调用方线程里跑，不占线程池；拿到令牌的调用
+    （同时最多 max_burst 个）第一个请求才放进线程池，这样对冲的那个先回来时调用方能直接返回，
+    没触发对冲就把令牌还回去
+  - 输掉的那个请求不取消，让它跑完，用它的完成时间算「省下了多少延迟」
+  - 任何一个失败时等另一个；两个都失败才抛出（抛第一个请求的异常）
+  - 只用于非流式调用（call_deepseek / call_deepseek_async），流式回复第一行本来就先发出去了
+
+默认关闭，环境变量：
+  LLM_HEDGE              1 开启（默认 0）
+  LLM_HEDGE_PERCENTILE   触发对冲的耗时分位（默认 0.95）
+  LLM_HEDGE_BUDGET       额外请求占比上限（默认 0.05）
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))
+
+T = TypeVar("T")
+
+
+def _consume_exception(task: "asyncio.Future") -> Optional[BaseException]:
+    """取一下输掉那个请求的异常，避免事件循环报 exception was never retrieved"""
+    if task.cancelled():
+        return asyncio.CancelledError()
+    return task.exception()
+
+
+class LatencyWindow:
+    """最近 size 次调用耗时的滑动窗口"""
+
+    def __init__(self, size: int = 500):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class HedgeBudget:
+    """对冲预算令牌桶（线程安全）"""
+
+    def __init__(self, ratio: float = LLM_HEDGE_BUDGET, max_burst: float = 10.0):
+        """max_burst: 令牌最多攒多少个（空闲一段时间后最多连续 / 同时对冲这么多次）"""
+        self.ratio = ratio
+        self.max_burst = max_burst
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_burst, self._tokens + self.ratio)
+
+    def take(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def refund(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_burst, self._tokens + 1)
+
+
+# 所有 Hedger 共用：预算按整个进程的调用数算，不是每个 (base_url, model) 各 5%
+hedge_budget = HedgeBudget()
+
+# 同步路径的线程池也共用。只有拿到令牌的调用才用它（同时最多 max_burst 个，每个最多两个请求），
+# 再加上输掉后还在跑完的请求
+_pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-hedge")
+
+
+class Hedger:
+    """按延迟分位触发第二个请求，预算全局共用（线程安全，同步 / 异步两个入口）"""
+
+    def __init__(
+        self,
+        name: str = "llm",
+        percentile: float = LLM_HEDGE_PERCENTILE,
+        min_samples: int = 20,
+        budget: Optional[HedgeBudget] = None,
+    ):
+        """budget: 对冲预算，默认用全局的 hedge_budget"""
+        self.name = name
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget if budget is not None else hedge_budget
+        self.latency = LatencyWindow()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+        self.saved_seconds = 0.0
+
+    # ── 触发条件 / 预算 ──
+
+    def hedge_delay(self) -> Optional[float]:
+        """这次调用等多久没回来就对冲；样本不够时返回 None（不对冲）"""
+        if len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(self.percentile)
+
+    def _on_call(self) -> None:
+        self.budget.earn()
+        with self._lock:
+            self.calls += 1
+
+    def _take_budget(self) -> bool:
+        if self.budget.take():
+            return True
+        with self._lock:
+            self.budget_denied += 1
+        return False
+
+    def _on_hedge(self) -> None:
+        with self._lock:
+            self.hedged += 1
+
+    def _on_hedge_win(self, primary_done_at: float, hedge_done_at: float) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+            self.saved_seconds += max(0.0, primary_done_at - hedge_done_at)
+
+    # ── 同步 ──
+
+    def _timed(self, fn: Callable[[], T]) -> Tuple[T, float]:
+        t0 = time.monotonic()
+        result = fn()
+        done = time.monotonic()
+        self.latency.add(done - t0)
+        return result, done
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """fn 发起一次完整请求（可以被调用两次）"""
+        self._on_call()
+        delay = self.hedge_delay()
+        # 同步调用方线程卡在第一个请求里就没法先拿对冲的结果返回，所以先预留令牌：
+        # 预留不到（或者样本还不够）就不可能对冲，直接在调用方线程里跑
+        if delay is None or not self._take_budget():
+            return self._timed(fn)[0]
+        primary = _pool.submit(self._timed, fn)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            self.budget.refund()
+            return primary.result()[0]
+
+        self._on_hedge()
+        hedge = _pool.submit(self._timed, fn)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = primary if primary in done else hedge
+        other = hedge if first is primary else primary
+        if first.exception() is not None:
+            # 先回来的失败了，等另一个
+            if other.exception() is not None:
+                raise primary.exception()
+            first, other = other, first
+        if first is hedge:
+            other.add_done_callback(lambda f: self._record_saved(f, hedge))
+        return first.result()[0]
+
+    def _record_saved(self, primary: Future, hedge: Future) -> None:
+        if primary.exception() is None:
+            self._on_hedge_win(primary.result()[1], hedge.result()[1])
+        else:
+            with self._lock:
+                self.hedge_wins += 1
+
+    # ── 异步 ──
+
+    async def _atimed(self, fn: Callable[[], Awaitable[T]]) -> Tuple[T, float]:
+        t0 = time.monotonic()
+        result = await fn()
+        done = time.monotonic()
+        self.latency.add(done - t0)
+        return result, done
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """call() 的异步版本：fn() 每次返回一个新的协程"""
+        self._on_call()
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._atimed(fn))
+        if delay is None:
+            return (await primary)[0]
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            return (await primary)[0]
+
+        self._on_hedge()
+        hedge = asyncio.ensure_future(self._atimed(fn))
+        done, _ = await asyncio.wait([primary, hedge], return_when=asyncio.FIRST_COMPLETED)
+        first = primary if primary in done else hedge
+        other = hedge if first is primary else primary
+        if first.exception() is not None:
+            await asyncio.wait([other])
+            if other.exception() is not None:
+                raise primary.exception()
+            first, other = other, first
+        if first is hedge:
+            other.add_done_callback(lambda t: self._arecord_saved(t, hedge))
+        else:
+            other.add_done_callback(_consume_exception)
+        return first.result()[0]
+
+    def _arecord_saved(self, primary: "asyncio.Future", hedge: "asyncio.Future") -> None:
+        if _consume_exception(primary) is None:
+            self._on_hedge_win(primary.result()[1], hedge.result()[1])
+        else:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls, hedged, wins, saved = self.calls, self.hedged, self.hedge_wins, self.saved_seconds
+            denied = self.budget_denied
+        delay = self.hedge_delay()
+        return {
+            "calls": calls,
+            "hedged": hedged,
+            "hedge_rate": round(hedged / calls, 4) if calls else 0.0,
+            "hedge_wins": wins,
+            "budget_denied": denied,
+            "hedge_after_ms": round(delay * 1000) if delay is not None else None,
+            "latency_saved_ms": round(saved * 1000),
+            "avg_saved_ms_per_win": round(saved * 1000 / wins) if wins else 0,
+        }
+
+
+_hedgers: Dict[str, Hedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(base_url: str, model: str) -> Hedger:
+    """每个 (base_url, model) 一个 Hedger，延迟分布各算各的"""
+    key = f"{base_url}#{model}"
+    hedger = _hedgers.get(key)
+    if hedger is None:
+        with _hedgers_lock:
+            hedger = _hedgers.get(key)
+            if hedger is None:
+                hedger = _hedgers[key] = Hedger(name=model)
+    return hedger
+
+
+def hedge_stats() -> Dict:
+    with _hedgers_lock:
+        hedgers = dict(_hedgers)
+    return {key: h.stats() for key, h in hedgers.items()}
@@ -0,0 +1,352 @@
+"""
+DeepSeek 调用的容错层 — 超时、重试、熔断。
+
+之前 call_deepseek 没有整体超时（只有 httpx 的 60s 读超时）、429/5xx 不重试、也没有
+熔断：DeepSeek 一抖，所有回复线程都挂在那里，用户等了不知道多久才收到
+「emmm 我脑子卡了一下」。这里：
+  - 每次调用有一个总 deadline，每次尝试的超时 = 剩余时间，重试不会把总耗时拖长
+  - 429 / 408 / 5xx / 连接错误 / 超时按指数退避 + 全抖动重试，服务端给了
+    Retry-After 就按它来（等完会超过总时限就不再重试）
+  - 每个 base_url 一个熔断器：连续失败 breaker_failures 次后打开，cooldown 秒内
+    直接抛 CircuitOpenError（调用方马上回兜底话术），之后放一个探测请求，成功才关闭。
+    本地连接池排队超时（httpx.PoolTimeout）是客户端自己忙不过来，不算服务商失败
+  - openai SDK 自带的重试关掉（llm_client 里 max_retries=0），统一由这里控制
+
+参数可通过环境变量调整：
+  LLM_CALL_DEADLINE      单次调用（含重试）总时限，秒（默认 25）
+  LLM_MAX_RETRIES        最多重试几次（默认 2）
+  LLM_BACKOFF_BASE       退避基数，秒（默认 0.5）
+  LLM_BACKOFF_MAX        单次退避上限，秒（默认 8）
+  LLM_BREAKER_FAILURES   连续失败几次熔断（默认 5）
+  LLM_BREAKER_COOLDOWN   熔断后多少秒放探测请求（默认 30）
+"""
+import asyncio
+import email.utils
+import os
+import random
+import sys
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from openai import APIConnectionError, APITimeoutError
+
+LLM_CALL_DEADLINE = float(os.getenv("LLM_CALL_DEADLINE", "25"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+# 剩余时间不到这么多就不再发起新的尝试
+MIN_ATTEMPT_TIMEOUT = 0.2
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开，调用被直接拒绝"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """重试用完了总时限"""
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (APIConnectionError, APITimeoutError)):
+        return True
+    status = status_of(exc)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+
+def is_pool_timeout(exc: BaseException) -> bool:
+    """等本地连接池空出连接超时（SDK 包成 APITimeoutError，原始异常在 __cause__ 里）"""
+    seen = 0
+    while exc is not None and seen < 8:
+        if isinstance(exc, httpx.PoolTimeout):
+            return True
+        exc = exc.__cause__ or exc.__context__
+        seen += 1
+    return False
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """从响应头取 Retry-After（秒数或 HTTP 日期），没有返回 None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """连续失败计数的熔断器：closed → open → half_open（放一个探测）→ closed / open"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        cooldown: float = LLM_BREAKER_COOLDOWN,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == "open" and now - self._opened_at >= self.cooldown:
+            self._state = "half_open"
+        return self._state
+
+    def allow(self) -> bool:
+        """能否发请求；half_open 时只放一个探测请求"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                print(f"[breaker] {self.name} 恢复", flush=True)
+            self._state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def release(self) -> None:
+        """调用因为和服务端无关的原因失败：不计成败，只让出探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            probe_failed = self._state == "half_open"
+            if probe_failed or (self._state == "closed" and self._failures >= self.failure_threshold):
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self.opens += 1
+                print(f"[breaker] {self.name} 熔断 {self.cooldown:.0f}s（连续失败 {self._failures} 次）",
+                      file=sys.stderr, flush=True)
+            self._probing = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "opens": self.opens,
+                "rejected": self.rejected,
+                "retry_in": round(max(0.0, self.cooldown - (now - self._opened_at)), 1) if state == "open" else 0,
+            }
+
+
+class RetryPolicy:
+    """总时限内的指数退避重试（全抖动），同步 / 异步两个入口"""
+
+    def __init__(
+        self,
+        deadline: float = LLM_CALL_DEADLINE,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+    ):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        hinted = retry_after(exc)
+        if hinted is not None:
+            return hinted
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _next_wait(self, attempt: int, exc: BaseException, end: float) -> Optional[float]:
+        """返回重试前要等多久；不该再重试时返回 None"""
+        if attempt >= self.max_retries or not is_retryable(exc):
+            return None
+        wait = self.backoff(attempt, exc)
+        if time.monotonic() + wait + MIN_ATTEMPT_TIMEOUT > end:
+            return None
+        with self._lock:
+            self.retries += 1
+        return wait
+
+    def _fail(self, exc: BaseException, breaker: Optional[CircuitBreaker]) -> None:
+        with self._lock:
+            self.failures += 1
+        if breaker is None:
+            return
+        if is_pool_timeout(exc):
+            # 请求根本没发出去，服务商是好是坏不知道
+            breaker.release()
+        elif is_retryable(exc) or isinstance(exc, (TimeoutError, asyncio.TimeoutError)):
+            breaker.record_failure()
+        elif status_of(exc) is not None:
+            # 4xx（参数错误 / 鉴权失败）说明服务是通的，不计入熔断
+            breaker.record_success()
+        else:
+            breaker.release()
+
+    @staticmethod
+    def _abandon(exc: BaseException, breaker: Optional[CircuitBreaker]) -> None:
+        """
+        取消 / Ctrl-C（BaseException，走不到上面的 _fail）：不计成败，但要让出探测名额，
+        不然半开时被取消的探测会让熔断器一直卡在 half_open
+        """
+        if breaker is not None and not isinstance(exc, Exception):
+            breaker.release()
+
+    def _start(self, breaker: Optional[CircuitBreaker], deadline: Optional[float]) -> float:
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"{breaker.name} 熔断中")
+        with self._lock:
+            self.calls += 1
+        return time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+    def call(
+        self,
+        fn: Callable[[float], T],
+        breaker: Optional[CircuitBreaker] = None,
+        deadline: Optional[float] = None,
+    ) -> T:
+        """fn(timeout) 发起一次尝试，timeout 是这次尝试可用的秒数"""
+        end = self._start(breaker, deadline)
+        attempt = 0
+        try:
+            while True:
+                remaining = end - time.monotonic()
+                try:
+                    if remaining < MIN_ATTEMPT_TIMEOUT:
+                        raise DeadlineExceeded("LLM 调用超过总时限")
+                    result = fn(remaining)
+                except Exception as e:
+                    wait = None if isinstance(e, DeadlineExceeded) else self._next_wait(attempt, e, end)
+                    if wait is None:
+                        self._fail(e, breaker)
+                        raise
+                    time.sleep(wait)
+                    attempt += 1
+                    continue
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+        except BaseException as e:
+            self._abandon(e, breaker)
+            raise
+
+    async def acall(
+        self,
+        fn: Callable[[float], Awaitable[T]],
+        breaker: Optional[CircuitBreaker] = None,
+        deadline: Optional[float] = None,
+    ) -> T:
+        """call() 的异步版本，退避期间不占线程"""
+        end = self._start(breaker, deadline)
+        attempt = 0
+        try:
+            while True:
+                remaining = end - time.monotonic()
+                try:
+                    if remaining < MIN_ATTEMPT_TIMEOUT:
+                        raise DeadlineExceeded("LLM 调用超过总时限")
+                    result = await asyncio.wait_for(fn(remaining), timeout=remaining)
+                except asyncio.TimeoutError as e:
+                    # wait_for 超时说明这次尝试已经用完了总时限
+                    self._fail(e, breaker)
+                    raise DeadlineExceeded("LLM 调用超过总时限") from e
+                except Exception as e:
+                    wait = None if isinstance(e, DeadlineExceeded) else self._next_wait(attempt, e, end)
+                    if wait is None:
+                        self._fail(e, breaker)
+                        raise
+                    await asyncio.sleep(wait)
+                    attempt += 1
+                    continue
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+        except BaseException as e:
+            self._abandon(e, breaker)
+            raise
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "deadline": self.deadline,
+                "max_retries": self.max_retries,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+            }
+
+
+retry_policy = RetryPolicy()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(base_url: str) -> CircuitBreaker:
+    """每个 base_url（服务商）一个熔断器"""
+    breaker = _breakers.get(base_url)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(base_url, CircuitBreaker(base_url))
+    return breaker
+
+
+def resilience_stats() -> Dict:
+    """重试计数 + 各熔断器状态（给 /health 看）"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {
+        "retry": retry_policy.stats(),
+        "breakers": {url: b.stats() for url, b in breakers.items()},
+    }
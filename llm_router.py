@@ -0,0 +1,485 @@
+"""
+多后端路由 — DeepSeek / OpenAI 微调模型 / 本地 Qwen LoRA 都能给线上 bot 用。
+
+之前三条推理路径各管各的：bot 只会调 call_deepseek，OpenAI 微调模型只在
+chat_finetune.py 的命令行里用，Qwen LoRA 只在 chat_server.py / chat_web.py 里。这里：
+  - LLMBackend：统一的 complete / acomplete / stream_lines / astream_lines 接口
+  - OpenAICompatibleBackend：任何 OpenAI 兼容接口（DeepSeek、OpenAI 微调模型、
+    LLaMA-Factory `llamafactory-cli api` / vLLM 挂起来的 Qwen LoRA），底下走
+    call_deepseek，所以重试 / 熔断 / 对冲都照常生效
+  - StubBackend：固定回复 + 可配置延迟 / 失败率，测试和基准用
+  - LLMRouter：
+      latency 策略：按「延迟 EWMA × (在途 + 1) / 权重」选最小的，没样本的后端先试
+      weighted 策略：按权重随机
+      每个后端有并发上限，满了换下一个，全满就等（最多 wait_timeout 秒）
+      调用失败自动换下一个后端重试；流式只在还没吐出第一行之前换
+      熔断中的后端（见 llm_resilience）直接跳过
+
+环境变量（make_router 用）：
+  LLM_BACKENDS        逗号分隔的 名字[:权重[:并发上限]]，如 "deepseek:3:64,qwen_lora:1:4"
+  LLM_ROUTER_POLICY   latency（默认）/ weighted
+  OPENAI_API_KEY / OPENAI_BASE_URL / OPENAI_FT_MODEL   OpenAI 微调模型（模型名默认读 fine_tuned_model.txt）
+  QWEN_BASE_URL / QWEN_MODEL / QWEN_API_KEY            本地 Qwen LoRA 的 OpenAI 兼容服务
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set
+
+import bot_core
+from llm_resilience import LLM_CALL_DEADLINE, get_breaker
+
+LLM_ROUTER_POLICY = os.getenv("LLM_ROUTER_POLICY", "latency")
+
+# 微调过的模型只会说训练时那个人格
+FINETUNE_PERSONA = "joker"
+
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+class NoBackendAvailable(RuntimeError):
+    """所有后端都熔断 / 满载 / 已经试过失败"""
+
+
+def split_lines(text: str) -> List[str]:
+    return [l.strip() for l in text.split("\n") if l.strip()]
+
+
+def strip_think(text: str) -> str:
+    """去掉 R1 系模型的思考过程（和 chat_server.py 的处理一致）"""
+    text = _THINK_RE.sub("", text).strip()
+    if "<think>" in text:
+        text = text.split("</think>")[-1].strip() if "</think>" in text else text.split("<think>")[0].strip()
+    return text
+
+
+class LLMBackend:
+    """推理后端接口；异步 / 流式接口默认基于 complete() 实现"""
+
+    def __init__(
+        self,
+        name: str,
+        weight: float = 1.0,
+        max_concurrency: int = 64,
+        persona: Optional[str] = None,
+    ):
+        """persona: 只能给哪个人格用（微调模型），None 表示通用"""
+        self.name = name
+        self.weight = weight
+        self.max_concurrency = max(1, max_concurrency)
+        self.persona = persona
+
+    def available(self) -> bool:
+        return True
+
+    def complete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        return await asyncio.to_thread(self.complete, messages, temperature, max_tokens)
+
+    def stream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> Iterator[str]:
+        yield from split_lines(self.complete(messages, temperature, max_tokens))
+
+    async def astream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        for line in split_lines(await self.acomplete(messages, temperature, max_tokens)):
+            yield line
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """OpenAI 兼容接口的后端"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: str,
+        model: str,
+        system_prompt: Optional[str] = None,
+        think: bool = False,
+        **kwargs,
+    ):
+        """
+        system_prompt: 替换掉 messages 里第一条 system（微调模型用训练时的 system prompt）
+        think: 模型会输出 <think>...</think>（R1 蒸馏模型），回复要先去掉；这种模型不走流式
+        """
+        super().__init__(name, **kwargs)
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.system_prompt = system_prompt
+        self.think = think
+
+    def available(self) -> bool:
+        return get_breaker(self.base_url).state != "open"
+
+    def _kwargs(self, messages: List[Dict], temperature: float, max_tokens: int) -> Dict:
+        if self.system_prompt and messages and messages[0]["role"] == "system":
+            messages = [{"role": "system", "content": self.system_prompt}] + messages[1:]
+        return {
+            "messages": messages, "model": self.model, "temperature": temperature,
+            "max_tokens": max_tokens, "base_url": self.base_url, "api_key": self.api_key,
+        }
+
+    def complete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        text = bot_core.call_deepseek(**self._kwargs(messages, temperature, max_tokens))
+        return strip_think(text) if self.think else text
+
+    async def acomplete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        text = await bot_core.call_deepseek_async(**self._kwargs(messages, temperature, max_tokens))
+        return strip_think(text) if self.think else text
+
+    def stream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> Iterator[str]:
+        if self.think:
+            yield from super().stream_lines(messages, temperature, max_tokens)
+            return
+        yield from bot_core.stream_deepseek(**self._kwargs(messages, temperature, max_tokens))
+
+    async def astream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        if self.think:
+            lines = super().astream_lines(messages, temperature, max_tokens)
+        else:
+            lines = bot_core.astream_deepseek(**self._kwargs(messages, temperature, max_tokens))
+        async for line in lines:
+            yield line
+
+
+class StubBackend(LLMBackend):
+    """测试用后端：固定回复，延迟 = latency ± jitter，按 fail_rate 随机抛错"""
+
+    def __init__(self, name: str, reply: str = "哈哈哈\n是嘛", latency: float = 0.0,
+                 jitter: float = 0.0, fail_rate: float = 0.0, **kwargs):
+        super().__init__(name, **kwargs)
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.down = False
+
+    def _delay(self) -> float:
+        if self.down or random.random() < self.fail_rate:
+            raise ConnectionError(f"{self.name} 不可用")
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def complete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        time.sleep(self._delay())
+        return self.reply
+
+    async def acomplete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        await asyncio.sleep(self._delay())
+        return self.reply
+
+
+class _BackendState:
+    __slots__ = ("backend", "inflight", "calls", "errors", "ewma", "failovers")
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+        self.inflight = 0
+        self.calls = 0
+        self.errors = 0
+        self.ewma: Optional[float] = None
+        self.failovers = 0
+
+
+class LLMRouter:
+    """在多个后端之间选路 + 并发限制 + 故障转移（线程安全，同步 / 异步 / 流式）"""
+
+    def __init__(
+        self,
+        backends: Sequence[LLMBackend],
+        policy: str = LLM_ROUTER_POLICY,
+        ewma_alpha: float = 0.2,
+        wait_timeout: float = LLM_CALL_DEADLINE,
+    ):
+        if not backends:
+            raise ValueError("至少需要一个后端")
+        if policy not in ("latency", "weighted"):
+            raise ValueError(f"未知路由策略: {policy}")
+        self.policy = policy
+        self.ewma_alpha = ewma_alpha
+        self.wait_timeout = wait_timeout
+        self._states = [_BackendState(b) for b in backends]
+        self._cond = threading.Condition()
+
+    @property
+    def backends(self) -> List[LLMBackend]:
+        return [s.backend for s in self._states]
+
+    # ── 选路 ──
+
+    def _score(self, state: _BackendState) -> float:
+        if state.ewma is None:
+            return -1.0   # 还没有延迟样本，先试一次
+        return state.ewma * (state.inflight + 1) / max(state.backend.weight, 1e-6)
+
+    def _pick(self, exclude: Set[str]) -> Optional[_BackendState]:
+        """选一个后端并占一个并发名额（调用方持有锁）"""
+        free = [s for s in self._states
+                if s.backend.name not in exclude and s.inflight < s.backend.max_concurrency
+                and s.backend.available()]
+        if not free:
+            return None
+        if self.policy == "weighted":
+            state = random.choices(free, weights=[max(s.backend.weight, 1e-6) for s in free])[0]
+        else:
+            state = min(free, key=self._score)
+        state.inflight += 1
+        state.calls += 1
+        return state
+
+    def _waitable(self, exclude: Set[str]) -> bool:
+        """还有没试过、只是暂时满载的后端（值得等）"""
+        return any(s.backend.name not in exclude and s.backend.available() for s in self._states)
+
+    def _acquire(self, exclude: Set[str]) -> Optional[_BackendState]:
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                state = self._pick(exclude)
+                if state is not None or not self._waitable(exclude):
+                    return state
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(timeout=remaining)
+
+    async def _aacquire(self, exclude: Set[str]) -> Optional[_BackendState]:
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._cond:
+                state = self._pick(exclude)
+                if state is not None or not self._waitable(exclude):
+                    return state
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.01)
+
+    def _release(self, state: _BackendState, elapsed: Optional[float] = None, error: bool = False) -> None:
+        with self._cond:
+            state.inflight -= 1
+            if error:
+                state.errors += 1
+                # 失败的后端把延迟估计翻倍，之后少分流量，别的后端也慢下来时再回来试
+                state.ewma = min(60.0, (state.ewma or 1.0) * 2)
+            elif elapsed is not None:
+                a = self.ewma_alpha
+                state.ewma = elapsed if state.ewma is None else a * elapsed + (1 - a) * state.ewma
+            self._cond.notify()
+
+    def _failover(self, state: _BackendState, e: Exception) -> None:
+        state.failovers += 1
+        print(f"[router] {state.backend.name} 失败，换下一个后端: {e}", file=sys.stderr, flush=True)
+
+    def _exhausted(self, tried: Set[str], last_error: Optional[Exception]) -> Exception:
+        if last_error is not None:
+            return last_error
+        return NoBackendAvailable(f"没有可用后端（已试: {sorted(tried) or '无'}）")
+
+    # ── 调用 ──
+
+    def complete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            state = self._acquire(tried)
+            if state is None:
+                raise self._exhausted(tried, last_error)
+            tried.add(state.backend.name)
+            t0 = time.monotonic()
+            try:
+                result = state.backend.complete(messages, temperature, max_tokens)
+            except Exception as e:
+                self._release(state, error=True)
+                self._failover(state, e)
+                last_error = e
+                continue
+            self._release(state, time.monotonic() - t0)
+            return result
+
+    async def acomplete(self, messages: List[Dict], temperature: float, max_tokens: int) -> str:
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            state = await self._aacquire(tried)
+            if state is None:
+                raise self._exhausted(tried, last_error)
+            tried.add(state.backend.name)
+            t0 = time.monotonic()
+            try:
+                result = await state.backend.acomplete(messages, temperature, max_tokens)
+            except Exception as e:
+                self._release(state, error=True)
+                self._failover(state, e)
+                last_error = e
+                continue
+            self._release(state, time.monotonic() - t0)
+            return result
+
+    def stream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> Iterator[str]:
+        """已经吐出过行之后再失败就直接抛出（发出去的消息收不回来）"""
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            state = self._acquire(tried)
+            if state is None:
+                raise self._exhausted(tried, last_error)
+            tried.add(state.backend.name)
+            t0 = time.monotonic()
+            started = False
+            elapsed, error = None, False
+            try:
+                for line in state.backend.stream_lines(messages, temperature, max_tokens):
+                    started = True
+                    yield line
+                elapsed = time.monotonic() - t0
+                return
+            except Exception as e:
+                error = True
+                if started:
+                    raise
+                self._failover(state, e)
+                last_error = e
+            finally:
+                self._release(state, elapsed, error)
+
+    async def astream_lines(self, messages: List[Dict], temperature: float, max_tokens: int) -> AsyncIterator[str]:
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            state = await self._aacquire(tried)
+            if state is None:
+                raise self._exhausted(tried, last_error)
+            tried.add(state.backend.name)
+            t0 = time.monotonic()
+            started = False
+            elapsed, error = None, False
+            try:
+                async for line in state.backend.astream_lines(messages, temperature, max_tokens):
+                    started = True
+                    yield line
+                elapsed = time.monotonic() - t0
+                return
+            except Exception as e:
+                error = True
+                if started:
+                    raise
+                self._failover(state, e)
+                last_error = e
+            finally:
+                self._release(state, elapsed, error)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            total = sum(s.calls for s in self._states) or 1
+            return {
+                "policy": self.policy,
+                "backends": {
+                    s.backend.name: {
+                        "available": s.backend.available(),
+                        "inflight": s.inflight,
+                        "max_concurrency": s.backend.max_concurrency,
+                        "weight": s.backend.weight,
+                        "calls": s.calls,
+                        "share": round(s.calls / total, 4),
+                        "errors": s.errors,
+                        "failovers": s.failovers,
+                        "ewma_ms": round(s.ewma * 1000, 1) if s.ewma is not None else None,
+                    }
+                    for s in self._states
+                },
+            }
+
+
+# ── 按环境变量建后端 ──
+
+
+def _finetune_system_prompt(path: str = "training_data/openai-finetune.jsonl") -> Optional[str]:
+    """OpenAI 微调用的 system prompt（和 chat_finetune.py 一样从训练数据第一条里取）"""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    return next((m["content"] for m in first["messages"] if m["role"] == "system"), None)
+
+
+def _finetune_model(path: str = "fine_tuned_model.txt") -> str:
+    model = os.getenv("OPENAI_FT_MODEL", "")
+    if not model and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            model = f.read().strip()
+    return model
+
+
+def make_backend(name: str, weight: float = 1.0, max_concurrency: int = 64,
+                 model: str = "deepseek-chat") -> LLMBackend:
+    """name: deepseek / openai_ft / qwen_lora"""
+    limits = {"weight": weight, "max_concurrency": max_concurrency}
+    if name == "deepseek":
+        return OpenAICompatibleBackend(
+            name, os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+            os.getenv("DEEPSEEK_API_KEY", ""), model, **limits,
+        )
+    if name == "openai_ft":
+        ft_model = _finetune_model()
+        if not ft_model:
+            raise ValueError("openai_ft 需要 OPENAI_FT_MODEL 或 fine_tuned_model.txt")
+        return OpenAICompatibleBackend(
+            name, os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            os.getenv("OPENAI_API_KEY", ""), ft_model,
+            system_prompt=_finetune_system_prompt(), persona=FINETUNE_PERSONA, **limits,
+        )
+    if name == "qwen_lora":
+        # llamafactory-cli api / vLLM 挂起来的 LoRA，R1 蒸馏底座会输出 <think>
+        return OpenAICompatibleBackend(
+            name, os.getenv("QWEN_BASE_URL", "http://127.0.0.1:8000/v1"),
+            os.getenv("QWEN_API_KEY", "EMPTY"), os.getenv("QWEN_MODEL", "joker-lora"),
+            think=True, persona=FINETUNE_PERSONA, **limits,
+        )
+    raise ValueError(f"未知后端: {name}")
+
+
+def parse_backends(spec: str) -> List[Dict]:
+    """"deepseek:3:64,qwen_lora:1:4" -> [{name, weight, max_concurrency}, ...]"""
+    out = []
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        parts = item.split(":")
+        entry: Dict = {"name": parts[0]}
+        if len(parts) > 1 and parts[1]:
+            entry["weight"] = float(parts[1])
+        if len(parts) > 2 and parts[2]:
+            entry["max_concurrency"] = int(parts[2])
+        out.append(entry)
+    return out
+
+
+def make_router(
+    persona: str,
+    spec: Optional[str] = None,
+    model: str = "deepseek-chat",
+    policy: str = LLM_ROUTER_POLICY,
+) -> Optional[LLMRouter]:
+    """
+    spec（默认读 LLM_BACKENDS 环境变量）为空时返回 None：bot 直接调 call_deepseek，行为和以前一样。
+    只给某个人格用的后端（微调模型）不会出现在其他人格的路由里
+    """
+    # 调用时才读环境变量，.env 里配的也能生效
+    spec = spec if spec is not None else os.getenv("LLM_BACKENDS", "")
+    if not spec:
+        return None
+    backends = []
+    for entry in parse_backends(spec):
+        backend = make_backend(model=model, **entry)
+        if backend.persona is not None and backend.persona != persona:
+            print(f"[router] {backend.name} 是 {backend.persona} 的微调模型，{persona} 不使用")
+            continue
+        backends.append(backend)
+    if not backends:
+        return None
+    print(f"[router] {persona}: {', '.join(b.name for b in backends)}（策略 {policy}）")
+    return LLMRouter(backends, policy=policy)
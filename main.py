@@ -36,6 +36,14 @@ def parse_args() -> argparse.Namespace:
         "--max-rounds", type=int, default=8,
         help="交互模式保留的历史轮数"
     )
+    parser.add_argument(
+        "--example-top-k", type=int, default=8,
+        help="每轮检索的示例对话段数（0 = 把全部样本塞进 prompt）"
+    )
+    parser.add_argument(
+        "--example-token-budget", type=int, default=2000,
+        help="每轮检索示例的 token 上限"
+    )
     return parser.parse_args()
 
 
@@ -56,6 +64,8 @@ def main() -> None:
         temperature=args.temperature,
         max_tokens=args.max_tokens,
         max_rounds=args.max_rounds,
+        example_top_k=args.example_top_k,
+        example_token_budget=args.example_token_budget,
     )
 
     # 单次模式
@@ -8,13 +8,25 @@ Phase 2: 合并真实 + 合成训练数据为最终 SFT 数据集。
 输出：
   - training_data/sft-joker-final.json    (合并 + 去重 + 打乱)
 
+去重：对非 system 轮次的文本做 MinHash + LSH（near_dedup），字级 3-gram 的 Jaccard
+超过阈值的算一簇，每簇保留最先加载的那条（INPUT_FILES 里真实数据排在合成数据前面）。
+去掉的每一条都和它那簇保留的那条不低于阈值；只是通过中间样本传递相似的不去掉（报告里单独计数）。
+
 用法：
   python merge_sft_data.py
+  python merge_sft_data.py --threshold 0.7        # 更激进的去重
+  python merge_sft_data.py --no-dedup             # 只合并 + 打乱
 """
+import argparse
 import json
 import os
 import random
 import sys
+import time
+from typing import List, Tuple
+
+from near_dedup import cluster_size_histogram, near_duplicate_clusters
+from sft_store import load_sft
 
 
 INPUT_FILES = [
@@ -29,8 +41,8 @@ def load_json(path: str) -> list:
     if not os.path.exists(path):
         print(f"[跳过] 文件不存在: {path}")
         return []
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    # ShareGPT 数组和 sft_store 的 interned 格式都能读
+    return load_sft(path)
 
 
 def validate_entry(entry: dict) -> bool:
@@ -45,7 +57,44 @@ def validate_entry(entry: dict) -> bool:
     return has_human and has_gpt
 
 
+def conversation_text(entry: dict) -> str:
+    """
+    去重用的文本：除 system 外的各轮内容按顺序拼起来。
+    system prompt 和 human/gpt 角色名每条都一样，放进来只会把所有样本的相似度一起抬高
+    """
+    return "\n".join(m.get("value", "") for m in entry["conversations"] if m.get("from") != "system")
+
+
+def dedup(data: List[dict], threshold: float, num_perm: int, shingle: int) -> Tuple[List[dict], List[List[int]]]:
+    """近似去重，返回 (保留的样本, 被去掉的簇)；每簇保留下标最小的那条"""
+    t0 = time.perf_counter()
+    clusters, stats = near_duplicate_clusters(
+        (conversation_text(d) for d in data), threshold=threshold, num_perm=num_perm, k=shingle,
+    )
+    drop = {i for members in clusters for i in members[1:]}
+    kept = [d for i, d in enumerate(data) if i not in drop]
+    print(f"\n[去重] 阈值 {threshold} | {stats['bands']}×{stats['rows']} LSH | "
+          f"复核候选 {stats['candidate_pairs']} 对 | {time.perf_counter() - t0:.1f}s")
+    print(f"[去重] {stats['clusters']} 个近似重复簇，去掉 {stats['removed']} 条，剩 {len(kept)} 条"
+          f"（另有 {stats['transitive_kept']} 条只是传递相似、和保留的那条不够阈值，没去掉）")
+    if clusters:
+        hist = cluster_size_histogram(clusters)
+        print(f"[去重] 簇大小分布: {json.dumps(hist)}")
+        for members in clusters[:10]:
+            keep = data[members[0]]
+            first = next((m["value"] for m in keep["conversations"] if m.get("from") == "human"), "")
+            print(f"  {len(members):>4} 条 | {keep.get('source', 'unknown')[:30]} | {first[:20]!r}")
+    return kept, clusters
+
+
 def main():
+    parser = argparse.ArgumentParser(description="合并 + 去重 SFT 数据")
+    parser.add_argument("--threshold", type=float, default=0.8, help="近似重复的 Jaccard 阈值，默认 0.8")
+    parser.add_argument("--num-perm", type=int, default=128, help="MinHash 置换个数，默认 128")
+    parser.add_argument("--shingle", type=int, default=3, help="字级 shingle 长度，默认 3")
+    parser.add_argument("--no-dedup", action="store_true", help="不去重")
+    args = parser.parse_args()
+
     all_data = []
 
     for path in INPUT_FILES:
@@ -59,6 +108,10 @@ def main():
         print("没有可用的训练数据!", file=sys.stderr)
         sys.exit(1)
 
+    # 去重在打乱之前做：簇里保留的是按 INPUT_FILES 顺序最先出现的
+    if not args.no_dedup:
+        all_data, _ = dedup(all_data, args.threshold, args.num_perm, args.shingle)
+
     # 打乱顺序
     random.seed(42)
     random.shuffle(all_data)
@@ -9,12 +9,15 @@
 使用方式:
   python3 mp_bot.py                      # 默认端口 8080
   python3 mp_bot.py --port 9000          # 自定义端口
+  python3 mp_bot.py --async              # 异步模式（ASGI + uvicorn，有界 worker 池）
+  python3 mp_bot.py --async --concurrency 64 --queue-size 2000
 
 公众号测试号配置:
   URL: http://你的公网地址:端口/wx/callback
   Token: 与 .env 中 MP_TOKEN 一致
 """
 import argparse
+import asyncio
 import hashlib
 import json
 import os
@@ -23,11 +26,25 @@ import sys
 import threading
 import time
 import xml.etree.ElementTree as ET
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
 
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, make_response
 
 from bot_core import load_dotenv, QingqingBot
+from msg_dedup import SeenMsgCache, dedup_key
+from outbound import OutboundDispatcher
+from wechat_token import INVALID_TOKEN_ERRCODES, AccessTokenManager
+from reply_workers import BoundedReplyQueue
+from usage_stats import prompt_cache_stats
+from history_backend import HISTORY_DB, make_history_backend
+from session_store import SessionStore
+from llm_hedge import hedge_stats
+from llm_router import make_router
+from greeting_cache import make_greeting_cache
+from llm_resilience import CircuitOpenError, resilience_stats
 
 # ─── 初始化 ────────────────────────────────────────────────────
 
@@ -36,25 +53,40 @@ load_dotenv()
 MP_TOKEN = os.getenv("MP_TOKEN", "qingqing_bot_token")
 MP_APP_ID = os.getenv("MP_APP_ID", "")
 MP_APP_SECRET = os.getenv("MP_APP_SECRET", "")
+# 微信 API 地址，压测时可以指向本地 stub
+MP_API_BASE = os.getenv("MP_API_BASE", "https://api.weixin.qq.com").rstrip("/")
+
+# 异步模式：同时生成回复的上限 / 排队上限
+REPLY_CONCURRENCY = int(os.getenv("MP_REPLY_CONCURRENCY", "64"))
+REPLY_QUEUE_SIZE = int(os.getenv("MP_REPLY_QUEUE_SIZE", "2000"))
+
+# 客服消息全局发送速率（条/秒）和同一用户相邻两条的间隔（模拟打字）
+MP_SEND_RATE = float(os.getenv("MP_SEND_RATE", "20"))
+MP_LINE_INTERVAL = 0.6
+
+# 流式生成：每生成完一行就交给调度器发出去，不等整段回复（MP_STREAM_REPLY=0 关闭）
+MP_STREAM_REPLY = os.getenv("MP_STREAM_REPLY", "1") != "0"
 
 app = Flask(__name__)
 bot: QingqingBot = None
+dispatcher: OutboundDispatcher = None
+
+# 微信 API 共用一个 Session（连接池 + keep-alive）
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+_http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
 
-# Access token 缓存
-_access_token = ""
-_token_expires_at = 0
+# 每个用户一把锁，保证同一用户的消息按顺序处理，避免并发导致上下文矛盾。
+# 锁表和历史一样有上限，闲置的用户会被淘汰；正被持有的锁不会被淘汰。
+_user_locks = SessionStore(evictable=lambda lock: not lock.locked(), name="user_locks")
 
-# 每个用户一把锁，保证同一用户的消息按顺序处理，避免并发导致上下文矛盾
-_user_locks: dict[str, threading.Lock] = {}
-_locks_lock = threading.Lock()
+# 已处理过的 MsgId（拦截微信超时重推）
+_seen_msgs = SeenMsgCache(max_size=10000, ttl=300)
 
 
 def get_user_lock(user_id: str) -> threading.Lock:
     """获取指定用户的处理锁（线程安全）"""
-    with _locks_lock:
-        if user_id not in _user_locks:
-            _user_locks[user_id] = threading.Lock()
-        return _user_locks[user_id]
+    return _user_locks.get_or_create(user_id, threading.Lock)
 
 
 # 收到图片/表情包时的随机回应（像真人一样反应）
@@ -67,63 +99,92 @@ STICKER_REPLIES = [
     "哈哈哈哈哈好好笑",
 ]
 
+# 异步模式队列满时的被动回复
+BUSY_REPLY = "等我一下下 消息有点多"
 
-# ─── 微信 API ─────────────────────────────────────────────────
+UNSUPPORTED_MARKERS = [
+    "[Unsupported Message]",
+    "[收到不支持的消息类型",
+    "暂无法显示",
+]
 
+RESET_COMMANDS = {"清除记录", "reset", "清空"}
 
-def get_access_token() -> str:
-    """获取公众号 access_token（带缓存）"""
-    global _access_token, _token_expires_at
-    now = time.time()
-    if _access_token and now < _token_expires_at - 60:
-        return _access_token
 
-    url = "https://api.weixin.qq.com/cgi-bin/token"
-    resp = requests.get(url, params={
+# ─── 微信 API ─────────────────────────────────────────────────
+
+
+def _fetch_access_token() -> Tuple[str, int]:
+    """请求一次公众号 access_token 接口"""
+    url = f"{MP_API_BASE}/cgi-bin/token"
+    resp = _http.get(url, params={
         "grant_type": "client_credential",
         "appid": MP_APP_ID,
         "secret": MP_APP_SECRET,
     }, timeout=10)
     data = resp.json()
-
     if "access_token" not in data:
-        print(f"[mp] 获取 access_token 失败: {data}", file=sys.stderr)
-        return ""
+        raise RuntimeError(data)
+    return data["access_token"], int(data.get("expires_in", 7200))
 
-    _access_token = data["access_token"]
-    _token_expires_at = now + data.get("expires_in", 7200)
-    print(f"[mp] access_token 已刷新")
-    return _access_token
 
+# 单飞刷新 + 后台续期，见 wechat_token.py
+_token_manager = AccessTokenManager(_fetch_access_token, name="mp")
+
+
+def get_access_token() -> str:
+    """获取公众号 access_token（带缓存）"""
+    return _token_manager.get()
 
-def send_custom_message(to_user: str, content: str) -> bool:
-    """通过客服消息接口发送文本消息"""
-    token = get_access_token()
-    if not token:
-        print(f"[mp] 客服消息失败: 无 access_token", file=sys.stderr)
-        return False
 
-    url = f"https://api.weixin.qq.com/cgi-bin/message/custom/send?access_token={token}"
+def send_custom_message(to_user: str, content: str) -> bool:
+    """通过客服消息接口发送文本消息（token 失效时强制刷新后重试一次）"""
     payload = {
         "touser": to_user,
         "msgtype": "text",
         "text": {"content": content},
     }
-    try:
-        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-        resp = requests.post(
-            url, data=data,
-            headers={"Content-Type": "application/json; charset=utf-8"},
-            timeout=10,
-        )
-        result = resp.json()
-        if result.get("errcode", 0) != 0:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    for attempt in range(2):
+        token = get_access_token()
+        if not token:
+            print(f"[mp] 客服消息失败: 无 access_token", file=sys.stderr)
+            return False
+
+        url = f"{MP_API_BASE}/cgi-bin/message/custom/send?access_token={token}"
+        try:
+            resp = _http.post(
+                url, data=data,
+                headers={"Content-Type": "application/json; charset=utf-8"},
+                timeout=10,
+            )
+            result = resp.json()
+        except Exception as e:
+            print(f"[mp] 客服消息异常: {e}", file=sys.stderr)
+            return False
+
+        errcode = result.get("errcode", 0)
+        if errcode in INVALID_TOKEN_ERRCODES and attempt == 0:
+            print(f"[mp] access_token 失效 ({errcode})，刷新后重试", file=sys.stderr)
+            _token_manager.invalidate(token)
+            continue
+        if errcode != 0:
             print(f"[mp] 客服消息失败: {result}", file=sys.stderr)
             return False
         return True
-    except Exception as e:
-        print(f"[mp] 客服消息异常: {e}", file=sys.stderr)
-        return False
+    return False
+
+
+def init_dispatcher() -> OutboundDispatcher:
+    """启动出站调度器：回复逐行排队发送，生成线程不再 sleep 等待"""
+    global dispatcher
+    if dispatcher is None:
+        dispatcher = OutboundDispatcher(
+            send_custom_message, interval=MP_LINE_INTERVAL,
+            rate_per_sec=MP_SEND_RATE, name="mp-out",
+        )
+    return dispatcher
 
 
 # ─── 微信签名验证 ──────────────────────────────────────────────
@@ -173,6 +234,52 @@ def make_xml_response(xml_str: str):
     return resp
 
 
+def classify_message(msg: dict) -> Tuple[str, str]:
+    """
+    判断一条消息怎么处理（Flask / 异步两种模式共用）：
+      ("passive", 文本)  直接被动回复，不走 LLM
+      ("ignore", "")     直接返回 success
+      ("llm", 内容)      需要调 DeepSeek 生成回复
+    """
+    msg_type = msg.get("msg_type", "")
+    content = msg.get("content", "")
+    from_user = msg.get("from_user", "")
+
+    # 非文本消息（图片/表情包/语音/视频等）→ 被动回复
+    if msg_type != "text":
+        reply_text = random.choice(STICKER_REPLIES)
+        print(f"[mp] 非文本消息 [{msg_type}]，回复: {reply_text}", flush=True)
+        return "passive", reply_text
+
+    if not content.strip():
+        return "ignore", ""
+
+    # 表情包/不支持的消息类型（微信可能发英文或中文提示）
+    if any(marker in content.strip() for marker in UNSUPPORTED_MARKERS):
+        reply_text = random.choice(STICKER_REPLIES)
+        print(f"[mp] 不支持的消息，回复: {reply_text}", flush=True)
+        return "passive", reply_text
+
+    # 特殊指令 → 被动回复
+    if content.strip().lower() in RESET_COMMANDS:
+        bot.clear_history(from_user)
+        return "passive", "记忆已清除~"
+
+    return "llm", content
+
+
+def is_duplicate(msg: dict) -> bool:
+    """微信重推的同一条消息只处理一次"""
+    if _seen_msgs.check_and_add(dedup_key(msg)):
+        print(f"[mp] 重复推送，跳过 MsgId={msg.get('msg_id', '')}", flush=True)
+        return True
+    return False
+
+
+def split_reply_lines(reply: str) -> list:
+    return [l.strip() for l in reply.split("\n") if l.strip()]
+
+
 # ─── Flask 路由 ────────────────────────────────────────────────
 
 
@@ -217,58 +324,31 @@ def receive_message():
 
     print(f"[mp] 收到消息 [{msg_type}] from {from_user}: {content[:50]}", flush=True)
 
-    # 非文本消息（图片/表情包/语音/视频等）→ 被动回复
-    if msg_type != "text":
-        reply_text = random.choice(STICKER_REPLIES)
-        print(f"[mp] 非文本消息 [{msg_type}]，回复: {reply_text}", flush=True)
-        return make_xml_response(
-            build_text_reply(to_user, from_user, reply_text)
-        )
-
-    if not content.strip():
+    action, text = classify_message(msg)
+    if action == "passive":
+        return make_xml_response(build_text_reply(to_user, from_user, text))
+    if action == "ignore" or is_duplicate(msg):
         return "success"
 
-    # 表情包/不支持的消息类型（微信可能发英文或中文提示）
-    unsupported_markers = [
-        "[Unsupported Message]",
-        "[收到不支持的消息类型",
-        "暂无法显示",
-    ]
-    if any(marker in content.strip() for marker in unsupported_markers):
-        reply_text = random.choice(STICKER_REPLIES)
-        print(f"[mp] 不支持的消息，回复: {reply_text}", flush=True)
-        return make_xml_response(
-            build_text_reply(to_user, from_user, reply_text)
-        )
-
-    # 特殊指令 → 被动回复
-    if content.strip().lower() in {"清除记录", "reset", "清空"}:
-        bot.clear_history(from_user)
-        return make_xml_response(
-            build_text_reply(to_user, from_user, "记忆已清除~")
-        )
-
-    # 异步调 DeepSeek + 客服消息逐条发送（同一用户排队处理）
+    # 异步调 DeepSeek，生成完交给出站调度器逐条发送（同一用户排队处理）
     def async_reply():
         user_lock = get_user_lock(from_user)
         with user_lock:
             try:
-                reply = bot.reply(content, user_id=from_user)
-                lines = [l.strip() for l in reply.split("\n") if l.strip()]
-
-                for i, line in enumerate(lines):
-                    ok = send_custom_message(from_user, line)
-                    if not ok:
-                        remaining = "\n".join(lines[i:])
-                        send_custom_message(from_user, remaining)
-                        break
-                    if i < len(lines) - 1:
-                        time.sleep(0.6)
-
+                if MP_STREAM_REPLY:
+                    lines = []
+                    for line in bot.reply_stream(content, user_id=from_user):
+                        dispatcher.enqueue(from_user, [line])
+                        lines.append(line)
+                    reply = "\n".join(lines)
+                else:
+                    reply = bot.reply(content, user_id=from_user)
+                    lines = split_reply_lines(reply)
+                    dispatcher.enqueue(from_user, lines)
                 print(f"[mp] 回复 {from_user} ({len(lines)}条): {reply}", flush=True)
             except Exception as e:
                 print(f"[mp] 生成回复失败: {e}", file=sys.stderr, flush=True)
-                send_custom_message(from_user, "emmm 我脑子卡了一下")
+                dispatcher.enqueue(from_user, ["emmm 我脑子卡了一下"])
 
     threading.Thread(target=async_reply, daemon=True).start()
 
@@ -278,7 +358,16 @@ def receive_message():
 
 @app.route("/health", methods=["GET"])
 def health_check():
-    return {"status": "ok", "bot": "晴晴", "platform": "mp_test"}
+    return {
+        "status": "ok", "bot": "晴晴", "platform": "mp_test",
+        "dedup": _seen_msgs.stats(),
+        "outbound": dispatcher.stats() if dispatcher else None,
+        "token": _token_manager.stats(),
+        "prompt_cache": prompt_cache_stats.stats(),
+        "llm": {**resilience_stats(), "hedge": hedge_stats()},
+        "sessions": bot.session_stats() if bot else None,
+        "user_locks": _user_locks.stats(),
+    }
 
 
 # ─── 压力测试 / 直接调用接口 ──────────────────────────────────
@@ -316,11 +405,15 @@ def api_chat():
 
     t0 = time.time()
     user_lock = get_user_lock(user_id)
-    with user_lock:
-        reply = bot.reply(message, user_id=user_id)
+    try:
+        with user_lock:
+            reply = bot.reply(message, user_id=user_id)
+    except CircuitOpenError as e:
+        # 熔断中立刻返回，不让压测脚本干等
+        return {"error": "llm unavailable", "detail": str(e)}, 503
     latency_ms = int((time.time() - t0) * 1000)
 
-    lines = [l.strip() for l in reply.split("\n") if l.strip()]
+    lines = split_reply_lines(reply)
 
     print(f"[api] 回复 {user_id} ({latency_ms}ms): {reply}", flush=True)
 
@@ -341,11 +434,197 @@ def api_clear():
     return {"status": "ok", "user_id": user_id, "message": "历史已清除"}
 
 
+# ─── 异步模式（ASGI） ──────────────────────────────────────────
+#
+# 路由、签名校验、XML 处理与 Flask 版完全一致，区别只在执行模型：
+# 回复任务投递到有界队列，由固定数量的 worker 协程处理，
+# 队列满时回一句被动消息兜底，不会因为突发消息无限开线程。
+
+_reply_queue: Optional[BoundedReplyQueue] = None
+_async_user_locks = SessionStore(evictable=lambda lock: not lock.locked(), name="async_user_locks")
+
+
+def get_async_user_lock(user_id: str) -> asyncio.Lock:
+    """异步模式下的用户锁"""
+    return _async_user_locks.get_or_create(user_id, asyncio.Lock)
+
+
+async def start_reply_queue() -> BoundedReplyQueue:
+    global _reply_queue
+    if _reply_queue is None:
+        _reply_queue = BoundedReplyQueue(
+            concurrency=REPLY_CONCURRENCY, max_queue=REPLY_QUEUE_SIZE, name="mp",
+        )
+        await _reply_queue.start()
+    return _reply_queue
+
+
+async def stop_reply_queue() -> None:
+    global _reply_queue
+    if _reply_queue is not None:
+        await _reply_queue.stop()
+        _reply_queue = None
+
+
+async def reply_job(from_user: str, content: str) -> None:
+    """异步版 async_reply：生成的每一行交给出站调度器逐条发送"""
+    async with get_async_user_lock(from_user):
+        try:
+            if MP_STREAM_REPLY:
+                lines = []
+                async for line in bot.areply_stream(content, user_id=from_user):
+                    dispatcher.enqueue(from_user, [line])
+                    lines.append(line)
+                reply = "\n".join(lines)
+            else:
+                reply = await bot.areply(content, user_id=from_user)
+                lines = split_reply_lines(reply)
+                dispatcher.enqueue(from_user, lines)
+            print(f"[mp] 回复 {from_user} ({len(lines)}条): {reply}", flush=True)
+        except Exception as e:
+            print(f"[mp] 生成回复失败: {e}", file=sys.stderr, flush=True)
+            dispatcher.enqueue(from_user, ["emmm 我脑子卡了一下"])
+
+
+async def _asgi_receive_message(query: dict, body: bytes) -> Tuple[int, str, str]:
+    if not check_signature(query.get("signature", ""), query.get("timestamp", ""), query.get("nonce", "")):
+        return 403, "text/plain; charset=utf-8", "signature mismatch"
+
+    msg = parse_xml_message(body.decode("utf-8"))
+    from_user = msg.get("from_user", "")
+    to_user = msg.get("to_user", "")
+    print(f"[mp] 收到消息 [{msg.get('msg_type', '')}] from {from_user}: {msg.get('content', '')[:50]}", flush=True)
+
+    action, text = classify_message(msg)
+    if action == "passive":
+        return 200, "application/xml; charset=utf-8", build_text_reply(to_user, from_user, text)
+    if action == "ignore" or is_duplicate(msg):
+        return 200, "text/plain; charset=utf-8", "success"
+
+    if not _reply_queue.submit(lambda: reply_job(from_user, text)):
+        print(f"[mp] 回复队列已满，被动回复兜底 {from_user}", file=sys.stderr, flush=True)
+        return 200, "application/xml; charset=utf-8", build_text_reply(to_user, from_user, BUSY_REPLY)
+    return 200, "text/plain; charset=utf-8", "success"
+
+
+async def _asgi_api_chat(body: bytes) -> Tuple[int, str, dict]:
+    try:
+        data = json.loads(body.decode("utf-8") or "{}")
+    except ValueError:
+        data = {}
+    message = (data.get("message") or "").strip()
+    user_id = data.get("user_id", "test")
+    if not message:
+        return 400, "application/json", {"error": "message 不能为空"}
+
+    print(f"[api] 收到测试消息 from {user_id}: {message[:50]}", flush=True)
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future = loop.create_future()
+
+    async def job() -> None:
+        try:
+            async with get_async_user_lock(user_id):
+                done.set_result(await bot.areply(message, user_id=user_id))
+        except Exception as e:
+            done.set_exception(e)
+
+    t0 = time.time()
+    if not _reply_queue.submit(job):
+        return 503, "application/json", {"error": "busy", "queue": _reply_queue.stats()}
+    try:
+        reply = await done
+    except CircuitOpenError as e:
+        return 503, "application/json", {"error": "llm unavailable", "detail": str(e)}
+    latency_ms = int((time.time() - t0) * 1000)
+    lines = split_reply_lines(reply)
+    print(f"[api] 回复 {user_id} ({latency_ms}ms): {reply}", flush=True)
+    return 200, "application/json", {
+        "reply": reply, "lines": lines, "user_id": user_id, "latency_ms": latency_ms,
+    }
+
+
+async def _asgi_route(method: str, path: str, query: dict, body: bytes) -> Tuple[int, str, object]:
+    if path == "/wx/callback" and method == "GET":
+        if check_signature(query.get("signature", ""), query.get("timestamp", ""), query.get("nonce", "")):
+            print(f"[mp] URL 验证成功")
+            return 200, "text/html; charset=utf-8", query.get("echostr", "")
+        print(f"[mp] URL 验证失败: 签名不匹配")
+        return 403, "text/plain; charset=utf-8", "signature mismatch"
+    if path == "/wx/callback" and method == "POST":
+        return await _asgi_receive_message(query, body)
+    if path == "/health" and method == "GET":
+        return 200, "application/json", {
+            "status": "ok", "bot": "晴晴", "platform": "mp_test", "mode": "async",
+            "queue": _reply_queue.stats() if _reply_queue else None,
+            "dedup": _seen_msgs.stats(),
+            "outbound": dispatcher.stats() if dispatcher else None,
+            "token": _token_manager.stats(),
+            "prompt_cache": prompt_cache_stats.stats(),
+            "llm": {**resilience_stats(), "hedge": hedge_stats()},
+            "sessions": bot.session_stats() if bot else None,
+            "user_locks": _async_user_locks.stats(),
+        }
+    if path == "/api/chat" and method == "POST":
+        return await _asgi_api_chat(body)
+    if path == "/api/clear" and method == "POST":
+        try:
+            data = json.loads(body.decode("utf-8") or "{}")
+        except ValueError:
+            data = {}
+        user_id = data.get("user_id", "test")
+        await bot.aclear_history(user_id)
+        return 200, "application/json", {"status": "ok", "user_id": user_id, "message": "历史已清除"}
+    return 404, "text/plain; charset=utf-8", "not found"
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI 入口：python3 mp_bot.py --async 时由 uvicorn 加载"""
+    if scope["type"] == "lifespan":
+        while True:
+            event = await receive()
+            if event["type"] == "lifespan.startup":
+                await start_reply_queue()
+                await send({"type": "lifespan.startup.complete"})
+            elif event["type"] == "lifespan.shutdown":
+                await stop_reply_queue()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+
+    body = b""
+    while True:
+        event = await receive()
+        body += event.get("body", b"")
+        if not event.get("more_body"):
+            break
+
+    query = {
+        k: v[0]
+        for k, v in parse_qs(scope.get("query_string", b"").decode("utf-8"), keep_blank_values=True).items()
+    }
+    status, content_type, payload = await _asgi_route(scope["method"], scope["path"], query, body)
+    if isinstance(payload, dict):
+        payload = json.dumps(payload, ensure_ascii=False)
+    data = payload.encode("utf-8")
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"content-length", str(len(data)).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
 # ─── 启动 ──────────────────────────────────────────────────────
 
 
 def main():
-    global bot
+    global bot, REPLY_CONCURRENCY, REPLY_QUEUE_SIZE
 
     parser = argparse.ArgumentParser(description="晴晴微信公众号机器人")
     parser.add_argument("--port", type=int, default=8080, help="服务端口")
@@ -355,7 +634,29 @@ def main():
     )
     parser.add_argument("--chat-samples", default=None, help="聊天样本文件路径")
     parser.add_argument("--debug", action="store_true", help="Flask debug 模式")
+    parser.add_argument(
+        "--history-db", default=HISTORY_DB,
+        help="历史对话 SQLite 文件（重启不丢上下文），默认读 HISTORY_DB 环境变量，空则只放内存",
+    )
+    parser.add_argument(
+        "--backends", default=None,
+        help="推理后端，如 deepseek:3:64,qwen_lora:1:4（默认读 LLM_BACKENDS，空则只用 DeepSeek）",
+    )
+    parser.add_argument(
+        "--async", dest="use_async", action="store_true",
+        help="异步模式：ASGI + uvicorn，回复走有界 worker 池",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=REPLY_CONCURRENCY,
+        help="异步模式下同时生成回复的上限",
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=REPLY_QUEUE_SIZE,
+        help="异步模式下排队上限，超出时被动回复兜底",
+    )
     args = parser.parse_args()
+    REPLY_CONCURRENCY = args.concurrency
+    REPLY_QUEUE_SIZE = args.queue_size
 
     if not os.getenv("DEEPSEEK_API_KEY"):
         print("缺少 DEEPSEEK_API_KEY 环境变量", file=sys.stderr)
@@ -369,22 +670,38 @@ def main():
     bot = QingqingBot(
         config_path=args.config,
         chat_samples_path=args.chat_samples,
+        history_backend=make_history_backend(args.history_db),
+        router=make_router("qingqing", args.backends),
+        greeting_cache=make_greeting_cache(),
     )
     print(f"[mp] 晴晴机器人初始化完成")
 
-    # 预热 access_token
+    # 预热 access_token 并开启后台续期，启动出站调度器
     get_access_token()
+    _token_manager.start_background()
+    init_dispatcher()
 
     print()
     print("=" * 50)
-    print(f"  晴晴公众号机器人已启动（客服消息模式）")
+    print(f"  晴晴公众号机器人已启动（客服消息模式{' / 异步' if args.use_async else ''}）")
     print(f"  回调 URL: http://YOUR_HOST:{args.port}/wx/callback")
     print(f"  健康检查: http://localhost:{args.port}/health")
     print(f"  测试接口: POST http://localhost:{args.port}/api/chat")
     print(f"  清除历史: POST http://localhost:{args.port}/api/clear")
+    if args.use_async:
+        print(f"  并发上限: {REPLY_CONCURRENCY} | 队列上限: {REPLY_QUEUE_SIZE}")
     print("=" * 50)
     print()
 
+    if args.use_async:
+        try:
+            import uvicorn
+        except ImportError:
+            print("异步模式需要 uvicorn：pip install uvicorn", file=sys.stderr)
+            sys.exit(1)
+        uvicorn.run(asgi_app, host=args.host, port=args.port, log_level="warning")
+        return
+
     app.run(host=args.host, port=args.port, debug=args.debug)
 
 
@@ -0,0 +1,70 @@
+"""
+微信 / 企业微信回调去重 — 按 MsgId 过滤重试推送。
+
+微信服务器 5 秒内没收到响应会重推同一条消息（最多 3 次），如果不拦住，
+同一条消息会触发多次 DeepSeek 调用 + 重复回复。
+
+SeenMsgCache 是一个定长、带 TTL 的「见过的 MsgId」集合：
+  - OrderedDict 按插入顺序存，TTL 固定，所以队头永远是最早过期的，淘汰均摊 O(1)
+  - 超过 max_size 时从队头丢最旧的，内存有上限
+  - hits（拦下的重复推送 = 省下的 LLM 调用）/ misses 计数给 /health 看
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict
+
+
+def dedup_key(msg: dict) -> str:
+    """优先用 MsgId；事件类消息没有 MsgId，按官方建议用 FromUserName + CreateTime"""
+    msg_id = msg.get("msg_id", "")
+    if msg_id:
+        return msg_id
+    return f"{msg.get('from_user', '')}:{msg.get('create_time', '')}"
+
+
+class SeenMsgCache:
+    """定长 + TTL 的消息去重表（线程安全）"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def _evict(self, now: float) -> None:
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at < self.ttl and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+            self.evicted += 1
+
+    def check_and_add(self, key: str) -> bool:
+        """见过且未过期返回 True（重复推送）；否则记下来并返回 False"""
+        if not key:
+            return False
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            if key in self._seen:
+                self.hits += 1
+                return True
+            self._seen[key] = now
+            self.misses += 1
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+                self.evicted += 1
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._seen),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+            }
@@ -0,0 +1,192 @@
+"""
+MinHash + LSH 近似去重 — 合并 SFT 数据时把几乎一样的对话只留一条。
+
+合成数据是从固定的 SCENARIOS 列表里反复生成的，同一个场景常出来好几段只差几个字的对话，
+训练时等于同一段话多跑几遍 epoch。两两比较是 O(n²)，10 万条根本跑不动，这里：
+  - shingles：按字切 k-gram（中文不分词，字级别的 shingle 就够用），每个 shingle 哈希成 64 位整数
+  - MinHasher：单置换 MinHash（one permutation hashing）— 每个 shingle 只哈希一次，
+    按哈希值分进 num_perm 个桶、每桶取最小值；空桶按固定的探测顺序借别的桶的值（densification）。
+    每条样本 O(shingle 数)，比 num_perm 个独立置换快一个数量级，碰撞概率同样等于 Jaccard
+  - LSH：签名切成 bands 段、每段 rows 个值，任意一段完全相同才成为候选对。
+    rows 取「阈值处召回 >= 95%」里最大的，候选对最少
+  - 候选对用精确的 shingle 集合 Jaccard 复核（LSH 的假阳性不会被当成重复），超过阈值的用并查集连起来
+  - 并查集是传递的：a~b、b~c 不代表 a~c，一条链能把差得很远的样本连在一起。所以连通块里按下标顺序
+    逐条和已保留的样本比精确 Jaccard，够阈值才归进那一簇，都不够就自己留下来。
+    每个簇保留下标最小的那条（调用方把更想保留的数据放在前面），被去掉的每一条和它那簇保留的
+    那条都不低于阈值
+
+总开销和样本数成线性，不做两两比较。
+
+用法：
+  clusters, stats = near_duplicate_clusters(texts, threshold=0.8)
+"""
+import hashlib
+import random
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+# 阈值处至少要有这么大的概率成为候选对
+LSH_RECALL = 0.95
+
+
+def _hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str, k: int = 3) -> Set[int]:
+    """字级别 k-gram 的 64 位哈希集合；去掉空白差异，短于 k 的文本整段当一个 shingle"""
+    text = " ".join(text.split()).lower()
+    if not text:
+        return set()
+    return {_hash64(text[i:i + k]) for i in range(max(1, len(text) - k + 1))}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """返回 (bands, rows)：Jaccard 等于阈值的一对成为候选的概率 >= LSH_RECALL 时 rows 尽量大"""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """单置换 MinHash，num_perm 个桶（seed 固定，结果可复现）"""
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        # 每个桶为空时依次去看的其他桶，所有样本共用同一套顺序
+        self.probes: List[List[int]] = []
+        for i in range(num_perm):
+            order = [j for j in range(num_perm) if j != i]
+            rng.shuffle(order)
+            self.probes.append(order)
+
+    def signature(self, grams: Set[int]) -> Tuple[int, ...]:
+        n = self.num_perm
+        if not grams:
+            return (0,) * n
+        sig: List = [None] * n
+        for h in grams:
+            b, v = h % n, h // n
+            cur = sig[b]
+            if cur is None or v < cur:
+                sig[b] = v
+        if None in sig:
+            filled = sig
+            sig = [
+                v if v is not None else next(filled[j] for j in self.probes[i] if filled[j] is not None)
+                for i, v in enumerate(filled)
+            ]
+        return tuple(sig)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # 下标小的当根，簇里保留的就是最早出现的那条
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+
+def near_duplicate_clusters(
+    texts: Iterable[str],
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    k: int = 3,
+    seed: int = 1,
+) -> Tuple[List[List[int]], Dict]:
+    """
+    找出 Jaccard(字级 k-gram) >= threshold 的近似重复簇。
+    返回 (簇列表，每个簇是升序的下标、至少 2 条，第一个是要保留的; 统计)
+    """
+    hasher = MinHasher(num_perm, seed)
+    bands, rows = lsh_params(threshold, num_perm)
+    grams: List[Set[int]] = []
+    buckets: Dict[Tuple, List[int]] = defaultdict(list)
+    for i, text in enumerate(texts):
+        g = shingles(text, k)
+        grams.append(g)
+        sig = hasher.signature(g)
+        for b in range(bands):
+            buckets[(b, sig[b * rows:(b + 1) * rows])].append(i)
+
+    uf = _UnionFind(len(grams))
+    compared = 0
+    verified: Set[Tuple[int, int]] = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        # 同桶的两两复核；已经在同一簇里的跳过，一大堆完全相同的样本只会比 O(桶大小) 次
+        for a, i in enumerate(members):
+            for j in members[:a]:
+                if uf.find(i) == uf.find(j):
+                    continue
+                if (j, i) in verified:
+                    continue
+                verified.add((j, i))
+                compared += 1
+                if jaccard(grams[i], grams[j]) >= threshold:
+                    uf.union(i, j)
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(grams)):
+        groups[uf.find(i)].append(i)
+    clusters: List[List[int]] = []
+    split = 0
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        # 连通块里按下标顺序分簇：和哪个已保留的够阈值就归进哪簇，都不够就自己当保留的那条
+        kept: List[List[int]] = []
+        for i in members:
+            for cluster in kept:
+                if jaccard(grams[i], grams[cluster[0]]) >= threshold:
+                    cluster.append(i)
+                    break
+            else:
+                kept.append([i])
+        split += len(kept) - 1
+        clusters.extend(c for c in kept if len(c) > 1)
+    clusters.sort(key=lambda m: (-len(m), m[0]))
+    stats = {
+        "samples": len(grams),
+        "bands": bands,
+        "rows": rows,
+        "candidate_pairs": compared,
+        "clusters": len(clusters),
+        "removed": sum(len(m) - 1 for m in clusters),
+        # 只是被传递连进来、和保留的那条不够阈值而留下的条数
+        "transitive_kept": split,
+    }
+    return clusters, stats
+
+
+def cluster_size_histogram(clusters: Sequence[Sequence[int]]) -> Dict[int, int]:
+    """{簇大小: 簇个数}"""
+    hist: Dict[int, int] = defaultdict(int)
+    for members in clusters:
+        hist[len(members)] += 1
+    return dict(sorted(hist.items()))
@@ -0,0 +1,187 @@
+"""
+出站消息调度器 — 替代 worker 线程里的 time.sleep 逐条发送。
+
+之前 async_reply 生成完回复后，按行 send + time.sleep(0.6)，一个线程（mp_bot 里还有
+用户锁）被占住好几秒只为模拟打字。现在生成线程把整段回复交给调度器后立刻返回：
+
+  - 每个用户一条 FIFO，堆里只放各用户「下一行」的到期时间，同一用户严格按顺序发，
+    上一行发完才按 interval 排下一行，不同用户互不阻塞
+  - 调度线程按到期时间从堆里取，经过全局令牌桶限速（公众号/企业微信接口有发送频率限制）
+    后交给一个小线程池发送
+  - 某一行发送失败时，和原来的逻辑一样，把这一批剩下的行合并成一条再试一次
+"""
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Tuple
+
+SendFn = Callable[[str, str], bool]
+
+
+class _Batch:
+    __slots__ = ("lines", "index")
+
+    def __init__(self, lines: List[str]):
+        self.lines = lines
+        self.index = 0
+
+
+class OutboundDispatcher:
+    """按用户排队 + 全局限速的出站发送器"""
+
+    def __init__(
+        self,
+        send_fn: SendFn,
+        interval: float = 0.6,
+        rate_per_sec: float = 20.0,
+        burst: int = 20,
+        workers: int = 4,
+        name: str = "outbound",
+    ):
+        self.send_fn = send_fn
+        self.interval = interval
+        self.rate_per_sec = rate_per_sec
+        self.burst = max(1, burst)
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._queues: Dict[str, Deque[_Batch]] = {}
+        self._tokens = float(self.burst)
+        self._token_ts = time.monotonic()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-send")
+        self._stopped = False
+
+        self.sent = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-scheduler", daemon=True)
+        self._thread.start()
+
+    # ── 对外接口 ──
+
+    def enqueue(self, user_id: str, lines: List[str]) -> None:
+        """
+        把一段回复（多行）排进该用户的发送队列，立即返回。
+        流式回复每生成一行就调一次，同一用户的各行照样按顺序、按 interval 发
+        """
+        lines = [l for l in lines if l]
+        if not lines:
+            return
+        with self._cond:
+            queue = self._queues.get(user_id)
+            if queue is None:
+                # 该用户当前没有待发消息：第一行立即到期
+                self._queues[user_id] = deque([_Batch(lines)])
+                self._push(time.monotonic(), user_id)
+            else:
+                # 排在已有消息后面，由前一批发完后接着调度
+                queue.append(_Batch(lines))
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(len(b.lines) - b.index for q in self._queues.values() for b in q)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending_lines": self.pending(),
+            "active_users": len(self._queues),
+            "sent": self.sent,
+            "failed": self.failed,
+        }
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """等待所有已排队消息发完（测试 / 退出前用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._queues:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout=5)
+        self._pool.shutdown(wait=True)
+
+    # ── 内部 ──
+
+    def _push(self, due: float, user_id: str) -> None:
+        heapq.heappush(self._heap, (due, next(self._seq), user_id))
+        self._cond.notify()
+
+    def _take_token(self) -> float:
+        """令牌桶：有令牌返回 0，否则返回还需等待的秒数（调用方持有锁）"""
+        if self.rate_per_sec <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._token_ts) * self.rate_per_sec)
+        self._token_ts = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate_per_sec
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                due, _, user_id = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                wait = self._take_token()
+                if wait > 0:
+                    self._cond.wait(timeout=wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._pool.submit(self._send_next, user_id)
+
+    def _safe_send(self, user_id: str, content: str) -> bool:
+        try:
+            return bool(self.send_fn(user_id, content))
+        except Exception as e:
+            print(f"[{self.name}] 发送异常: {e}", file=sys.stderr, flush=True)
+            return False
+
+    def _send_next(self, user_id: str) -> None:
+        # 同一用户同一时刻只有一行在途，所以 batch 只会被当前线程推进
+        with self._cond:
+            queue = self._queues.get(user_id)
+            if not queue:
+                return
+            batch = queue[0]
+            line = batch.lines[batch.index]
+
+        ok = self._safe_send(user_id, line)
+        retried = False
+        if not ok:
+            # 和原来一样：某行发失败，就把剩下的合并成一条再试一次
+            retried = self._safe_send(user_id, "\n".join(batch.lines[batch.index:]))
+
+        with self._cond:
+            if ok:
+                self.sent += 1
+                batch.index += 1
+            else:
+                self.failed += 1
+                self.sent += int(retried)
+                batch.index = len(batch.lines)
+
+            if batch.index >= len(batch.lines):
+                queue.popleft()
+            if queue:
+                self._push(time.monotonic() + self.interval, user_id)
+            else:
+                self._queues.pop(user_id, None)
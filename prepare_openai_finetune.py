@@ -11,6 +11,8 @@ import sys
 import tiktoken
 from collections import Counter
 
+from sft_store import load_sft
+
 random.seed(42)
 
 INPUT = "./training_data/sft-joker-clean.json"
@@ -83,8 +85,7 @@ def quality_score(conv: dict) -> float:
 
 
 def main():
-    with open(INPUT, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_sft(INPUT)
     print(f"原始数据: {len(data)} 条")
 
     try:
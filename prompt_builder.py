@@ -1,10 +1,24 @@
 """
 增强版 Prompt 构建器 — Many-Shot Prompting
-将全部真实聊天记录嵌入 system prompt，让 DeepSeek 从大量真实示例中学习说话风格。
+将真实聊天记录嵌入 prompt，让 DeepSeek 从大量真实示例中学习说话风格。
+
+消息布局按 DeepSeek 前缀缓存（context caching）设计，越稳定的越靠前：
+  1. system：人设 + 固定示例 —— 对所有用户、所有轮次逐字节相同
+  1.5 前情摘要（可选）—— 只在折叠旧轮次时变化
+  2. 历史对话 —— 与上一轮发出去的内容完全一致（不再给历史里的消息加标记）
+  3. 本轮上下文（system）：检索出的相关示例 + 接话提醒 —— 每轮都变，所以放最后
+  4. 当前用户输入
+
+system prompt 按 (人设, 风格 tag, 示例内容 hash) 缓存：示例文本可能有几百 KB，
+不用每条回复都重新 replace / join 一遍。样本文件变化时由 bot 调用
+invalidate_prompt_cache() 失效旧条目。
 """
+import hashlib
 import json
-from typing import Dict, List, Optional
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 from chat_parser import parse_chat_file, conversations_to_example_text
+from token_budget import MESSAGE_OVERHEAD, TokenBudgeter, join_examples
 
 
 def load_styles(path: str) -> Dict:
@@ -69,19 +83,118 @@ SYSTEM_TEMPLATE = """你是「晴晴」，正在用微信和一个暧昧对象
 【最后提醒】回复前先仔细读一遍上面的对话历史！对方前面说过的话不要当没看到，不要重复问已经聊过的内容。"""
 
 
-def build_system_prompt(chat_examples_text: str) -> str:
+# 没有固定示例（改为每轮检索）时，从 system prompt 里整段去掉
+_EXAMPLES_BLOCK = (
+    "下面是你的真实聊天记录，只用来学习说话风格。"
+    "注意：只学「晴晴」的语气和回复方式，不要照搬具体内容到新对话中。\n\n{examples}\n\n"
+)
+
+RELEVANT_EXAMPLES_INTRO = (
+    "下面是和当前话题相关的几段真实聊天记录，只用来学习「晴晴」的说话风格，"
+    "不要照搬具体内容到新对话中。"
+)
+
+CONTINUE_HINT = "（续上面的对话）回复前先结合前面几轮的对话内容，不要自相矛盾。"
+
+
+# ── system prompt 缓存 ─────────────────────────────────────────
+
+# 同时存在的示例集合很少（每种人格/风格一份），超过上限说明调用方在传一次性文本，直接清空
+_PROMPT_CACHE_MAX = 64
+
+_prompt_cache: Dict[Tuple[str, str, str], str] = {}
+_prompt_cache_lock = threading.Lock()
+
+
+def examples_digest(text: str) -> str:
+    """示例文本的内容 hash，作为缓存 key 的一部分；bot 加载样本时算一次即可"""
+    if not text:
+        return ""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def cached_system_prompt(
+    persona: str,
+    style_tag: str,
+    examples_text: str,
+    build_fn: Callable[[], str],
+    examples_key: Optional[str] = None,
+) -> str:
+    """
+    取 (persona, style_tag, examples_key) 对应的 system prompt，没有就调用 build_fn 生成。
+    examples_key 不传时现算 examples_text 的 hash（比每次拼接便宜，但最好由调用方预先算好）。
+    """
+    if examples_key is None:
+        examples_key = examples_digest(examples_text)
+    key = (persona, style_tag, examples_key)
+    prompt = _prompt_cache.get(key)
+    if prompt is not None:
+        return prompt
+
+    prompt = build_fn()
+    with _prompt_cache_lock:
+        if len(_prompt_cache) >= _PROMPT_CACHE_MAX:
+            _prompt_cache.clear()
+        _prompt_cache[key] = prompt
+    return prompt
+
+
+def invalidate_prompt_cache(examples_key: Optional[str] = None) -> None:
+    """样本文件变了：清掉用旧示例 hash 生成的条目；不传则全部清空"""
+    with _prompt_cache_lock:
+        if examples_key is None:
+            _prompt_cache.clear()
+            return
+        for key in [k for k in _prompt_cache if k[2] == examples_key]:
+            del _prompt_cache[key]
+
+
+def _render_system_prompt(chat_examples_text: str) -> str:
+    if not chat_examples_text:
+        return SYSTEM_TEMPLATE.replace(_EXAMPLES_BLOCK, "")
     return SYSTEM_TEMPLATE.replace("{examples}", chat_examples_text)
 
 
-def build_messages(
+def build_system_prompt(chat_examples_text: str, examples_key: Optional[str] = None) -> str:
+    return cached_system_prompt(
+        "qingqing", "", chat_examples_text,
+        lambda: _render_system_prompt(chat_examples_text),
+        examples_key,
+    )
+
+
+def build_turn_context(
+    turn_examples_text: str = "",
+    history: Optional[List[Dict]] = None,
+    examples_intro: str = RELEVANT_EXAMPLES_INTRO,
+) -> str:
+    """本轮才有的内容（检索示例 + 接话提醒），放在消息末尾，不破坏前面的缓存前缀"""
+    parts = []
+    if turn_examples_text:
+        parts.append(f"{examples_intro}\n\n{turn_examples_text}")
+    # 有多轮历史时，提醒模型注意上下文
+    if history and len(history) >= 2:
+        parts.append(CONTINUE_HINT)
+    return "\n\n".join(parts)
+
+
+SUMMARY_INTRO = "【前情摘要】下面是你们更早之前聊过的内容，聊天时自然接上，不要复述："
+
+
+def assemble_messages(
+    system_prompt: str,
     user_input: str,
-    styles: Dict,
-    tag_key: str,
-    chat_examples_text: str,
     history: Optional[List[Dict]] = None,
+    turn_context: str = "",
+    summary: str = "",
 ) -> List[Dict]:
-    system_prompt = build_system_prompt(chat_examples_text)
+    """
+    按「稳定前缀 → 摘要 → 历史 → 易变尾部」的顺序拼 messages（晴晴 / Joker 共用）。
+    摘要只在折叠旧轮次时才变，放在历史前面不影响相邻两轮之间的缓存前缀。
+    """
     messages: List[Dict] = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"{SUMMARY_INTRO}\n{summary}"})
 
     if history:
         for item in history:
@@ -90,12 +203,79 @@ def build_messages(
             if role in ("user", "assistant") and content:
                 messages.append({"role": role, "content": content})
 
-    # 有多轮历史时，提醒模型注意上下文
-    if history and len(history) >= 2:
-        messages.append({
-            "role": "user",
-            "content": f"（续上面的对话）{user_input}",
-        })
-    else:
-        messages.append({"role": "user", "content": user_input})
+    if turn_context:
+        messages.append({"role": "system", "content": turn_context})
+    messages.append({"role": "user", "content": user_input})
     return messages
+
+
+def fit_prompt_budget(
+    budgeter: Optional[TokenBudgeter],
+    system_fn: Callable[[str, Optional[str]], str],
+    user_input: str,
+    chat_examples_text: str,
+    examples_key: Optional[str],
+    turn_examples_text: str,
+    history: Optional[List[Dict]],
+    summary: str = "",
+) -> Tuple[str, Optional[str], str, List[Dict]]:
+    """
+    按 token 预算裁剪：先丢本轮检索示例，再丢固定示例，最后丢最早的历史。
+    system_fn(示例文本, examples_key) -> system prompt（走缓存）。
+    返回裁剪后的 (固定示例, examples_key, 检索示例, 历史)；没超预算时原样返回。
+    """
+    history = list(history or [])
+    if budgeter is None or budgeter.input_budget <= 0:
+        return chat_examples_text, examples_key, turn_examples_text, history
+
+    count = budgeter.counter.count
+    static_blocks, static_prefix = budgeter.example_blocks(chat_examples_text, examples_key)
+    turn_blocks, turn_prefix = budgeter.example_blocks(turn_examples_text)
+    full_system = system_fn(chat_examples_text, examples_key)
+    # 不可裁剪部分：system prompt 去掉示例、摘要、接话提醒 + 示例引导语、当前输入，外加每条消息的开销
+    base = (
+        budgeter.system_base(full_system, static_prefix)
+        + count(summary) + count(SUMMARY_INTRO)
+        + count(CONTINUE_HINT) + count(RELEVANT_EXAMPLES_INTRO)
+        + count(user_input)
+        + 4 * MESSAGE_OVERHEAD
+    )
+    n_static, n_turn, start = budgeter.plan(base, static_prefix, turn_prefix, history)
+
+    if n_static < len(static_blocks):
+        chat_examples_text = budgeter.trimmed_examples(static_blocks, n_static, examples_key)
+        # 同样的裁剪结果用同一个 key，system prompt 缓存和前缀缓存都还能命中
+        if not n_static:
+            examples_key = ""
+        elif examples_key:
+            examples_key = f"{examples_key}@{n_static}"
+    if n_turn < len(turn_blocks):
+        turn_examples_text = join_examples(turn_blocks[:n_turn])
+    return chat_examples_text, examples_key, turn_examples_text, history[start:]
+
+
+def build_messages(
+    user_input: str,
+    styles: Dict,
+    tag_key: str,
+    chat_examples_text: str,
+    history: Optional[List[Dict]] = None,
+    turn_examples_text: str = "",
+    examples_key: Optional[str] = None,
+    summary: str = "",
+    budgeter: Optional[TokenBudgeter] = None,
+) -> List[Dict]:
+    """
+    chat_examples_text: 固定示例，进 system prompt（所有轮次相同，可被缓存）
+    turn_examples_text: 本轮检索出的示例，放在末尾
+    examples_key: chat_examples_text 的 examples_digest()，预先算好可省掉每轮的 hash
+    summary: 更早轮次的滚动摘要（见 history_summary）
+    budgeter: 传了就按 token 预算裁剪示例和历史
+    """
+    chat_examples_text, examples_key, turn_examples_text, history = fit_prompt_budget(
+        budgeter, build_system_prompt, user_input,
+        chat_examples_text, examples_key, turn_examples_text, history, summary,
+    )
+    system_prompt = build_system_prompt(chat_examples_text, examples_key)
+    turn_context = build_turn_context(turn_examples_text, history)
+    return assemble_messages(system_prompt, user_input, history, turn_context, summary)
@@ -1,7 +1,14 @@
-import torch, re, json
+"""
+用法：
+  python quick_test.py            # 每次都重新生成
+  python quick_test.py --cache    # 生成结果缓存到磁盘，LoRA 没变时重跑直接读缓存（全命中不加载模型）
+"""
+import torch, re, json, sys
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
 
+from response_cache import ResponseCache, cache_key, model_fingerprint
+
 BASE_PATH = "/root/autodl-tmp/Qwen2.5-14B-Instruct"
 LORA_PATH = "/root/autodl-tmp/output-qwen25"
 
@@ -18,24 +25,42 @@ for conv in data:
 
 SYSTEM += "\n\n【最最重要的规则】你只能根据对方实际发的消息来回复。绝对禁止编造对方没说过的事情、人物、场景。如果对方只是打招呼，你就正常回应打招呼，不要凭空生成话题。"
 
-print("Loading model...")
-tokenizer = AutoTokenizer.from_pretrained(BASE_PATH, trust_remote_code=True)
-model = AutoModelForCausalLM.from_pretrained(
-    BASE_PATH, torch_dtype=torch.bfloat16, device_map="cuda:0", trust_remote_code=True
-)
-model = PeftModel.from_pretrained(model, LORA_PATH, device_map="cuda:0")
-model.eval()
-print("Model loaded!\n")
+cache = ResponseCache() if "--cache" in sys.argv else None
+MODEL_ID = model_fingerprint(BASE_PATH, LORA_PATH)
+GEN_PARAMS = dict(do_sample=True, temperature=0.7, top_p=0.9, repetition_penalty=1.1)
+
+tokenizer = model = None
+
+def load():
+    # 开了缓存时延迟到第一次未命中才加载模型
+    global tokenizer, model
+    if model is not None:
+        return
+    print("Loading model...")
+    tokenizer = AutoTokenizer.from_pretrained(BASE_PATH, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        BASE_PATH, torch_dtype=torch.bfloat16, device_map="cuda:0", trust_remote_code=True
+    )
+    model = PeftModel.from_pretrained(model, LORA_PATH, device_map="cuda:0")
+    model.eval()
+    print("Model loaded!\n")
 
-def chat(user_msg, max_new_tokens=512):
+if cache is None:
+    load()
+
+def chat(user_msg, max_new_tokens=512, sample=0):
     msgs = [{"role": "system", "content": SYSTEM}, {"role": "user", "content": user_msg}]
+    if cache is None:
+        return generate(msgs, max_new_tokens)
+    key = cache_key(MODEL_ID, msgs, {**GEN_PARAMS, "max_new_tokens": max_new_tokens}, sample)
+    return cache.get_or_generate(key, lambda: generate(msgs, max_new_tokens), model=MODEL_ID)
+
+def generate(msgs, max_new_tokens):
+    load()
     text = tokenizer.apply_chat_template(msgs, tokenize=False, add_generation_prompt=True)
     inputs = tokenizer(text, return_tensors="pt").to(model.device)
     with torch.no_grad():
-        out = model.generate(
-            **inputs, max_new_tokens=max_new_tokens,
-            do_sample=True, temperature=0.7, top_p=0.9, repetition_penalty=1.1,
-        )
+        out = model.generate(**inputs, max_new_tokens=max_new_tokens, **GEN_PARAMS)
     r = tokenizer.decode(out[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
     r = re.sub(r"<think>.*?</think>", "", r, flags=re.DOTALL).strip()
     return r
@@ -56,3 +81,6 @@ for t in tests:
     print(f"对方: {t}")
     print(f"Joker: {reply}")
     print()
+
+if cache is not None:
+    print(f"[cache] {cache.stats()}")
@@ -0,0 +1,86 @@
+"""
+有界回复队列 — 异步服务模式下代替「每条消息开一个线程」。
+
+固定数量的 worker 协程从有界队列里取任务执行：
+  concurrency  同时在跑的任务上限（也就是同时挂在 DeepSeek 上的请求上限）
+  max_queue    排队上限。队列满时 submit() 立即返回 False，由调用方决定怎么兜底
+               （比如回一句被动消息），而不是无限堆积内存和线程。
+"""
+import asyncio
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional
+
+Job = Callable[[], Awaitable[None]]
+
+
+class BoundedReplyQueue:
+    """有界队列 + 固定 worker 池，必须在事件循环里 start()"""
+
+    def __init__(self, concurrency: int = 64, max_queue: int = 2000, name: str = "reply"):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(1, max_queue)
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self.running = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        print(f"[{self.name}] worker 池已启动：并发 {self.concurrency}，队列上限 {self.max_queue}")
+
+    def submit(self, job: Job) -> bool:
+        """投递任务；队列满（背压）时返回 False"""
+        if self._queue is None:
+            raise RuntimeError("BoundedReplyQueue 未启动")
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def join(self) -> None:
+        """等待队列里已投递的任务全部执行完"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self.running,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+        }
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        while True:
+            job = await self._queue.get()
+            self.running += 1
+            try:
+                await job()
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[{self.name}] 任务异常: {e}", file=sys.stderr, flush=True)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
@@ -0,0 +1,164 @@
+"""
+生成结果的磁盘缓存 — 数据生成 / 评测脚本重跑时不用再付一遍钱、等一遍 GPU。
+
+generate_joker 在 temperature 0.95 下逐条调 DeepSeek，崩了重跑会把已经生成过的 prompt
+再请求一遍；quick_test.py / test_both.py 每次都把固定的测试问题重新生成一遍。
+ResponseCache：
+  - 内容寻址：key = sha256(模型, messages, 采样参数, 第几个样本)，同一组输入的
+    第 0 / 1 / 2 ... 个样本各自缓存，温度 > 0 时也能复现同一次运行
+  - 存在一个 SQLite 文件里（WAL），按 last_used 做 LRU，总大小超过 max_mb 就从
+    最久没用的开始删
+  - 按调用点显式开启（--cache），默认不缓存，线上 bot 不走这里
+
+本地模型的「模型名」用 model_fingerprint(底座路径, LoRA 路径)：LoRA 重新训练后
+文件 mtime / 大小变了，旧缓存自然失效。
+
+用法：
+  cache = ResponseCache("./.cache/responses.db")
+  key = cache_key("deepseek-chat", messages, {"temperature": 0.95, "max_tokens": 800}, sample=3)
+  text = cache.get(key)
+  if text is None:
+      text = call_deepseek(...)
+      cache.put(key, text, model="deepseek-chat")
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./.cache/responses.db")
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "512"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key        TEXT PRIMARY KEY,
+    model      TEXT NOT NULL,
+    response   TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_lru ON responses (last_used);
+"""
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict],
+    params: Dict,
+    sample: Union[int, str] = 0,
+) -> str:
+    """(模型, messages, 采样参数, 第几个样本) 的内容 hash"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params, "sample": sample},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def model_fingerprint(*paths: str) -> str:
+    """本地模型的标识：路径 + 目录下各文件的大小和 mtime（权重换了 key 就变）"""
+    parts = []
+    for path in paths:
+        parts.append(path)
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            files = [os.path.join(path, n) for n in names if os.path.isfile(os.path.join(path, n))]
+        else:
+            files = [path] if os.path.exists(path) else []
+        for f in files:
+            st = os.stat(f)
+            parts.append(f"{os.path.basename(f)}:{st.st_size}:{int(st.st_mtime)}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """SQLite 上的内容寻址缓存，按总大小做 LRU 淘汰（线程安全）"""
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_mb: float = RESPONSE_CACHE_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = "") -> None:
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._bytes += size - (old[0] if old else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """从最久没用的开始删，删到 90% 上限以下（调用方持有锁）"""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        victims = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            victims.append((key,))
+            self._bytes -= size
+        self._conn.execute("BEGIN")
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.execute("COMMIT")
+        self.evicted += len(victims)
+
+    def get_or_generate(self, key: str, generate: Callable[[], Optional[str]], model: str = "") -> Optional[str]:
+        """
+        命中直接返回；否则调 generate()，结果非空才写缓存
+        （生成失败 / 解析不了的结果不缓存，重跑时会重新生成）
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        result = generate()
+        if result:
+            self.put(key, result, model=model)
+        return result
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "entries": len(self),
+            "mb": round(self._bytes / 1024 / 1024, 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
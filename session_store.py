@@ -0,0 +1,211 @@
+"""
+按用户存会话状态的有界容器 — 历史对话、用户锁都放这里。
+
+之前 bot 的 _histories、mp_bot 的 _user_locks 都是普通 dict，每个给公众号发过
+消息的 openid 都会一直留在内存里直到重启。SessionStore：
+  - LRU：OrderedDict 按最近访问排序，超过 max_sessions 从最久没访问的开始淘汰
+  - 闲置 TTL：超过 idle_ttl 秒没访问的会话读到时视为不存在，写入时顺手从队头清掉
+  - 内存上限：传了 size_fn 就按它估算每个会话占的字节数，总量超过 max_bytes 也淘汰
+  - evictable：正在使用的条目（比如被持有的锁）不淘汰，避免同一用户出现两把锁
+
+历史按 Turn（__slots__ 记录）的元组存，比每轮一个 dict 省内存。
+
+默认上限可以用环境变量调整：
+  SESSION_MAX_USERS   最多保留多少个用户的会话（默认 10000）
+  SESSION_IDLE_TTL    闲置多少秒后丢弃（默认 86400，一天）
+  SESSION_MAX_MB      历史总内存上限，单位 MB（默认 200，0 表示不限）
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "86400"))
+SESSION_MAX_MB = float(os.getenv("SESSION_MAX_MB", "200"))
+
+_MISSING = object()
+
+
+class Turn:
+    """一条历史消息（比 {"role": ..., "content": ...} 小得多）"""
+
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+History = Tuple[Turn, ...]
+
+# Turn 实例（两个槽位）+ 元组里一个指针的大致开销
+_TURN_OVERHEAD = sys.getsizeof(Turn("user", "")) + 8
+
+
+def pack_history(messages: Sequence[Dict]) -> History:
+    return tuple(Turn(m["role"], m["content"]) for m in messages)
+
+
+def unpack_history(turns: History) -> List[Dict[str, str]]:
+    return [t.to_dict() for t in turns]
+
+
+def history_bytes(turns: History) -> int:
+    """估算一份历史占的内存（字符串本身 + 每条记录的固定开销）"""
+    return sys.getsizeof(turns) + sum(_TURN_OVERHEAD + sys.getsizeof(t.content) for t in turns)
+
+
+class SessionStore:
+    """LRU + 闲置 TTL + 内存上限的 {user_id: value} 容器（线程安全）"""
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_USERS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_bytes: int = 0,
+        size_fn: Optional[Callable[[Any], int]] = None,
+        evictable: Optional[Callable[[Any], bool]] = None,
+        name: str = "sessions",
+    ):
+        """
+        max_bytes: 总内存上限（需要同时传 size_fn），0 表示不限
+        evictable: 返回 False 的条目暂时不淘汰（比如正被持有的锁）
+        """
+        self.max_sessions = max(1, max_sessions)
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes if size_fn else 0
+        self.size_fn = size_fn
+        self.evictable = evictable
+        self.name = name
+
+        # {key: [value, last_access, size]}，按最近访问排序（队头最久没访问）
+        self._items: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+        self.evicted_memory = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _expired(self, entry: list, now: float) -> bool:
+        return self.idle_ttl > 0 and now - entry[1] > self.idle_ttl
+
+    def _can_evict(self, entry: list) -> bool:
+        return self.evictable is None or self.evictable(entry[0])
+
+    def _drop(self, key: str) -> None:
+        entry = self._items.pop(key)
+        self._bytes -= entry[2]
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        """
+        从队头（最久没访问）开始淘汰：先清闲置过期的，再处理数量 / 内存超限。
+        不能淘汰的条目（正在用）挪到队尾；keep 是刚写入的 key，这一轮不淘汰。
+        """
+        skipped = 0
+        while self._items and skipped < len(self._items):
+            key, entry = next(iter(self._items.items()))
+            expired = self._expired(entry, now)
+            over_count = len(self._items) > self.max_sessions
+            over_memory = bool(self.max_bytes) and self._bytes > self.max_bytes
+            if not (expired or over_count or over_memory):
+                break
+            if key == keep or not self._can_evict(entry):
+                self._items.move_to_end(key)
+                skipped += 1
+                continue
+            self._drop(key)
+            if expired:
+                self.evicted_idle += 1
+            elif over_count:
+                self.evicted_lru += 1
+            else:
+                self.evicted_memory += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry, now) and self._can_evict(entry):
+                self._drop(key)
+                self.evicted_idle += 1
+                return default
+            entry[1] = now
+            self._items.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        size = self.size_fn(value) if self.size_fn else 0
+        with self._lock:
+            if key in self._items:
+                self._drop(key)
+            self._items[key] = [value, now, size]
+            self._bytes += size
+            self._evict(now, keep=key)
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        """取 key 对应的值，不存在（或已过期）就用 factory() 新建；整个过程原子"""
+        now = time.time()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and not (self._expired(entry, now) and self._can_evict(entry)):
+                entry[1] = now
+                self._items.move_to_end(key)
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+                self.evicted_idle += 1
+            value = factory()
+            size = self.size_fn(value) if self.size_fn else 0
+            self._items[key] = [value, now, size]
+            self._bytes += size
+            self._evict(now, keep=key)
+            return value
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            self._evict(time.time())
+            return {
+                "live": len(self._items),
+                "approx_bytes": self._bytes,
+                "evicted_lru": self.evicted_lru,
+                "evicted_idle": self.evicted_idle,
+                "evicted_memory": self.evicted_memory,
+            }
+
+
+def history_store(
+    max_sessions: int = SESSION_MAX_USERS,
+    idle_ttl: float = SESSION_IDLE_TTL,
+    max_mb: float = SESSION_MAX_MB,
+) -> SessionStore:
+    """存历史对话的 SessionStore：值是 pack_history() 的结果，按 history_bytes 计内存"""
+    return SessionStore(
+        max_sessions=max_sessions,
+        idle_ttl=idle_ttl,
+        max_bytes=int(max_mb * 1024 * 1024),
+        size_fn=history_bytes,
+        name="history",
+    )
@@ -0,0 +1,172 @@
+"""
+SFT 数据集的紧凑存储 — 每个不同的 system prompt 只存一份，样本里按编号引用。
+
+sft-joker-chat.json、sft-daily.json 这些文件里每条样本的第一轮都是完整的
+build_joker_system_prompt（几 KB），500 条的 sft-daily.json 有 2.4MB，几乎全是同几段
+system prompt 的重复，加载也慢。这里的 interned 格式：
+
+  {"format": "sft-interned/1",
+   "system_prompts": ["你是「雨中的马孔多」…", …],
+   "samples": [
+  {"_system": 0, "conversations": [{"from": "human", …}, …], "style": "daily", "source": "…"},
+  …
+  ]}
+
+  - 样本第一轮是 {"from": "system", "value": …} 时提到 system_prompts 表里，样本里只留编号
+    （_system 键放在原来 conversations 的前面，其余键的顺序不变）；其他形式的 system 轮原样保留
+  - 展开后和 LLaMA-Factory 的 ShareGPT 格式（llamafactory_config/dataset_info.json 的
+    from / value / human / gpt / system）完全一致：unpack 出来的文件和原文件逐字节相同，
+    同一段 system prompt 在内存里也只有一个字符串对象
+  - load_sft 两种格式都能读，数据处理脚本读输入时用它；给 LLaMA-Factory 训练用的文件仍是 ShareGPT
+
+用法：
+  python sft_store.py pack training_data/sft-daily.json      # → training_data/sft-daily.interned.json
+  python sft_store.py unpack training_data/sft-daily.interned.json -o training_data/sft-daily.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+INTERNED_FORMAT = "sft-interned/1"
+INTERNED_SUFFIX = ".interned.json"
+
+# 和 llamafactory_config/dataset_info.json 里的 tags 一致
+ROLE_TAG = "from"
+CONTENT_TAG = "value"
+SYSTEM_TAG = "system"
+MESSAGES_KEY = "conversations"
+SYSTEM_REF_KEY = "_system"
+
+
+def intern_samples(samples: List[Dict]) -> Dict:
+    """ShareGPT 样本列表 → interned 结构"""
+    prompts: List[str] = []
+    ids: Dict[str, int] = {}
+    packed = []
+    for n, sample in enumerate(samples):
+        if SYSTEM_REF_KEY in sample:
+            raise ValueError(f"第 {n} 条样本已有 {SYSTEM_REF_KEY} 字段，和 interned 格式的保留字段冲突")
+        conv = sample.get(MESSAGES_KEY)
+        first = conv[0] if isinstance(conv, list) and conv else None
+        if not (isinstance(first, dict) and list(first) == [ROLE_TAG, CONTENT_TAG]
+                and first[ROLE_TAG] == SYSTEM_TAG and isinstance(first[CONTENT_TAG], str)):
+            packed.append(sample)
+            continue
+        prompt = first[CONTENT_TAG]
+        sid = ids.get(prompt)
+        if sid is None:
+            sid = ids[prompt] = len(prompts)
+            prompts.append(prompt)
+        item = {}
+        for key, value in sample.items():
+            if key == MESSAGES_KEY:
+                item[SYSTEM_REF_KEY] = sid
+                value = conv[1:]
+            item[key] = value
+        packed.append(item)
+    return {"format": INTERNED_FORMAT, "system_prompts": prompts, "samples": packed}
+
+
+def expand_samples(doc: Dict) -> List[Dict]:
+    """interned 结构 → ShareGPT 样本列表（同一段 system prompt 共用一个字符串）"""
+    if doc.get("format") != INTERNED_FORMAT:
+        raise ValueError(f"不认识的数据格式: {doc.get('format')!r}")
+    prompts = doc["system_prompts"]
+    samples = []
+    for item in doc["samples"]:
+        sid = item.get(SYSTEM_REF_KEY)
+        if sid is None:
+            samples.append(item)
+            continue
+        sample = {}
+        for key, value in item.items():
+            if key == SYSTEM_REF_KEY:
+                continue
+            if key == MESSAGES_KEY:
+                value = [{ROLE_TAG: SYSTEM_TAG, CONTENT_TAG: prompts[sid]}] + value
+            sample[key] = value
+        samples.append(sample)
+    return samples
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def save_interned(samples: List[Dict], path: str) -> Dict:
+    """写 interned 文件（一条样本一行，先写临时文件再 os.replace），返回 interned 结构"""
+    doc = intern_samples(samples)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write('{"format":%s,\n"system_prompts":%s,\n"samples":[' % (
+            _dumps(doc["format"]), _dumps(doc["system_prompts"])))
+        for i, item in enumerate(doc["samples"]):
+            f.write(("\n" if i == 0 else ",\n") + _dumps(item))
+        f.write("\n]}\n")
+    os.replace(tmp, path)
+    return doc
+
+
+def save_sharegpt(samples: List[Dict], path: str) -> None:
+    """写 LLaMA-Factory 用的 ShareGPT JSON（和仓库里其他脚本一样 indent=2）"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(samples, f, ensure_ascii=False, indent=2)
+
+
+def load_sft(path: str) -> List[Dict]:
+    """读 SFT 数据集，ShareGPT JSON 数组和 interned 格式都行，返回 ShareGPT 样本列表"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return expand_samples(data)
+    return data
+
+
+def _size(path: str) -> str:
+    return f"{os.path.getsize(path) / 1e6:.2f}MB"
+
+
+def _default_output(path: str, command: str) -> str:
+    if command == "pack":
+        return os.path.splitext(path)[0] + INTERNED_SUFFIX
+    if path.endswith(INTERNED_SUFFIX):
+        return path[:-len(INTERNED_SUFFIX)] + ".json"
+    return os.path.splitext(path)[0] + ".sharegpt.json"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="SFT 数据集 ShareGPT ⇄ interned 格式转换")
+    parser.add_argument("command", choices=["pack", "unpack"],
+                        help="pack: ShareGPT → interned；unpack: interned → ShareGPT")
+    parser.add_argument("input")
+    parser.add_argument("-o", "--output", default=None,
+                        help=f"默认 pack 输出 <输入>{INTERNED_SUFFIX}，unpack 去掉 .interned")
+    args = parser.parse_args(argv)
+
+    output = args.output or _default_output(args.input, args.command)
+    if os.path.abspath(output) == os.path.abspath(args.input):
+        print("输出文件不能和输入文件相同", file=sys.stderr)
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    samples = load_sft(args.input)
+    if args.command == "pack":
+        doc = save_interned(samples, output)
+        # 写完读回来对一遍，确认无损
+        if load_sft(output) != samples:
+            print(f"[pack] {output} 展开后和输入不一致", file=sys.stderr)
+            sys.exit(1)
+        hoisted = sum(1 for item in doc["samples"] if SYSTEM_REF_KEY in item)
+        print(f"[pack] {len(samples)} 条（{hoisted} 条引用 system prompt 表），"
+              f"{len(doc['system_prompts'])} 个不同的 system prompt")
+    else:
+        save_sharegpt(samples, output)
+        print(f"[unpack] {len(samples)} 条")
+    print(f"  {args.input} ({_size(args.input)}) → {output} ({_size(output)}) | {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
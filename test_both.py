@@ -1,7 +1,16 @@
+"""
+用法：
+  python test_both.py qwen25            # 测 Qwen2.5 LoRA
+  python test_both.py qwen3 --cache     # 生成结果缓存到磁盘，LoRA 没变时重跑直接读缓存（全命中不加载模型）
+"""
 import torch, re, sys
 from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
 
+from response_cache import ResponseCache, cache_key, model_fingerprint
+
+GEN_PARAMS = dict(do_sample=True, temperature=0.7, top_p=0.9, repetition_penalty=1.1)
+
 def load_model(base_path, lora_path, device):
     tokenizer = AutoTokenizer.from_pretrained(base_path, trust_remote_code=True)
     model = AutoModelForCausalLM.from_pretrained(
@@ -17,11 +26,7 @@ def chat(tokenizer, model, system, user_msg, max_new_tokens=512):
     text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
     inputs = tokenizer(text, return_tensors="pt").to(model.device)
     with torch.no_grad():
-        out = model.generate(
-            **inputs, max_new_tokens=max_new_tokens,
-            do_sample=True, temperature=0.7, top_p=0.9,
-            repetition_penalty=1.1
-        )
+        out = model.generate(**inputs, max_new_tokens=max_new_tokens, **GEN_PARAMS)
     response = tokenizer.decode(out[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
     response = re.sub(r"<think>.*?</think>", "", response, flags=re.DOTALL).strip()
     if "<think>" in response:
@@ -63,16 +68,33 @@ MODELS = {
 }
 
 if __name__ == "__main__":
-    model_name = sys.argv[1] if len(sys.argv) > 1 else "qwen25"
+    args = [a for a in sys.argv[1:] if a != "--cache"]
+    model_name = args[0] if args else "qwen25"
     cfg = MODELS[model_name]
+    cache = ResponseCache() if "--cache" in sys.argv else None
+    model_id = model_fingerprint(cfg["base"], cfg["lora"])
 
     print(f"\n===== {cfg['label']} =====")
-    print("加载模型中...")
-    tokenizer, model = load_model(cfg["base"], cfg["lora"], cfg["device"])
-    print("模型加载完成!\n")
+    loaded = []
+
+    def generate(msg):
+        # 开了缓存时延迟到第一次未命中才加载模型
+        if not loaded:
+            print("加载模型中...")
+            loaded.extend(load_model(cfg["base"], cfg["lora"], cfg["device"]))
+            print("模型加载完成!\n")
+        return chat(loaded[0], loaded[1], SYSTEM, msg)
 
     for style, msg in TESTS:
-        reply = chat(tokenizer, model, SYSTEM, msg)
+        if cache is None:
+            reply = generate(msg)
+        else:
+            messages = [{"role": "system", "content": SYSTEM}, {"role": "user", "content": msg}]
+            key = cache_key(model_id, messages, {**GEN_PARAMS, "max_new_tokens": 512})
+            reply = cache.get_or_generate(key, lambda: generate(msg), model=model_id)
         print(f"[{style}] 对方: {msg}")
         print(f"Joker: {reply}")
         print()
+
+    if cache is not None:
+        print(f"[cache] {cache.stats()}")
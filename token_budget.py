@@ -0,0 +1,233 @@
+"""
+Prompt token 预算 — 拼好的 messages 有多少 token、超了先砍什么。
+
+之前代码里没有任何地方知道一次请求有多少 token（只有 len(text) * 1.5 的估算）。
+这里：
+  - TokenCounter：用 tiktoken（cl100k_base，和 prepare_openai_finetune 一致）计数，
+    没装 tiktoken 或 BPE 文件下载不了时退回按字数估算；按文本缓存计数结果，system prompt / 示例块 /
+    历史消息这些不会变的片段只算一次
+  - TokenBudgeter.plan()：总量超过 input_budget 时，先从末尾丢本轮检索示例，
+    再丢固定示例，最后从最早的历史开始成对丢，保证请求不会撑爆上下文窗口
+
+预算可用环境变量 PROMPT_TOKEN_BUDGET 调整（默认 32000，0 表示不限制）。
+"""
+import os
+import re
+import sys
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from example_retriever import approx_tokens
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "32000"))
+
+# 每条 message 的格式开销（role、分隔符），和 OpenAI 的计法一致
+MESSAGE_OVERHEAD = 4
+
+_EXAMPLE_SPLIT = re.compile(r"\n\n(?=【对话\d+】)")
+
+
+def split_examples(text: str) -> List[str]:
+    """把 conversations_to_example_text 的结果拆回一段段对话"""
+    return _EXAMPLE_SPLIT.split(text) if text else []
+
+
+def join_examples(blocks: Sequence[str]) -> str:
+    return "\n\n".join(blocks)
+
+
+class TokenCounter:
+    """带缓存的 token 计数器（线程安全，缓存按写入顺序淘汰）"""
+
+    def __init__(self, max_entries: int = 8192):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            import tiktoken
+        except ImportError:
+            self._use_estimate("未安装 tiktoken，token 数按字数估算（pip install tiktoken）")
+            return
+        try:
+            # 第一次用要下载 BPE 文件，离线 / 被墙时抛的是网络错误，不是 ImportError
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+            self.name = "tiktoken"
+        except Exception as e:
+            self._use_estimate(f"tiktoken 加载 cl100k_base 失败（{type(e).__name__}: {e}），token 数按字数估算")
+
+    def _use_estimate(self, reason: str) -> None:
+        self._encoding = None
+        self.name = "估算"
+        print(f"[budget] {reason}", file=sys.stderr)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        # str 的 hash 算过一次就缓存在对象上，同一个大字符串反复查是 O(1)。
+        # 命中时不加锁、也不挪到队尾（每轮要查十来次，锁和 move_to_end 比查表本身还贵），
+        # 满了按写入顺序淘汰，被挤掉的大不了重新算一次
+        n = self._cache.get(text)
+        if n is not None:
+            return n
+        if self._encoding is not None:
+            n = len(self._encoding.encode(text, disallowed_special=()))
+        else:
+            n = approx_tokens(text)
+        with self._lock:
+            self._cache[text] = n
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return n
+
+    def count_messages(self, messages: Sequence[Dict]) -> int:
+        return sum(self.count(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
+
+
+_default_counter: Optional[TokenCounter] = None
+
+
+def default_counter() -> TokenCounter:
+    """进程级共享的计数器（第一次用到时才加载 tiktoken）"""
+    global _default_counter
+    if _default_counter is None:
+        _default_counter = TokenCounter()
+    return _default_counter
+
+
+def count_tokens(text: str) -> int:
+    return default_counter().count(text)
+
+
+def _prefix_sum(prefix: Sequence[int], n: int) -> int:
+    """累计 token 数里前 n 块的和"""
+    return prefix[n - 1] if n else 0
+
+
+class TokenBudgeter:
+    """按预算裁剪示例和历史"""
+
+    def __init__(self, input_budget: int = PROMPT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        self.input_budget = input_budget
+        self.counter = counter or default_counter()
+        # {examples_key: (示例块, 每块 token 数)}，固定示例每次都一样，拆一次就够
+        self._blocks: Dict[str, Tuple[List[str], List[int]]] = {}
+        # {system prompt: 去掉固定示例后的 token 数}，每轮都要用，求和也省掉
+        self._system_base: Dict[str, int] = {}
+        # {(examples_key, 保留块数): 裁剪后的示例文本}，超预算时每轮的裁剪结果都一样，不用每次重新 join
+        self._trimmed: Dict[Tuple[str, int], str] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.trimmed = 0
+        self.dropped_examples = 0
+        self.dropped_history = 0
+        self.over_budget = 0
+
+    def example_blocks(self, text: str, key: Optional[str] = None) -> Tuple[List[str], List[int]]:
+        """
+        拆示例块并计数，返回 (示例块, 前 i+1 块的累计 token 数)；key（examples_digest）相同的直接复用。
+        存累计值而不是每块的值：固定示例可能有上千块，plan() 每轮二分就够了，不用每次求和
+        """
+        if not text:
+            return [], []
+        if key is not None:
+            cached = self._blocks.get(key)
+            if cached is not None:
+                return cached
+        blocks = split_examples(text)
+        # 块之间的分隔符也算进每块的计数里
+        sep = self.counter.count("\n\n")
+        result = (blocks, list(accumulate(self.counter.count(b) + sep for b in blocks)))
+        if key is not None:
+            with self._lock:
+                if len(self._blocks) >= 64:
+                    self._blocks.clear()
+                self._blocks[key] = result
+        return result
+
+    def trimmed_examples(self, blocks: Sequence[str], keep: int, key: Optional[str] = None) -> str:
+        """前 keep 块示例拼回文本；key 相同的复用上次的结果（同一个 str 对象，下游查缓存也快）"""
+        if not key:
+            return join_examples(blocks[:keep])
+        text = self._trimmed.get((key, keep))
+        if text is None:
+            text = join_examples(blocks[:keep])
+            with self._lock:
+                if len(self._trimmed) >= 64:
+                    self._trimmed.clear()
+                self._trimmed[(key, keep)] = text
+        return text
+
+    def system_base(self, system_prompt: str, static_prefix: Sequence[int]) -> int:
+        """system prompt 里不可裁剪部分（去掉固定示例）的 token 数；同一个 prompt 只算一次"""
+        n = self._system_base.get(system_prompt)
+        if n is None:
+            n = self.counter.count(system_prompt) - _prefix_sum(static_prefix, len(static_prefix))
+            with self._lock:
+                if len(self._system_base) >= 64:
+                    self._system_base.clear()
+                self._system_base[system_prompt] = n
+        return n
+
+    def plan(
+        self,
+        base_tokens: int,
+        static_prefix: Sequence[int],
+        turn_prefix: Sequence[int],
+        history: Sequence[Dict],
+    ) -> Tuple[int, int, int]:
+        """
+        base_tokens: 不可裁剪部分（system prompt 去掉固定示例后的部分、摘要、当前输入、消息开销）
+        static_prefix / turn_prefix: 固定示例 / 本轮检索示例的累计 token 数（example_blocks 的第二项，
+            越靠前越重要）
+        返回 (保留几块固定示例, 保留几块检索示例, 历史从第几条开始保留)
+        """
+        n_static, n_turn, start = len(static_prefix), len(turn_prefix), 0
+        self.requests += 1
+        if self.input_budget <= 0:
+            return n_static, n_turn, start
+
+        history_tokens = [self.counter.count(m.get("content") or "") + MESSAGE_OVERHEAD for m in history]
+        static_total = _prefix_sum(static_prefix, n_static)
+        turn_total = _prefix_sum(turn_prefix, n_turn)
+        total = base_tokens + static_total + turn_total + sum(history_tokens)
+        if total <= self.input_budget:
+            return n_static, n_turn, start
+
+        self.trimmed += 1
+        # 1. 本轮检索示例（排在后面的相关度低，先丢），2. 固定示例：
+        # 从末尾丢到放得下为止 = 二分找累计值不超过剩余预算的最多块数
+        if n_turn:
+            total -= turn_total
+            keep = bisect_right(turn_prefix, self.input_budget - total)
+            self.dropped_examples += n_turn - keep
+            n_turn = keep
+            total += _prefix_sum(turn_prefix, keep)
+        if total > self.input_budget and n_static:
+            total -= static_total
+            keep = bisect_right(static_prefix, self.input_budget - total)
+            self.dropped_examples += n_static - keep
+            n_static = keep
+            total += _prefix_sum(static_prefix, keep)
+        # 3. 最早的历史，一问一答成对丢
+        while total > self.input_budget and start < len(history):
+            step = min(2, len(history) - start)
+            total -= sum(history_tokens[start:start + step])
+            start += step
+            self.dropped_history += step
+        if total > self.input_budget:
+            self.over_budget += 1
+        return n_static, n_turn, start
+
+    def stats(self) -> Dict:
+        return {
+            "tokenizer": self.counter.name,
+            "input_budget": self.input_budget,
+            "requests": self.requests,
+            "trimmed": self.trimmed,
+            "dropped_examples": self.dropped_examples,
+            "dropped_history": self.dropped_history,
+            "over_budget": self.over_budget,
+        }
@@ -0,0 +1,63 @@
+"""
+DeepSeek 前缀缓存命中统计。
+
+DeepSeek 的 usage 字段里带 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+命中缓存的 token 计费便宜得多、预填充也更快。call_deepseek 每次回复后调用
+record()，这里累计总量并保留最近 window 次的明细，/health 和基准脚本用
+stats() 看命中率（prompt 布局改动之后可以直接看出前缀有没有被打断）。
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+
+class PromptCacheStats:
+    """累计 + 滑动窗口的前缀缓存命中率（线程安全）"""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._recent: Deque[Tuple[int, int]] = deque(maxlen=window)
+        self.replies = 0
+        self.unreported = 0   # usage 里没有缓存字段（非 DeepSeek 的兼容接口）
+        self.hit_tokens = 0
+        self.miss_tokens = 0
+
+    def record(self, usage) -> None:
+        """usage: OpenAI SDK 返回的 response.usage，可能为 None"""
+        hit = getattr(usage, "prompt_cache_hit_tokens", None) if usage is not None else None
+        miss = getattr(usage, "prompt_cache_miss_tokens", None) if usage is not None else None
+        with self._lock:
+            self.replies += 1
+            if hit is None or miss is None:
+                self.unreported += 1
+                return
+            self.hit_tokens += hit
+            self.miss_tokens += miss
+            self._recent.append((hit, miss))
+
+    @staticmethod
+    def _rate(hit: int, miss: int) -> float:
+        total = hit + miss
+        return round(hit / total, 4) if total else 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            recent_hit = sum(h for h, _ in self._recent)
+            recent_miss = sum(m for _, m in self._recent)
+            return {
+                "replies": self.replies,
+                "unreported": self.unreported,
+                "hit_tokens": self.hit_tokens,
+                "miss_tokens": self.miss_tokens,
+                "hit_rate": self._rate(self.hit_tokens, self.miss_tokens),
+                "recent_hit_rate": self._rate(recent_hit, recent_miss),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._recent.clear()
+            self.replies = self.unreported = self.hit_tokens = self.miss_tokens = 0
+
+
+# 进程级单例，所有 bot 共用
+prompt_cache_stats = PromptCacheStats()
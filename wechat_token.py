@@ -0,0 +1,126 @@
+"""
+access_token 管理 — mp_bot 和 wecom_bot 共用。
+
+之前两个 bot 的 get_access_token() 直接改模块全局变量、没有锁，token 快过期时
+所有并发发送线程会同时去打 cgi-bin/token，被微信限流。AccessTokenManager：
+  - single-flight：同一时刻只有一个线程去刷新，其余线程等它的结果
+  - 后台续期：start_background() 在 expires_in 到期前 refresh_margin 秒主动刷新，
+    正常情况下发送路径永远拿到的是缓存里的有效 token
+  - 强制刷新：接口返回 40001/40014/42001（token 失效/过期）时调用 invalidate(旧 token)，
+    多个线程同时报错也只会刷新一次
+"""
+import sys
+import threading
+import time
+from typing import Callable, Tuple
+
+# token 无效 / 不合法 / 过期
+INVALID_TOKEN_ERRCODES = {40001, 40014, 42001}
+
+FetchFn = Callable[[], Tuple[str, int]]
+
+
+class AccessTokenManager:
+    """带单飞刷新和后台续期的 access_token 缓存（线程安全）"""
+
+    def __init__(
+        self,
+        fetch_fn: FetchFn,
+        name: str = "token",
+        refresh_margin: float = 300.0,
+        retry_interval: float = 30.0,
+    ):
+        """
+        fetch_fn: 请求一次 token 接口，返回 (access_token, expires_in)，失败抛异常
+        refresh_margin: 提前多少秒续期
+        """
+        self.fetch_fn = fetch_fn
+        self.name = name
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self._token = ""
+        self._expires_at = 0.0
+        self._stale_at = 0.0   # 过了这个时间 get() 就同步刷新（留 60s 余量）
+        self._renew_at = 0.0   # 过了这个时间后台线程主动续期
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def _valid(self, now: float) -> bool:
+        return bool(self._token) and now < self._stale_at
+
+    def get(self) -> str:
+        """返回有效 token；需要刷新时只有一个线程真正发请求"""
+        if self._valid(time.time()):
+            return self._token
+        with self._refresh_lock:
+            # 等锁期间别的线程可能已经刷新好了
+            if self._valid(time.time()):
+                return self._token
+            return self._refresh_locked()
+
+    def invalidate(self, stale_token: str) -> str:
+        """接口报 token 失效时调用；只有当前缓存仍是这个旧 token 才会真正刷新"""
+        with self._refresh_lock:
+            if self._token and self._token != stale_token:
+                return self._token
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> str:
+        try:
+            token, expires_in = self.fetch_fn()
+        except Exception as e:
+            self.failures += 1
+            print(f"[{self.name}] 获取 access_token 失败: {e}", file=sys.stderr, flush=True)
+            # 刷新失败时，旧 token 没真正过期就先继续用
+            return self._token if time.time() < self._expires_at else ""
+
+        now = time.time()
+        self._token = token
+        self._expires_at = now + expires_in
+        # 有效期很短时（测试环境），余量按比例缩小，避免一直处于「该刷新」状态
+        self._stale_at = self._expires_at - min(60.0, expires_in * 0.1)
+        self._renew_at = self._expires_at - min(self.refresh_margin, expires_in * 0.5)
+        self.refreshes += 1
+        print(f"[{self.name}] access_token 已刷新，有效期 {expires_in}s", flush=True)
+        self._wakeup.set()
+        return token
+
+    # ── 后台续期 ──
+
+    def start_background(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._renew_loop, name=f"{self.name}-renew", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def _renew_loop(self) -> None:
+        while not self._stop.is_set():
+            wait = self._renew_at - time.time() if self._token else 0
+            if wait > 0:
+                # 被别的路径刷新（invalidate）后会被唤醒，重新计算下次续期时间
+                self._wakeup.wait(timeout=wait)
+                self._wakeup.clear()
+                continue
+            with self._refresh_lock:
+                if self._renew_at <= time.time():
+                    self._refresh_locked()
+            if self._renew_at <= time.time():
+                # 刷新失败，过一会儿再试
+                self._stop.wait(self.retry_interval)
+
+    def stats(self) -> dict:
+        return {
+            "valid": self._valid(time.time()),
+            "expires_in": max(0, int(self._expires_at - time.time())),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+        }
@@ -19,13 +19,23 @@ import argparse
 import os
 import sys
 import threading
-import time
+from typing import Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, abort, make_response
 
 from bot_core import load_dotenv, QingqingBot
+from msg_dedup import SeenMsgCache, dedup_key
+from outbound import OutboundDispatcher
+from wechat_token import INVALID_TOKEN_ERRCODES, AccessTokenManager
 from wecom_crypto import WeComCrypto, parse_text_message
+from usage_stats import prompt_cache_stats
+from history_backend import HISTORY_DB, make_history_backend
+from llm_hedge import hedge_stats
+from llm_router import make_router
+from greeting_cache import make_greeting_cache
+from llm_resilience import resilience_stats
 
 # ─── 初始化 ────────────────────────────────────────────────────
 
@@ -36,63 +46,97 @@ CORP_SECRET = os.getenv("WECOM_CORP_SECRET", "")
 AGENT_ID = os.getenv("WECOM_AGENT_ID", "")
 TOKEN = os.getenv("WECOM_TOKEN", "")
 ENCODING_AES_KEY = os.getenv("WECOM_ENCODING_AES_KEY", "")
+# 企业微信 API 地址，测试时可以指向本地 stub
+WECOM_API_BASE = os.getenv("WECOM_API_BASE", "https://qyapi.weixin.qq.com").rstrip("/")
+
+# 应用消息全局发送速率（条/秒）和同一用户相邻两条的间隔（模拟打字）
+WECOM_SEND_RATE = float(os.getenv("WECOM_SEND_RATE", "20"))
+WECOM_LINE_INTERVAL = 0.5
+
+# 流式生成：每生成完一行就交给调度器发出去，不等整段回复（WECOM_STREAM_REPLY=0 关闭）
+WECOM_STREAM_REPLY = os.getenv("WECOM_STREAM_REPLY", "1") != "0"
 
 app = Flask(__name__)
 crypto: WeComCrypto = None
 bot: QingqingBot = None
+dispatcher: OutboundDispatcher = None
 
-# Access token 缓存
-_access_token = ""
-_token_expires_at = 0
+# 企业微信 API 共用一个 Session（连接池 + keep-alive）
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
 
+# 已处理过的 MsgId（拦截企业微信超时重推）
+_seen_msgs = SeenMsgCache(max_size=10000, ttl=300)
 
-# ─── 企业微信 API ──────────────────────────────────────────────
 
+# ─── 企业微信 API ──────────────────────────────────────────────
 
-def get_access_token() -> str:
-    """获取企业微信 access_token（带缓存）"""
-    global _access_token, _token_expires_at
-    now = time.time()
-    if _access_token and now < _token_expires_at - 60:
-        return _access_token
 
-    url = "https://qyapi.weixin.qq.com/cgi-bin/gettoken"
-    resp = requests.get(url, params={
+def _fetch_access_token() -> Tuple[str, int]:
+    """请求一次企业微信 gettoken 接口"""
+    url = f"{WECOM_API_BASE}/cgi-bin/gettoken"
+    resp = _http.get(url, params={
         "corpid": CORP_ID,
         "corpsecret": CORP_SECRET,
     }, timeout=10)
     data = resp.json()
+    if data.get("errcode", 0) != 0 or "access_token" not in data:
+        raise RuntimeError(data)
+    return data["access_token"], int(data.get("expires_in", 7200))
 
-    if data.get("errcode", 0) != 0:
-        print(f"[wecom] 获取 access_token 失败: {data}", file=sys.stderr)
-        return ""
 
-    _access_token = data["access_token"]
-    _token_expires_at = now + data.get("expires_in", 7200)
-    print(f"[wecom] access_token 已刷新，有效期 {data.get('expires_in', 7200)}s")
-    return _access_token
+# 单飞刷新 + 后台续期，见 wechat_token.py
+_token_manager = AccessTokenManager(_fetch_access_token, name="wecom")
 
 
-def send_text_message(user_id: str, content: str) -> dict:
-    """通过企业微信 API 主动发送文本消息"""
-    token = get_access_token()
-    if not token:
-        return {"errcode": -1, "errmsg": "no access_token"}
+def get_access_token() -> str:
+    """获取企业微信 access_token（带缓存）"""
+    return _token_manager.get()
 
-    url = f"https://qyapi.weixin.qq.com/cgi-bin/message/send?access_token={token}"
+
+def send_text_message(user_id: str, content: str) -> dict:
+    """通过企业微信 API 主动发送文本消息（token 失效时强制刷新后重试一次）"""
     payload = {
         "touser": user_id,
         "msgtype": "text",
         "agentid": int(AGENT_ID) if AGENT_ID else 0,
         "text": {"content": content},
     }
-    resp = requests.post(url, json=payload, timeout=10)
-    result = resp.json()
-    if result.get("errcode", 0) != 0:
-        print(f"[wecom] 发送消息失败: {result}", file=sys.stderr)
+    result = {"errcode": -1, "errmsg": "no access_token"}
+    for attempt in range(2):
+        token = get_access_token()
+        if not token:
+            return {"errcode": -1, "errmsg": "no access_token"}
+
+        url = f"{WECOM_API_BASE}/cgi-bin/message/send?access_token={token}"
+        resp = _http.post(url, json=payload, timeout=10)
+        result = resp.json()
+        errcode = result.get("errcode", 0)
+        if errcode in INVALID_TOKEN_ERRCODES and attempt == 0:
+            print(f"[wecom] access_token 失效 ({errcode})，刷新后重试", file=sys.stderr)
+            _token_manager.invalidate(token)
+            continue
+        if errcode != 0:
+            print(f"[wecom] 发送消息失败: {result}", file=sys.stderr)
+        break
     return result
 
 
+def _send_line(user_id: str, content: str) -> bool:
+    return send_text_message(user_id, content).get("errcode", -1) == 0
+
+
+def init_dispatcher() -> OutboundDispatcher:
+    """启动出站调度器：回复逐行排队发送，生成线程不再 sleep 等待"""
+    global dispatcher
+    if dispatcher is None:
+        dispatcher = OutboundDispatcher(
+            _send_line, interval=WECOM_LINE_INTERVAL,
+            rate_per_sec=WECOM_SEND_RATE, name="wecom-out",
+        )
+    return dispatcher
+
+
 # ─── Flask 路由 ────────────────────────────────────────────────
 
 
@@ -161,6 +205,11 @@ def receive_message():
         # 非文本消息，返回空响应（企业微信要求 5 秒内响应）
         return "success"
 
+    # 企业微信重推的同一条消息只处理一次
+    if _seen_msgs.check_and_add(dedup_key(msg)):
+        print(f"[wecom] 重复推送，跳过 MsgId={msg.get('msg_id', '')}")
+        return "success"
+
     # 特殊指令
     if content.strip().lower() in {"清除记录", "reset", "清空"}:
         bot.clear_history(from_user)
@@ -170,17 +219,21 @@ def receive_message():
     # 异步处理：先响应企业微信（避免 5 秒超时），再异步生成回复
     def async_reply():
         try:
-            reply = bot.reply(content, user_id=from_user)
-            # 模拟微信多条消息：每行单独发送
-            lines = [l.strip() for l in reply.split("\n") if l.strip()]
-            for i, line in enumerate(lines):
-                send_text_message(from_user, line)
-                if i < len(lines) - 1:
-                    time.sleep(0.5)  # 模拟打字间隔
+            # 模拟微信多条消息：每行单独发送，由调度器控制打字间隔
+            if WECOM_STREAM_REPLY:
+                lines = []
+                for line in bot.reply_stream(content, user_id=from_user):
+                    dispatcher.enqueue(from_user, [line])
+                    lines.append(line)
+                reply = "\n".join(lines)
+            else:
+                reply = bot.reply(content, user_id=from_user)
+                lines = [l.strip() for l in reply.split("\n") if l.strip()]
+                dispatcher.enqueue(from_user, lines)
             print(f"[wecom] 回复 {from_user}: {reply}")
         except Exception as e:
             print(f"[wecom] 生成回复失败: {e}", file=sys.stderr)
-            send_text_message(from_user, "emmm 我脑子卡了一下[捂脸]")
+            dispatcher.enqueue(from_user, ["emmm 我脑子卡了一下[捂脸]"])
 
     thread = threading.Thread(target=async_reply, daemon=True)
     thread.start()
@@ -191,7 +244,15 @@ def receive_message():
 @app.route("/health", methods=["GET"])
 def health_check():
     """健康检查接口"""
-    return {"status": "ok", "bot": "晴晴"}
+    return {
+        "status": "ok", "bot": "晴晴",
+        "dedup": _seen_msgs.stats(),
+        "outbound": dispatcher.stats() if dispatcher else None,
+        "token": _token_manager.stats(),
+        "prompt_cache": prompt_cache_stats.stats(),
+        "llm": {**resilience_stats(), "hedge": hedge_stats()},
+        "sessions": bot.session_stats() if bot else None,
+    }
 
 
 # ─── 启动 ──────────────────────────────────────────────────────
@@ -239,6 +300,14 @@ def main():
     )
     parser.add_argument("--chat-samples", default=None, help="聊天样本文件路径")
     parser.add_argument("--debug", action="store_true", help="Flask debug 模式")
+    parser.add_argument(
+        "--history-db", default=HISTORY_DB,
+        help="历史对话 SQLite 文件（重启不丢上下文），默认读 HISTORY_DB 环境变量，空则只放内存",
+    )
+    parser.add_argument(
+        "--backends", default=None,
+        help="推理后端，如 deepseek:3:64,qwen_lora:1:4（默认读 LLM_BACKENDS，空则只用 DeepSeek）",
+    )
     args = parser.parse_args()
 
     validate_config()
@@ -251,11 +320,16 @@ def main():
     bot = QingqingBot(
         config_path=args.config,
         chat_samples_path=args.chat_samples,
+        history_backend=make_history_backend(args.history_db),
+        router=make_router("qingqing", args.backends),
+        greeting_cache=make_greeting_cache(),
     )
     print(f"[wecom] 晴晴机器人初始化完成")
 
-    # 预热 access_token
+    # 预热 access_token 并开启后台续期，启动出站调度器
     get_access_token()
+    _token_manager.start_background()
+    init_dispatcher()
 
     print()
     print("=" * 50)